@@ -1,33 +1,42 @@
 """Provides the app package for the Social Insecurity application. The package contains the Flask app and all of the extensions and routes."""
 
+import os
 from pathlib import Path
 from typing import cast
 
 from flask import Flask, flash, redirect, url_for, make_response
+from markupsafe import Markup
 
+from app.assets import StaticAssets
+from app.cache import FragmentCache, TTLCache
+from app.compression import ResponseCompression
 from app.config import Config
-from app.database import SQLite3
+from app.database import SQLite3, user_changed
+from app.passwords import PasswordHasher
+from app.ratelimit import SQLiteStorage  # noqa: F401 - registers the 'sqlite' rate-limit storage scheme
+from app.images import ImageProcessor
+from app.uploads import UploadStore
 
 # Flask Extensions
 from flask_login import LoginManager, UserMixin, login_user
-from flask_bcrypt import Bcrypt
 from flask_wtf.csrf import CSRFProtect
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
 
-# Instantiate and configure the app
-app = Flask(__name__)
-bcrypt = Bcrypt(app)
+# Instantiate and configure the app, INSTANCE_PATH moves the database, uploads and logs elsewhere, e.g. for load tests
+app = Flask(__name__, instance_path=os.path.abspath(os.environ["INSTANCE_PATH"]) if os.environ.get("INSTANCE_PATH") else None)
 csfr = CSRFProtect(app)
 app.config.from_object(Config)
 login_manager = LoginManager()
 login_manager.init_app(app)
+# Count the rate limits in a database shared by all worker processes, see app/ratelimit.py
+if not app.config.get("RATELIMIT_STORAGE_URI"):
+    app.config["RATELIMIT_STORAGE_URI"] = f"sqlite:///{Path(app.instance_path) / app.config['RATELIMIT_STORAGE_PATH']}"
 limiter = Limiter(
     get_remote_address,
     app=app,
     default_limits=["500 per day", "100 per hour"],
-    storage_uri="memory://"
 )
 
 
@@ -43,11 +52,32 @@ class User(UserMixin):
         self.last_name = last_name
     @staticmethod
     def get(user_id):
-        """Returns a User object based on the user id."""
-        user = sqlite.query_userid(user_id)
-        if user is None:
+        """Returns a User object based on the user id, served from the user cache when possible."""
+        user = user_cache.get(str(user_id))
+        if user is not None:
+            return user
+        row = sqlite.query_userid(user_id)
+        if row is None:
             return None
-        return User(user['id'], user['username'], user['first_name'], user['last_name'])
+        user = User(row['id'], row['username'], row['first_name'], row['last_name'])
+        user_cache.set(str(user_id), user)
+        return user
+
+# Cache the users loaded on every authenticated request, entries are dropped when the user row changes
+user_cache = TTLCache(maxsize=app.config["USER_CACHE_SIZE"], ttl=app.config["USER_CACHE_TTL"])
+
+@user_changed.connect
+def invalidate_user(sender, user_id):
+    """Drops a user from the user cache when the user is inserted or their profile is updated."""
+    user_cache.invalidate(user_id)
+
+# Cache the rendered post and comment cards, keyed by everything that changes how they look
+fragment_cache = FragmentCache(max_bytes=app.config["FRAGMENT_CACHE_BYTES"])
+
+@app.template_global()
+def cached_fragment(key, render, *args):
+    """Returns the HTML of render(*args), a template macro, from the fragment cache."""
+    return Markup(fragment_cache.fetch(key, lambda: str(render(*args))))
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -62,11 +92,13 @@ def unauthorized():
 
 # Helper function for logging in
 def check_username_password(username: str, password: str) -> bool:
-    """Login helper function"""
+    """Login helper function. Rehashes the password when the configured bcrypt work factor has changed."""
     user = sqlite.query_username(username)
     if not user:
         return False
-    if username == user["username"] and bcrypt.check_password_hash(user["password"], password):
+    if username == user["username"] and hasher.check_password(user["password"], password):
+        if hasher.needs_rehash(user["password"]):
+            sqlite.update_password(user["id"], hasher.hash_password(password))
         return login_user(User(user["id"], user["username"], user["first_name"], user["last_name"]))
     return False
 
@@ -78,7 +110,19 @@ def allowed_file(filename):
 
 
 # Instantiate the sqlite database extension
-sqlite = SQLite3(app, schema="schema.sql")
+sqlite = SQLite3(app, migrations="migrations")
+
+# Hash passwords on a pool of worker processes, recording its metrics with the database statistics
+hasher = PasswordHasher(app, stats=sqlite.stats)
+
+# Store uploads under content-addressed names in the upload folder
+upload_store = UploadStore(app)
+
+# Serve fingerprinted, precompressed static files once built with 'flask build-assets'
+assets = StaticAssets(app)
+
+# Resize uploaded images in the background, see app/images.py
+image_processor = ImageProcessor(app, store=upload_store, database=sqlite, stats=sqlite.stats)
 
 # Create the instance and upload folder if they do not exist
 with app.app_context():
@@ -89,6 +133,9 @@ with app.app_context():
     if not upload_path.exists():
         upload_path.mkdir(parents=True, exist_ok=True)
 
+# Compress text responses, registered first so it runs after the other after_request hooks
+compression = ResponseCompression(app)
+
 # Add security headers
 @app.after_request
 def add_headers(resp):
@@ -104,5 +151,6 @@ def add_headers(resp):
     resp.headers['Server'] = ''
     return resp
 
-# Import the routes after the app is configured
+# Import the routes and commands after the app is configured
 from app import routes  # noqa: E402,F401
+from app import commands  # noqa: E402,F401
@@ -0,0 +1,213 @@
+"""Provides the ASGI mode of the Social Insecurity application.
+
+An event loop owns the client connections, so idle and slow clients cost no thread. A request
+only occupies one of ASGI_THREADS threads, running the Flask application unchanged, while it is handled.
+
+Example:
+    from flask import Flask
+    from app.asgi import ASGIAdapter
+
+    app = Flask(__name__)
+    application = ASGIAdapter(app, threads=8)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+from urllib.parse import unquote
+
+from app import app
+
+Scope = dict[str, Any]
+Receive = Callable[[], Awaitable[dict[str, Any]]]
+Send = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+class RequestTooLargeError(Exception):
+    """Raised when a request body is larger than the adapter's max_body."""
+
+
+class ASGIAdapter:
+    """Serves a WSGI application to an ASGI server, running each request on a bounded thread pool.
+
+    The request body is read on the event loop into a temporary file, which stays in memory up to
+    spool_size bytes, before a thread is taken. Response chunks are passed back to the event loop
+    as the application produces them, so streamed pages still arrive early.
+    """
+
+    def __init__(
+        self,
+        wsgi_app: Callable,
+        *,
+        threads: Optional[int] = None,
+        max_body: Optional[int] = None,
+        spool_size: int = 64 * 1024,
+    ) -> None:
+        """Initializes the adapter.
+
+        params:
+            wsgi_app: The WSGI application, e.g. the Flask application.
+            threads (optional): The number of threads running requests, defaults to ASGI_THREADS or SQLITE3_POOL_SIZE.
+            max_body (optional): Bytes per request body, defaults to MAX_CONTENT_LENGTH. Larger bodies get 413.
+            spool_size (optional): Bytes of a request body held in memory before it is written to disk.
+
+        """
+        config = getattr(wsgi_app, "config", {})
+        self.wsgi_app = wsgi_app
+        self.threads = threads or config.get("ASGI_THREADS") or config.get("SQLITE3_POOL_SIZE", 8)
+        if "SQLITE3_POOL_SIZE" in config:
+            # More threads than connections would only wait for a connection and time out
+            self.threads = min(self.threads, config["SQLITE3_POOL_SIZE"])
+        self.max_body = max_body if max_body is not None else config.get("MAX_CONTENT_LENGTH")
+        self.spool_size = spool_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise NotImplementedError(f"Unsupported ASGI scope type {scope['type']!r}")
+        with tempfile.SpooledTemporaryFile(max_size=self.spool_size) as body:
+            try:
+                if not await self._read_body(receive, body):
+                    # The client went away before it sent the whole request
+                    return
+            except RequestTooLargeError:
+                await send({"type": "http.response.start", "status": 413, "headers": [(b"content-length", b"0")]})
+                await send({"type": "http.response.body", "body": b""})
+                return
+            size = body.tell()
+            body.seek(0)
+            environ = self.environ(scope, body)
+            # The whole body has been read, also when the client sent it in chunks without a length
+            environ["CONTENT_LENGTH"] = str(size)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._ensure_started(), self._run, environ, send, loop)
+
+    def environ(self, scope: Scope, body: Any) -> dict[str, Any]:
+        """Builds the WSGI environ of an ASGI http scope, body is a file holding the request body."""
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        root_path = scope.get("root_path", "")
+        path = scope["path"]
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": root_path,
+            "PATH_INFO": unquote(path, errors="surrogateescape").encode("utf-8", "surrogateescape").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.input_terminated": True,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope.get("headers", []):
+            key = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                key = f"HTTP_{key}"
+            if key in environ:
+                # Cookies sent in several headers are joined like in one header, other headers are lists
+                value = f"{environ[key]}{'; ' if key == 'HTTP_COOKIE' else ','}{value}"
+            environ[key] = value
+        return environ
+
+    def close(self) -> None:
+        """Finishes the running requests and stops the threads."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and os.getpid() == self._pid:
+            executor.shutdown(wait=True)
+
+    async def _read_body(self, receive: Receive, body: io.IOBase) -> bool:
+        """Reads the request body into a file. Returns False if the client disconnected."""
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return False
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if self.max_body is not None and size > self.max_body:
+                raise RequestTooLargeError
+            body.write(chunk)
+            if not message.get("more_body", False):
+                return True
+
+    def _run(self, environ: dict[str, Any], send: Send, loop: asyncio.AbstractEventLoop) -> None:
+        """Runs the WSGI application on a pool thread, sending the response through the event loop."""
+
+        def send_sync(message: dict[str, Any]) -> None:
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        started: dict[str, Any] = {}
+
+        def start_response(status: str, headers: list[tuple[str, str]], exc_info: Any = None) -> Callable:
+            if exc_info is not None and started.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+            return lambda data: send_chunk(data)
+
+        def send_chunk(data: bytes) -> None:
+            if not started.get("sent"):
+                send_sync({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+                started["sent"] = True
+            if data:
+                send_sync({"type": "http.response.body", "body": data, "more_body": True})
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for data in result:
+                send_chunk(data)
+            send_chunk(b"")
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        send_sync({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        """Answers the server's startup and shutdown events, stopping the threads on shutdown."""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.get_running_loop().run_in_executor(None, self.close)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _ensure_started(self) -> ThreadPoolExecutor:
+        """Starts the threads, also in a forked process whose parent had started them."""
+        with self._lock:
+            if os.getpid() != self._pid:
+                self._pid = os.getpid()
+                self._executor = None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="asgi")
+            return self._executor
+
+
+
+#: The ASGI application of the Social Insecurity app, e.g. for 'uvicorn app.asgi:application'
+application = ASGIAdapter(app)
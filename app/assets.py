@@ -0,0 +1,131 @@
+"""Provides fingerprinted, precompressed static assets.
+
+'flask build-assets' copies the static files to static/dist under names containing a hash of
+their content, with compressed siblings of text files. Templates link them with asset_url.
+
+Example:
+    from flask import Flask
+    from app.assets import StaticAssets
+
+    app = Flask(__name__)
+    assets = StaticAssets(app)
+    assets.build()
+
+    # In a template
+    # <link rel="stylesheet" href="{{ asset_url('css/general.css') }}"/>
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import shutil
+from pathlib import Path
+from typing import Optional
+
+from flask import Flask, Response, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - Brotli is optional
+    brotli = None
+
+#: Suffixes of the files that are worth compressing
+COMPRESSIBLE = {".css", ".js", ".mjs", ".json", ".map", ".svg", ".txt", ".html", ".xml"}
+#: Content-Encoding and file suffix of the precompressed siblings, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class StaticAssets:
+    """Provides fingerprinting and precompression of the static folder for Flask."""
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        """Initializes the extension.
+
+        params:
+            app (optional): The Flask application to initialize the extension with.
+
+        """
+        self.manifest: dict[str, str] = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Initializes the extension with the Flask application, replacing its static view.
+
+        params:
+            app: The Flask application to initialize the extension with.
+
+        """
+        self.static_folder = Path(app.static_folder)
+        self.dist = app.config.setdefault("ASSETS_DIST_FOLDER", "dist")
+        self.max_age = app.config.setdefault("ASSETS_MAX_AGE", 365 * 24 * 3600)
+        self.gzip_level = app.config.setdefault("ASSETS_GZIP_LEVEL", 9)
+        self.brotli_quality = app.config.setdefault("ASSETS_BROTLI_QUALITY", 11)
+        self.load_manifest()
+        app.add_template_global(self.url, "asset_url")
+        app.view_functions["static"] = self.send
+        app.extensions["static_assets"] = self
+
+    @property
+    def dist_folder(self) -> Path:
+        """Returns the folder holding the built assets."""
+        return self.static_folder / self.dist
+
+    def load_manifest(self) -> None:
+        """Reads the manifest written by build, if the assets have been built."""
+        path = self.dist_folder / "manifest.json"
+        self.manifest = json.loads(path.read_text()) if path.exists() else {}
+
+    def build(self) -> dict[str, str]:
+        """Writes the fingerprinted and precompressed assets and the manifest. Returns the manifest.
+
+        Files of earlier builds are removed, so the dist folder only holds the current assets.
+        """
+        if self.dist_folder.exists():
+            shutil.rmtree(self.dist_folder)
+        manifest = {}
+        for path in sorted(self.static_folder.rglob("*")):
+            if not path.is_file() or path.name.startswith("."):
+                continue
+            name = path.relative_to(self.static_folder).as_posix()
+            content = path.read_bytes()
+            digest = hashlib.sha256(content).hexdigest()[:12]
+            fingerprinted = Path(name).with_name(f"{path.stem}.{digest}{path.suffix}").as_posix()
+            target = self.dist_folder / fingerprinted
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(content)
+            if path.suffix.lower() in COMPRESSIBLE:
+                Path(f"{target}.gz").write_bytes(gzip.compress(content, compresslevel=self.gzip_level, mtime=0))
+                if brotli is not None:
+                    Path(f"{target}.br").write_bytes(brotli.compress(content, quality=self.brotli_quality))
+            manifest[name] = fingerprinted
+        (self.dist_folder / "manifest.json").write_text(json.dumps(manifest, indent=2, sort_keys=True))
+        self.manifest = manifest
+        return manifest
+
+    def url(self, filename: str, **values) -> str:
+        """Returns the URL of a static file, the fingerprinted copy once the assets have been built."""
+        fingerprinted = self.manifest.get(filename)
+        if fingerprinted is not None:
+            filename = f"{self.dist}/{fingerprinted}"
+        return url_for("static", filename=filename, **values)
+
+    def send(self, filename: str) -> Response:
+        """Serves a static file, sending fingerprinted files precompressed and with immutable cache headers."""
+        prefix = f"{self.dist}/"
+        if not filename.startswith(prefix) or filename == f"{prefix}manifest.json":
+            return send_from_directory(self.static_folder, filename)
+        for encoding, suffix in ENCODINGS:
+            if request.accept_encodings[encoding] > 0 and (self.dist_folder / f"{filename[len(prefix):]}{suffix}").is_file():
+                mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                response = send_from_directory(self.static_folder, f"{filename}{suffix}", mimetype=mimetype)
+                response.headers["Content-Encoding"] = encoding
+                break
+        else:
+            response = send_from_directory(self.static_folder, filename)
+        response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = f"public, max-age={self.max_age}, immutable"
+        return response
@@ -0,0 +1,170 @@
+"""Provides in-process caches for the Social Insecurity application.
+
+TTLCache holds objects such as the logged in users, FragmentCache holds rendered HTML.
+The caches are local to one worker process and safe to use from multiple threads.
+
+Example:
+    from app.cache import TTLCache
+
+    cache = TTLCache(maxsize=1024, ttl=60)
+    cache.set("1", "value")
+    cache.get("1")
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """Provides a least recently used cache whose entries expire after a fixed time to live.
+
+    Example:
+        cache = TTLCache(maxsize=2, ttl=30)
+        cache.set("a", 1)
+        cache.get("a")  # 1
+        cache.invalidate("a")
+        cache.get("a")  # None
+        cache.stats()  # {"hits": 1, "misses": 1, ...}
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0) -> None:
+        """Initializes the cache.
+
+        params:
+            maxsize (optional): The maximum number of entries, the least recently used entry is evicted first.
+            ttl (optional): Seconds an entry stays valid after it was set.
+
+        """
+        if maxsize < 1:
+            raise ValueError("Cache maxsize must be at least 1")
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the cached value, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Caches a value, evicting the least recently used entry if the cache is full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Removes a value from the cache."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Removes all values from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        """Returns a snapshot of the cache metrics."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self._maxsize,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+            }
+
+
+class FragmentCache:
+    """Provides a least recently used cache of rendered HTML fragments, bounded by memory.
+
+    The key must change whenever the fragment would render differently, e.g. it contains
+    the post id and its comment count, so entries never have to be invalidated.
+
+    Example:
+        cache = FragmentCache(max_bytes=1024 * 1024)
+        html = cache.fetch(("post", 1, 0), lambda: render_post(post))
+        cache.stats()  # {"hits": 0, "misses": 1, "bytes": 412, ...}
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024) -> None:
+        """Initializes the cache.
+
+        params:
+            max_bytes (optional): The approximate memory the fragments may use, 0 disables the cache.
+
+        """
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, tuple[int, str]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def fetch(self, key: Hashable, render: Callable[[], str]) -> str:
+        """Returns the cached fragment, rendering and caching it first if it is missing."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+        # Render outside the lock, a fragment rendered twice at the same time is simply stored twice
+        fragment = render()
+        size = sys.getsizeof(fragment) + sys.getsizeof(key)
+        if size > self._max_bytes:
+            return fragment
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[0]
+            self._entries[key] = (size, fragment)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self._evictions += 1
+        return fragment
+
+    def clear(self) -> None:
+        """Removes all fragments from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        """Returns a snapshot of the cache metrics, bytes is the approximate memory used by the fragments."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+            }
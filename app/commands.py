@@ -0,0 +1,138 @@
+"""Provides the command line commands for the Social Insecurity application.
+
+The commands are registered on the Flask CLI and run with 'pdm run flask <command>'.
+It is imported by the app package.
+
+Example:
+    pdm run flask migrate
+"""
+
+import time
+
+import click
+
+from app import app, assets, hasher, sqlite
+from app.seed import seed_database
+
+
+@app.cli.command("migrate")
+def migrate():
+    """Applies pending database migrations."""
+    applied = sqlite.migrate()
+    click.echo(f"Applied {applied} migration(s).")
+
+
+@app.cli.command("reset-db")
+@click.confirmation_option(prompt="This deletes all data in the database. Continue?")
+def reset_db():
+    """Drops all tables and recreates the database from the migrations."""
+    sqlite.reset_database()
+    click.echo("Database reset.")
+
+
+@app.cli.command("repair-comment-counts")
+def repair_comment_counts():
+    """Recounts the comments of every post and repairs the denormalized counters."""
+    repaired = sqlite.repair_comment_counts()
+    click.echo(f"Repaired the comment count of {repaired} post(s).")
+
+
+@app.cli.command("rebuild-timelines")
+def rebuild_timelines():
+    """Regenerates the materialized stream timelines from scratch."""
+    rows = sqlite.rebuild_timelines()
+    click.echo(f"Rebuilt timelines with {rows} row(s).")
+
+
+@app.cli.command("build-assets")
+def build_assets():
+    """Writes fingerprinted and precompressed copies of the static files and their manifest."""
+    manifest = assets.build()
+    for name, fingerprinted in manifest.items():
+        click.echo(f"{name} -> {assets.dist}/{fingerprinted}")
+    click.echo(f"Built {len(manifest)} assets in {assets.dist_folder}.")
+
+
+@app.cli.command("serve")
+@click.option("--bind", default=None, help="Address to listen on, e.g. 0.0.0.0:8000  [default: SERVER_BIND]")
+@click.option("--workers", type=int, default=None, help="Number of worker processes  [default: SERVER_WORKERS]")
+@click.option("--threads", type=int, default=None, help="Number of threads per worker  [default: SERVER_THREADS]")
+@click.option("--timeout", type=int, default=None, help="Seconds before a stuck worker is restarted  [default: SERVER_TIMEOUT]")
+@click.option("--max-requests", type=int, default=None, help="Requests before a worker is recycled  [default: SERVER_MAX_REQUESTS]")
+@click.option("--asgi", is_flag=True, help="Serve the connections from an event loop with uvicorn workers.")
+def serve(bind, workers, threads, timeout, max_requests, asgi):
+    """Runs the production server with prefork worker processes. Send SIGHUP to restart the workers gracefully."""
+    from app.server import serve as serve_app
+
+    serve_app(app, asgi=asgi, bind=bind, workers=workers, threads=threads, timeout=timeout, max_requests=max_requests)
+
+
+@app.cli.command("db-stats")
+@click.option("--reset", is_flag=True, help="Delete the collected statistics after printing them.")
+def db_stats(reset: bool):
+    """Prints latency percentiles and row counts per database method, merged over all worker processes."""
+    summary = sqlite.collect_stats()
+    if not summary:
+        click.echo("No database statistics collected yet.")
+    else:
+        header = f"{'method':<26}{'calls':>9}{'total ms':>12}{'avg ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>10}{'avg rows':>10}"
+        click.echo(header)
+        click.echo("-" * len(header))
+        for name, method in summary.items():
+            click.echo(
+                f"{name:<26}{method['calls']:>9}{method['total_ms']:>12.1f}{method['avg_ms']:>9.2f}"
+                f"{method['p50_ms']:>9.2f}{method['p95_ms']:>9.2f}{method['p99_ms']:>9.2f}"
+                f"{method['max_ms']:>10.2f}{method['avg_rows']:>10.1f}"
+            )
+    if reset:
+        sqlite.stats.reset()
+        for path in sqlite.stats_folder.glob("*.json"):
+            path.unlink()
+
+
+@app.cli.command("seed")
+@click.option("--users", default=1000, show_default=True, help="Number of users to create.")
+@click.option("--friends", default=20, show_default=True, help="Average number of friends per user.")
+@click.option("--posts", default=10000, show_default=True, help="Number of posts to create.")
+@click.option("--comments", default=20000, show_default=True, help="Number of comments to create.")
+@click.option("--seed", default=0, show_default=True, help="Random seed, the same seed generates the same data.")
+@click.option("--days", default=365, show_default=True, help="Number of days the posts are spread over.")
+@click.option("--until", type=click.DateTime(), default=None, help="Time of the newest post  [default: today]")
+@click.option("--prefix", default="user", show_default=True, help="Prefix of the generated usernames.")
+@click.option(
+    "--reuse-hash/--hash-each",
+    default=True,
+    show_default=True,
+    help="Hash the password once for all users, or once per user with bcrypt.",
+)
+@click.option("--reset", is_flag=True, help="Delete all existing data first.")
+def seed(users, friends, posts, comments, seed, days, until, prefix, reuse_hash, reset):
+    """Generates a large synthetic social graph for performance testing.
+
+    Users get the password 'password', or 'password<id>' with --hash-each.
+    """
+    if reset:
+        sqlite.reset_database()
+
+    def progress(table: str, rows: int, seconds: float) -> None:
+        rate = rows / seconds if seconds else 0.0
+        click.echo(f"{table:<10}{rows:>12,} rows in {seconds:>8.2f} s ({rate:>12,.0f} rows/s)")
+
+    start = time.perf_counter()
+    results = seed_database(
+        sqlite,
+        users=users,
+        friends=friends,
+        posts=posts,
+        comments=comments,
+        seed=seed,
+        password_hash=hasher.hash_password,
+        reuse_hash=reuse_hash,
+        days=days,
+        until=until,
+        prefix=prefix,
+        progress=progress,
+    )
+    total_rows = sum(rows for rows, _ in results.values())
+    total_seconds = time.perf_counter() - start
+    click.echo(f"{'Total':<10}{total_rows:>12,} rows in {total_seconds:>8.2f} s ({total_rows / total_seconds:>12,.0f} rows/s)")
@@ -0,0 +1,121 @@
+"""Provides compression of responses negotiated with the Accept-Encoding header.
+
+The ResponseCompression extension compresses text responses with brotli or gzip. Streamed
+responses are flushed after every chunk, so the client still receives the start of the page early.
+
+Example:
+    from flask import Flask
+    from app.compression import ResponseCompression
+
+    app = Flask(__name__)
+    ResponseCompression(app)
+"""
+
+from __future__ import annotations
+
+import gzip
+import zlib
+from collections.abc import Iterable, Iterator
+from typing import Any, Optional
+
+from flask import Flask, Response, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - Brotli is optional
+    brotli = None
+
+DEFAULT_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/xml",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+}
+
+
+class ResponseCompression:
+    """Provides brotli and gzip compression of text responses for Flask."""
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        """Initializes the extension.
+
+        params:
+            app (optional): The Flask application to initialize the extension with.
+
+        """
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Initializes the extension with the Flask application.
+
+        params:
+            app: The Flask application to initialize the extension with.
+
+        """
+        self.algorithms = [
+            algorithm
+            for algorithm in app.config.setdefault("COMPRESS_ALGORITHMS", ("br", "gzip"))
+            if algorithm != "br" or brotli is not None
+        ]
+        self.level = app.config.setdefault("COMPRESS_LEVEL", 6)
+        self.brotli_quality = app.config.setdefault("COMPRESS_BROTLI_QUALITY", 4)
+        self.min_size = app.config.setdefault("COMPRESS_MIN_SIZE", 500)
+        self.mimetypes = set(app.config.setdefault("COMPRESS_MIMETYPES", DEFAULT_MIMETYPES))
+        app.after_request(self.compress)
+        app.extensions["response_compression"] = self
+
+    def compress(self, response: Response) -> Response:
+        """Compresses a response if the client accepts it and it is worth it."""
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in self.mimetypes
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = next((name for name in self.algorithms if request.accept_encodings[name] > 0), None)
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = self._compress_stream(encoding, response.response, response.iter_encoded())
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            if encoding == "br":
+                response.set_data(brotli.compress(data, quality=self.brotli_quality))
+            else:
+                response.set_data(gzip.compress(data, compresslevel=self.level))
+        response.headers["Content-Encoding"] = encoding
+        # The compressed body differs byte for byte, so a strong ETag would no longer be correct
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _compress_stream(self, encoding: str, original: Iterable, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """Compresses the chunks of a streamed response, flushing after each chunk."""
+        if encoding == "br":
+            compressor: Any = brotli.Compressor(quality=self.brotli_quality)
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        try:
+            for chunk in chunks:
+                if encoding == "br":
+                    data = compressor.process(chunk) + compressor.flush()
+                else:
+                    data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            yield compressor.finish() if encoding == "br" else compressor.flush()
+        finally:
+            if hasattr(original, "close"):
+                original.close()
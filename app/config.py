@@ -18,7 +18,91 @@ from dotenv import load_dotenv
 load_dotenv('.env.local')
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY")
-    SQLITE3_DATABASE_PATH = "sqlite3.db"  # Path relative to the Flask instance folder
+    SQLITE3_DATABASE_PATH = os.environ.get("SQLITE3_DATABASE_PATH", "sqlite3.db")  # Path relative to the Flask instance folder
     UPLOADS_FOLDER_PATH = "uploads"  # Path relative to the Flask instance folder
+    UPLOAD_MAX_SIZE = 8 * 1024 * 1024  # Bytes per uploaded image, larger images are rejected while they are stored
+    UPLOAD_CHUNK_SIZE = 64 * 1024  # Bytes copied at a time when storing an upload
+    MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # Bytes per request, larger requests are rejected before they are read
+    UPLOADS_MAX_AGE = 365 * 24 * 3600  # Seconds browsers may cache a content-addressed upload without asking again
+    # None serves uploads from Python, 'x-accel-redirect' lets nginx send them from the internal
+    # location UPLOADS_ACCEL_PREFIX and 'x-sendfile' lets Apache or lighttpd send them.
+    UPLOADS_SENDFILE = None
+    UPLOADS_ACCEL_PREFIX = "/internal-uploads"
+    COMPRESS_ALGORITHMS = ("br", "gzip")  # Response encodings in order of preference, brotli is skipped when Brotli is not installed
+    COMPRESS_LEVEL = 6  # gzip compression level of responses, 1 to 9
+    COMPRESS_BROTLI_QUALITY = 4  # brotli compression quality of responses, 0 to 11
+    COMPRESS_MIN_SIZE = 500  # Bytes below which responses are sent uncompressed
+    ASSETS_MAX_AGE = 365 * 24 * 3600  # Seconds browsers may cache a fingerprinted static file, see 'flask build-assets'
+    ASSETS_GZIP_LEVEL = 9  # Compression level of the prebuilt gzip files, 1 to 9
+    ASSETS_BROTLI_QUALITY = 11  # Compression quality of the prebuilt brotli files, 0 to 11
+    IMAGE_VARIANT_WIDTHS = (320, 640, 1280)  # Widths in pixels of the resized copies of uploaded images
+    IMAGE_VARIANT_FORMAT = "WEBP"  # Pillow format of the resized copies
+    IMAGE_VARIANT_QUALITY = 80  # Compression quality of the resized copies, 1 to 100
+    IMAGE_WORKERS = 2  # Number of threads resizing images, 0 resizes on the request thread
     ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png'} # Allowed file extensions for uploads
-    SESSION_COOKIE_SAMESITE = 'Strict' # Prevents CSRF attacks
\ No newline at end of file
+    SESSION_COOKIE_SAMESITE = 'Strict' # Prevents CSRF attacks
+    RATELIMIT_ENABLED = os.environ.get("RATELIMIT_ENABLED", "1") != "0"  # Set to 0 to disable rate limiting for load tests
+    # The rate-limit counters are shared by all worker processes through this SQLite database, see app/ratelimit.py.
+    # RATELIMIT_STORAGE_URI replaces it with another storage, e.g. 'redis://localhost:6379' or 'memory://'.
+    RATELIMIT_STORAGE_PATH = "ratelimit.db"  # Path relative to the Flask instance folder
+    RATELIMIT_STORAGE_URI = os.environ.get("RATELIMIT_STORAGE_URI")
+    RATELIMIT_STORAGE_OPTIONS = {
+        "sweep_interval": 60,  # Seconds between removals of expired counters per process
+        "max_keys": 100_000,  # Maximum number of counters, those expiring soonest are removed first
+    }
+    USER_CACHE_SIZE = 4096  # Number of logged in users cached per process
+    USER_CACHE_TTL = 60  # Seconds before a cached user is loaded from the database again
+    FRAGMENT_CACHE_BYTES = 16 * 1024 * 1024  # Memory for rendered post and comment cards per process, 0 disables the cache
+    STREAM_PAGE_SIZE = 20  # Number of posts per page of the stream
+    TEMPLATE_STREAM_BUFFER = 16  # Number of template chunks collected before they are sent on streamed pages, after the navbar is sent
+    # 'write' keeps a materialized timeline per user up to date on every post and friendship,
+    # 'read' computes the stream from Posts and Friends on every view.
+    # Run 'flask rebuild-timelines' after switching from 'read' to 'write'.
+    FEED_STRATEGY = "write"
+    TIMELINE_BACKFILL_LIMIT = 200  # Posts copied into each timeline when a new friendship is added
+    FRIEND_GRAPH_MAX_EDGES = 1_000_000  # Friend ids held in memory per process, the least recently used users are evicted beyond it
+
+    # Production server, see 'flask serve' and app/server.py
+    SERVER_BIND = os.environ.get("SERVER_BIND", "127.0.0.1:8000")  # Address to listen on, put a reverse proxy in front
+    SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", 2 * (os.cpu_count() or 1)))  # Worker processes, see README for guidance
+    SERVER_THREADS = int(os.environ.get("SERVER_THREADS", 2))  # Threads per worker, covering the time spent waiting on SQLite
+    SERVER_TIMEOUT = 30  # Seconds a worker may be silent before the master restarts it
+    SERVER_GRACEFUL_TIMEOUT = 30  # Seconds a worker may finish its requests after SIGHUP or SIGTERM
+    SERVER_KEEPALIVE = 5  # Seconds an idle keep-alive connection is kept open
+    SERVER_MAX_REQUESTS = 10000  # Requests after which a worker is replaced, 0 never replaces it
+    SERVER_MAX_REQUESTS_JITTER = 1000  # Random extra requests, so the workers are not all replaced at once
+    SERVER_BACKLOG = 2048  # Connections waiting to be accepted
+    SERVER_ASGI_WORKER_CLASS = "uvicorn.workers.UvicornWorker"  # Gunicorn worker of 'flask serve --asgi'
+    # Threads per process running requests in ASGI mode, None uses SQLITE3_POOL_SIZE and larger values are capped at it.
+    # A request holds its thread, and its database connection, until the client has read the response.
+    ASGI_THREADS = None
+
+    # Password hashing, see app/passwords.py
+    BCRYPT_LOG_ROUNDS = 12  # bcrypt work factor, existing hashes are upgraded on the next login when it changes
+    BCRYPT_WORKERS = 2  # Number of processes hashing passwords, 0 hashes on the request thread
+    BCRYPT_MAX_QUEUE = 32  # Hashing calls waiting for a worker before new ones are answered with 503
+    BCRYPT_TIMEOUT = 10.0  # Seconds to wait for a hashing result
+
+    # SQLite3 connection pool
+    SQLITE3_POOL_SIZE = 8  # Maximum number of open connections per process
+    SQLITE3_POOL_TIMEOUT = 5.0  # Seconds to wait for a free connection
+    SQLITE3_POOL_PRE_PING = True  # Check that a pooled connection is usable on checkout
+    SQLITE3_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,  # Negative values are in KiB
+        "mmap_size": 134217728,
+        "busy_timeout": 5000,  # Milliseconds
+        "temp_store": "MEMORY",
+    }
+
+    # Group commit: a single writer thread batches concurrent writes into one transaction
+    SQLITE3_GROUP_COMMIT = False
+    SQLITE3_GROUP_COMMIT_MAX_BATCH = 64  # Maximum number of writes per transaction
+    SQLITE3_GROUP_COMMIT_DELAY = 0.002  # Seconds to wait for more writes before committing a batch
+
+    # SQLite3 query instrumentation, see 'flask db-stats'
+    SQLITE3_SLOW_QUERY_MS = 100  # Database calls slower than this are written to the slow query log
+    SQLITE3_SLOW_QUERY_LOG = "slow_queries.log"  # Path relative to the Flask instance folder
+    SQLITE3_STATS_FOLDER = "db-stats"  # Path relative to the Flask instance folder
+    SQLITE3_STATS_DUMP_INTERVAL = 60  # Seconds between statistics dumps per process, None disables dumping
@@ -12,12 +12,603 @@ Example:
 
 from __future__ import annotations
 
+import atexit
+import functools
+import json
+import logging
+import math
+import os
+import queue
 import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import Future
 from os import PathLike
 from pathlib import Path
-from typing import Any, Optional, cast
+from typing import Any, Callable, Optional, TypeVar, cast
 
-from flask import Flask, current_app, g
+from blinker import Namespace
+from flask import Flask, g, has_app_context
+
+from app.graph import FriendGraph
+
+slow_query_logger = logging.getLogger("app.database.slow_queries")
+
+_signals = Namespace()
+
+#: Sent with the keyword argument user_id when a user row is inserted or updated.
+user_changed = _signals.signal("sqlite3-user-changed")
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,
+    "mmap_size": 134217728,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def memoized(method: F) -> F:
+    """Answers repeated identical calls of a read method from the identity map of the current app context."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not has_app_context():
+            return method(self, *args, **kwargs)
+        identity_map = g.setdefault("flask_sqlite3_identity_map", {})
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        try:
+            return identity_map[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable arguments cannot be memoized
+            return method(self, *args, **kwargs)
+        result = identity_map[key] = method(self, *args, **kwargs)
+        return result
+
+    return cast(F, wrapper)
+
+
+def invalidates(method: F) -> F:
+    """Clears the identity map of the current app context after a write method has run."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            if has_app_context():
+                g.pop("flask_sqlite3_identity_map", None)
+
+    return cast(F, wrapper)
+
+
+def instrumented(method: F) -> F:
+    """Records the latency and returned rows of a database method and logs it if it is slow."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        conn = self.connection
+        outermost = isinstance(conn, TracingConnection) and conn.trace is None
+        if outermost:
+            conn.trace = []
+        start = time.perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            statements = conn.trace if outermost else None
+            if outermost:
+                conn.trace = None
+        self.stats.record(method.__name__, elapsed, _count_rows(result))
+        if statements is not None and elapsed * 1000 >= self._slow_query_ms:
+            self.slow_query_logger.warning(
+                "Slow query %s took %.1f ms: %s",
+                method.__name__,
+                elapsed * 1000,
+                "; ".join(f"{' '.join(sql.split())} {_redact(params)}" for sql, params in statements),
+            )
+        return result
+
+    return cast(F, wrapper)
+
+
+def _process_alive(pid: int) -> bool:
+    """Returns whether a process with the given pid is running."""
+    if os.name == "nt":
+        # os.kill terminates the process on Windows, assume it is running
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists but belongs to another user
+        return True
+    return True
+
+
+def _count_rows(result: Any) -> int:
+    """Returns the number of rows a database method returned or affected."""
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    if isinstance(result, bool):
+        return int(result)
+    if isinstance(result, int):
+        return result
+    return 0 if result is None else 1
+
+
+def _redact(params: Any) -> str:
+    """Replaces query parameters with their type names so no user data ends up in the logs."""
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: <{type(value).__name__}>" for key, value in params.items()) + "}"
+    return "(" + ", ".join(f"<{type(value).__name__}>" for value in params) + ")"
+
+
+def encode_cursor(row: sqlite3.Row) -> str:
+    """Returns the pagination cursor pointing past the given post row."""
+    return f"{row['creation_time']}_{row['id']}"
+
+
+def decode_cursor(value: Optional[str]) -> Optional[tuple[str, int]]:
+    """Parses a pagination cursor created by encode_cursor. Returns None if it is missing or malformed."""
+    if not value:
+        return None
+    creation_time, _, post_id = value.rpartition("_")
+    if not creation_time or not post_id.isdigit():
+        return None
+    return creation_time, int(post_id)
+
+
+def _split_statements(script: str) -> list[str]:
+    """Splits an SQL script into complete statements, keeping trigger bodies intact."""
+    statements = []
+    buffer = ""
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ""
+    leftover = [line for line in buffer.splitlines() if line.strip() and not line.strip().startswith("--")]
+    if leftover:
+        raise ValueError(f"Incomplete SQL statement in migration: {buffer.strip()}")
+    return statements
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no pooled connection becomes available within the pool timeout."""
+
+
+class ConnectionPool:
+    """Provides a bounded pool of long-lived SQLite3 connections.
+
+    Connections are opened lazily, configured with the supplied pragmas once and then
+    reused across app contexts instead of being opened and closed for every request.
+
+    Example:
+        pool = ConnectionPool("instance/sqlite3.db", size=4)
+        conn = pool.acquire()
+        try:
+            conn.execute("SELECT 1;")
+        finally:
+            pool.release(conn)
+    """
+
+    def __init__(
+        self,
+        path: PathLike | str,
+        *,
+        size: int = 8,
+        timeout: float = 5.0,
+        pragmas: Optional[dict[str, Any]] = None,
+        pre_ping: bool = True,
+        on_dispose: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """Initializes the pool.
+
+        params:
+            path: The path to the database file.
+            size (optional): The maximum number of open connections.
+            timeout (optional): Seconds to wait for a free connection before giving up.
+            pragmas (optional): Pragmas applied to every new connection.
+            pre_ping (optional): Whether to check that a connection is usable on checkout.
+            on_dispose (optional): Called after dispose, e.g. to drop what was cached from the database file.
+
+        """
+        if size < 1:
+            raise ValueError("Connection pool size must be at least 1")
+        self._path = path
+        self._size = size
+        self._timeout = timeout
+        self._pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self._pre_ping = pre_ping
+        self._on_dispose = on_dispose
+        self._cond = threading.Condition()
+        self._idle: list[sqlite3.Connection] = []
+        self._opened = 0
+        self._in_use = 0
+        self._pid = os.getpid()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def acquire(self) -> sqlite3.Connection:
+        """Checks out a connection, opening a new one if the pool is not full yet."""
+        start = time.perf_counter()
+        deadline = start + self._timeout
+        with self._cond:
+            self._check_pid()
+            while not self._idle and self._opened >= self._size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(f"No database connection available after {self._timeout} seconds")
+                self._cond.wait(remaining)
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._opened += 1
+            self._in_use += 1
+            self._checkouts += 1
+            waited = time.perf_counter() - start
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+        try:
+            if conn is not None and self._pre_ping and not self._ping(conn):
+                self._discard(conn)
+                with self._cond:
+                    self._opened += 1
+                conn = None
+            if conn is None:
+                conn = self.connect()
+        except BaseException:
+            with self._cond:
+                self._opened -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Returns a connection to the pool, rolling back any transaction left open."""
+        with self._cond:
+            if os.getpid() != self._pid:
+                return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def dispose(self) -> None:
+        """Closes all idle connections, e.g. before forking worker processes or replacing the database file."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+        for conn in idle:
+            conn.close()
+        if self._on_dispose is not None:
+            self._on_dispose()
+
+    def stats(self) -> dict[str, Any]:
+        """Returns a snapshot of the pool metrics."""
+        with self._cond:
+            return {
+                "size": self._size,
+                "open": self._opened,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "wait_time_total": self._wait_total,
+                "wait_time_max": self._wait_max,
+                "wait_time_avg": self._wait_total / self._checkouts if self._checkouts else 0.0,
+            }
+
+    def connect(self) -> sqlite3.Connection:
+        """Opens and configures a new connection. The pool uses it to fill up, it can also be used directly."""
+        conn = sqlite3.connect(self._path, check_same_thread=False, factory=TracingConnection)
+        conn.row_factory = sqlite3.Row
+        for name, value in self._pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value};")
+        return conn
+
+    def _ping(self, conn: sqlite3.Connection) -> bool:
+        """Checks that a connection is still usable."""
+        try:
+            conn.execute("SELECT 1;").fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        """Closes a broken connection and removes it from the pool."""
+        with self._cond:
+            self._opened -= 1
+            self._discarded += 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _check_pid(self) -> None:
+        """Forgets connections inherited from a parent process, they must not be used after a fork."""
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._idle = []
+            self._opened = 0
+            self._in_use = 0
+
+
+class TracingConnection(sqlite3.Connection):
+    """Provides a connection that records the statements it executes while tracing is enabled."""
+
+    trace: Optional[list[tuple[str, Any]]] = None
+
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        if self.trace is not None:
+            self.trace.append((sql, parameters))
+        return super().execute(sql, parameters)
+
+
+class QueryStats:
+    """Provides latency histograms, call counts and row counts per database method.
+
+    Latencies are counted in fixed buckets, so snapshots from several worker processes
+    can be merged by adding them up. Percentiles are estimated as the upper bound of the
+    bucket that contains them.
+
+    Example:
+        stats = QueryStats()
+        stats.record("query_posts", 0.002, rows=20)
+        stats.summary()["query_posts"]["p95_ms"]  # 2.5
+    """
+
+    #: Upper bounds of the latency buckets in milliseconds, the last bucket is unbounded
+    BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, math.inf)
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._methods: dict[str, dict[str, Any]] = {}
+
+    def record(self, name: str, seconds: float, rows: int = 0) -> None:
+        """Records one call of a database method."""
+        elapsed_ms = seconds * 1000
+        bucket = next(i for i, bound in enumerate(self.BUCKETS_MS) if elapsed_ms <= bound)
+        with self._lock:
+            method = self._methods.get(name)
+            if method is None:
+                method = self._methods[name] = {
+                    "calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "buckets": [0] * len(self.BUCKETS_MS)
+                }
+            method["calls"] += 1
+            method["total_ms"] += elapsed_ms
+            method["max_ms"] = max(method["max_ms"], elapsed_ms)
+            method["rows"] += rows
+            method["buckets"][bucket] += 1
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """Returns a copy of the raw counters, suitable for dumping and merging."""
+        with self._lock:
+            return {name: {**method, "buckets": list(method["buckets"])} for name, method in self._methods.items()}
+
+    def reset(self) -> None:
+        """Discards all recorded calls."""
+        with self._lock:
+            self._methods.clear()
+
+    def dump(self, path: PathLike | str) -> None:
+        """Writes a snapshot to a JSON file, atomically replacing any earlier snapshot."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp, path)
+
+    @classmethod
+    def merge(cls, snapshots: list[dict[str, dict[str, Any]]]) -> dict[str, dict[str, Any]]:
+        """Adds up several snapshots, e.g. from different worker processes."""
+        merged: dict[str, dict[str, Any]] = {}
+        for snapshot in snapshots:
+            for name, method in snapshot.items():
+                total = merged.get(name)
+                if total is None:
+                    merged[name] = {**method, "buckets": list(method["buckets"])}
+                    continue
+                total["calls"] += method["calls"]
+                total["total_ms"] += method["total_ms"]
+                total["max_ms"] = max(total["max_ms"], method["max_ms"])
+                total["rows"] += method["rows"]
+                total["buckets"] = [a + b for a, b in zip(total["buckets"], method["buckets"])]
+        return merged
+
+    @classmethod
+    def summarize(cls, snapshot: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+        """Computes averages and percentile estimates from a snapshot."""
+        summary = {}
+        for name, method in sorted(snapshot.items(), key=lambda item: -item[1]["total_ms"]):
+            calls = method["calls"]
+            summary[name] = {
+                "calls": calls,
+                "total_ms": method["total_ms"],
+                "avg_ms": method["total_ms"] / calls if calls else 0.0,
+                "p50_ms": cls._percentile(method, 0.50),
+                "p95_ms": cls._percentile(method, 0.95),
+                "p99_ms": cls._percentile(method, 0.99),
+                "max_ms": method["max_ms"],
+                "rows": method["rows"],
+                "avg_rows": method["rows"] / calls if calls else 0.0,
+            }
+        return summary
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """Returns the averages and percentile estimates of this process, ordered by total time."""
+        return self.summarize(self.snapshot())
+
+    @classmethod
+    def _percentile(cls, method: dict[str, Any], quantile: float) -> float:
+        """Estimates a percentile as the upper bound of its bucket, capped at the slowest call."""
+        rank = quantile * method["calls"]
+        seen = 0
+        for bound, count in zip(cls.BUCKETS_MS, method["buckets"]):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, method["max_ms"])
+        return method["max_ms"]
+
+
+class GroupCommitWriter:
+    """Provides a single writer thread that commits pending writes in batches.
+
+    Every write is a function that receives the writer's connection. Writes that arrive
+    within max_delay seconds of each other share one transaction, and so one fsync, up to
+    max_batch writes. Each write runs in its own savepoint, so a failing write is rolled
+    back without affecting the rest of its batch. submit() blocks until the batch holding
+    the write has been committed, so callers can read their own writes right after.
+
+    Example:
+        writer = GroupCommitWriter(pool.connect)
+        post_id = writer.submit(lambda conn: conn.execute("INSERT INTO ...", params).lastrowid)
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], sqlite3.Connection],
+        *,
+        max_batch: int = 64,
+        max_delay: float = 0.002,
+    ) -> None:
+        """Initializes the writer. The thread and its connection are started on the first write.
+
+        params:
+            connect: A function that opens a new connection to the database.
+            max_batch (optional): The maximum number of writes committed in one transaction.
+            max_delay (optional): Seconds to wait for more writes after the first write of a batch.
+
+        """
+        self._connect = connect
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._queue: queue.SimpleQueue[Optional[tuple[Callable[[sqlite3.Connection], Any], Future, float]]] = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        self.stats = QueryStats()
+
+    def submit(self, write: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Queues a write and waits until it is committed. Returns the result of the write function."""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((write, future, time.perf_counter()))
+        return future.result()
+
+    def close(self) -> None:
+        """Commits the pending writes and stops the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and os.getpid() == self._pid:
+            self._queue.put(None)
+            thread.join()
+
+    def summary(self) -> dict[str, Any]:
+        """Returns the batch size and latency metrics of the writer.
+
+        'commit' covers the transaction of each batch and its rows are the batch sizes,
+        'queue_wait' is the time a write waited before its batch started.
+        """
+        summary = self.stats.summary()
+        commit = summary.get("commit", {"calls": 0, "avg_rows": 0.0})
+        return {
+            "batches": commit["calls"],
+            "writes": summary.get("queue_wait", {"calls": 0})["calls"],
+            "avg_batch_size": commit["avg_rows"],
+            "commit": summary.get("commit"),
+            "queue_wait": summary.get("queue_wait"),
+        }
+
+    def _ensure_started(self) -> None:
+        """Starts the writer thread, also in a forked worker process whose parent had started one."""
+        with self._lock:
+            if os.getpid() != self._pid:
+                self._pid = os.getpid()
+                self._queue = queue.SimpleQueue()
+                self._thread = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sqlite3-group-commit", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        """Collects writes into batches and commits them until closed."""
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            stopping = False
+            while not stopping:
+                job = self._queue.get()
+                if job is None:
+                    break
+                batch = [job]
+                deadline = time.perf_counter() + self._max_delay
+                while len(batch) < self._max_batch:
+                    remaining = deadline - time.perf_counter()
+                    try:
+                        job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stopping = True
+                        break
+                    batch.append(job)
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: list[tuple[Callable[[sqlite3.Connection], Any], Future, float]]) -> None:
+        """Runs a batch of writes in one transaction and resolves their futures once it is committed."""
+        start = time.perf_counter()
+        results: list[tuple[Future, Any, Optional[BaseException]]] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE;")
+            for write, future, queued in batch:
+                self.stats.record("queue_wait", start - queued)
+                conn.execute("SAVEPOINT write;")
+                try:
+                    results.append((future, write(conn), None))
+                except Exception as error:
+                    conn.execute("ROLLBACK TO write;")
+                    results.append((future, None, error))
+                conn.execute("RELEASE write;")
+            conn.execute("COMMIT;")
+        except Exception as error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK;")
+            for _, future, _ in batch:
+                future.set_exception(error)
+            return
+        self.stats.record("commit", time.perf_counter() - start, rows=len(batch))
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
 
 
 class SQLite3:
@@ -26,6 +617,10 @@ class SQLite3:
     This class provides a simple interface to the SQLite3 database.
     It also initializes the database if it does not exist yet.
 
+    Results of the query_* and check_* methods are kept in an identity map for the
+    lifetime of the app context, so repeated identical reads within one request only
+    hit the database once. The insert_* and update_* methods clear the identity map.
+
     Example:
         from flask import Flask
         from app.database import SQLite3
@@ -44,32 +639,32 @@ class SQLite3:
         app: Optional[Flask] = None,
         *,
         path: Optional[PathLike | str] = None,
-        schema: Optional[PathLike | str] = None,
+        migrations: Optional[PathLike | str] = None,
     ) -> None:
         """Initializes the extension.
 
         params:
             app: The Flask application to initialize the extension with.
             path (optional): The path to the database file. Is relative to the instance folder.
-            schema (optional): The path to the schema file. Is relative to the application root folder.
+            migrations (optional): The path to the migrations folder. Is relative to the application root folder.
 
         """
         if app is not None:
-            self.init_app(app, path=path, schema=schema)
+            self.init_app(app, path=path, migrations=migrations)
 
     def init_app(
         self,
         app: Flask,
         *,
         path: Optional[PathLike | str] = None,
-        schema: Optional[PathLike | str] = None,
+        migrations: Optional[PathLike | str] = None,
     ) -> None:
         """Initializes the extension.
 
         params:
             app: The Flask application to initialize the extension with.
             path (optional): The path to the database file. Is relative to the instance folder.
-            schema (optional): The path to the schema file. Is relative to the application root folder.
+            migrations (optional): The path to the migrations folder. Is relative to the application root folder.
 
         """
         if not hasattr(app, "extensions"):
@@ -93,32 +688,102 @@ class SQLite3:
         if not self._path.exists():
             self._path.parent.mkdir(parents=True, exist_ok=True)
 
-        if schema:
-            with app.app_context():
-                self._init_database(schema)
+        self.pool = ConnectionPool(
+            self._path,
+            size=app.config.get("SQLITE3_POOL_SIZE", 8),
+            timeout=app.config.get("SQLITE3_POOL_TIMEOUT", 5.0),
+            pragmas=app.config.get("SQLITE3_PRAGMAS"),
+            pre_ping=app.config.get("SQLITE3_POOL_PRE_PING", True),
+            # The database file may be replaced once its connections are closed
+            on_dispose=self.reset_friend_graph,
+        )
+
+        self._feed_strategy = app.config.get("FEED_STRATEGY", "write")
+        if self._feed_strategy not in ("read", "write"):
+            raise ValueError(f"Unknown FEED_STRATEGY {self._feed_strategy!r}, expected 'read' or 'write'")
+        self._timeline_backfill = app.config.get("TIMELINE_BACKFILL_LIMIT", 200)
+        self._friend_graph = FriendGraph(self._load_friends, max_edges=app.config.get("FRIEND_GRAPH_MAX_EDGES", 1_000_000))
+        self._friend_graph_lock = threading.Lock()
+        self._friend_graph_epoch: Optional[int] = None
+        self._friend_graph_rowid: Optional[int] = None
+
+        self.stats = QueryStats()
+        self._slow_query_ms = app.config.get("SQLITE3_SLOW_QUERY_MS", 100)
+        # A logger per database file, so the slow queries of one database are not written to the log of another
+        self.slow_query_logger = slow_query_logger.getChild(self._path.as_posix().replace(".", "_"))
+        if app.config.get("SQLITE3_SLOW_QUERY_LOG"):
+            log_path = os.path.abspath(Path(app.instance_path) / app.config["SQLITE3_SLOW_QUERY_LOG"])
+            if not any(getattr(handler, "baseFilename", None) == log_path for handler in self.slow_query_logger.handlers):
+                handler = logging.FileHandler(log_path, delay=True)
+                handler.setFormatter(logging.Formatter("%(asctime)s %(process)d %(message)s"))
+                self.slow_query_logger.addHandler(handler)
+        self.stats_folder = Path(app.instance_path) / app.config.get("SQLITE3_STATS_FOLDER", "db-stats")
+        self._stats_interval = app.config.get("SQLITE3_STATS_DUMP_INTERVAL")
+        self._stats_dumped = time.monotonic()
+
+        self.writer = None
+        if app.config.get("SQLITE3_GROUP_COMMIT", False):
+            self.writer = GroupCommitWriter(
+                self.pool.connect,
+                max_batch=app.config.get("SQLITE3_GROUP_COMMIT_MAX_BATCH", 64),
+                max_delay=app.config.get("SQLITE3_GROUP_COMMIT_DELAY", 0.002),
+            )
+        if self._stats_interval is not None or self.writer is not None:
+            # Removed again by close()
+            atexit.register(self._at_exit)
+
+        # Registered before migrating, so the connection of the migrations is returned to the pool
         app.teardown_appcontext(self._close_connection)
+        self._migrations = Path(app.root_path) / migrations if migrations else None
+        if self._migrations is not None:
+            with app.app_context():
+                self.migrate()
+
+    @property
+    def feed_strategy(self) -> str:
+        """Returns how the stream is computed, 'write' for materialized timelines or 'read' for on the fly."""
+        return self._feed_strategy
+
+    @property
+    def friend_graph(self) -> FriendGraph:
+        """Returns the in-memory friend graph, updated with the friendships other processes inserted.
+
+        The Friends rows inserted since the last update are applied once per app context.
+        """
+        if has_app_context() and not g.get("flask_sqlite3_friend_graph_synced", False):
+            g.flask_sqlite3_friend_graph_synced = True
+            self._sync_friend_graph()
+        return self._friend_graph
 
     @property
     def connection(self) -> sqlite3.Connection:
-        """Returns the connection to the SQLite3 database."""
+        """Returns the pooled connection to the SQLite3 database for the current app context."""
         conn = getattr(g, "flask_sqlite3_connection", None)
         if conn is None:
-            conn = g.flask_sqlite3_connection = sqlite3.connect(self._path)
-            conn.row_factory = sqlite3.Row
+            conn = g.flask_sqlite3_connection = self.pool.acquire()
         return conn
 
+    @memoized
+    @instrumented
     def query_friends(self, user_id: str) -> list[sqlite3.Row] | None:
+        """Fetch the friends of a user, whichever of the two added the friendship, ordered by id."""
+        friend_ids = sorted(self.friend_graph.friends(user_id))
+        if not friend_ids:
+            return []
         cursor = self.connection.execute(
-            """
-            SELECT U.id, U.username
-            FROM Users U
-            JOIN Friends F ON U.id = F.f_id
-            WHERE F.u_id = ?
-            """, (user_id,)
+            "SELECT id, username FROM Users WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id;", (json.dumps(friend_ids),)
         )
         friends = cursor.fetchall()
         return friends
 
+    @memoized
+    @instrumented
+    def count_mutual_friends(self, user_id, other_id) -> int:
+        """Count the friends two users have in common."""
+        return self.friend_graph.mutual_count(user_id, other_id)
+
+    @memoized
+    @instrumented
     def query_userid(self, userid) -> dict | None:
         """Fetch userid from the database."""
         cursor = self.connection.execute(
@@ -127,6 +792,8 @@ class SQLite3:
         user = cursor.fetchone()
         return user
     
+    @memoized
+    @instrumented
     def query_userprofile(self, username: str) -> sqlite3.Row | None:
         """Fetch userprofile data from the database."""
         cursor = self.connection.execute(
@@ -135,6 +802,8 @@ class SQLite3:
         user = cursor.fetchone()
         return user
     
+    @memoized
+    @instrumented
     def query_username(self, username) -> sqlite3.Row | None:
         """Fetch user from the database."""
         cursor = self.connection.execute(
@@ -143,20 +812,62 @@ class SQLite3:
         user = cursor.fetchone()
         return user
 
-    def query_posts(self, userid: str) -> list[sqlite3.Row] | None:
-        """Fetch posts from the database."""
+    @memoized
+    @instrumented
+    def resolve_user(self, username: str) -> sqlite3.Row | None:
+        """Fetch user by username from the database, or None if the user does not exist.
+
+        Use this instead of check_user_exists followed by a second query for the same row.
+        """
         cursor = self.connection.execute(
-         """
-         SELECT p.*, u.id, u.username,
-         (SELECT COUNT(*) FROM Comments WHERE p_id = p.id) AS cc
-         FROM Posts AS p JOIN Users AS u ON u.id = p.u_id
-         WHERE p.u_id IN (SELECT u_id FROM Friends WHERE f_id = ?) OR p.u_id IN (SELECT f_id FROM Friends WHERE u_id = ?) OR p.u_id = ? 
-         ORDER BY p.creation_time DESC;
-        """, (userid, userid, userid)
-        )
-        posts = cursor.fetchall()
+            "SELECT id, username, first_name, last_name FROM Users WHERE username = ?", (username,)
+            )
+        user = cursor.fetchone()
+        return user
+
+    @memoized
+    @instrumented
+    def query_posts(
+        self, userid: str, cursor: Optional[tuple[str, int]] = None, limit: Optional[int] = None
+    ) -> list[sqlite3.Row] | None:
+        """Fetch a page of posts from the user and their friends from the database.
+
+        Posts are ordered newest first on (creation_time, id). The cursor is the
+        (creation_time, id) of the last post on the previous page, see encode_cursor.
+        With the 'write' feed strategy the page is a range scan of the user's timeline,
+        with the 'read' strategy it is computed from Posts and Friends.
+        """
+        if self._feed_strategy == "write":
+            params: list[Any] = [userid]
+            keyset = "AND (t.created_at, t.post_id) < (?, ?)" if cursor is not None else ""
+            query = """
+            SELECT p.*, u.id, u.username
+            FROM Timeline AS t JOIN Posts AS p ON p.id = t.post_id JOIN Users AS u ON u.id = p.u_id
+            WHERE t.owner_id = ?
+            {keyset}
+            ORDER BY t.created_at DESC, t.post_id DESC
+            LIMIT ?;
+            """
+        else:
+            # The authors are the user and their friends from the friend graph
+            params = [json.dumps([int(userid), *self.friend_graph.friends(userid)])]
+            keyset = "AND (p.creation_time, p.id) < (?, ?)" if cursor is not None else ""
+            query = """
+            SELECT p.*, u.id, u.username
+            FROM Posts AS p JOIN Users AS u ON u.id = p.u_id
+            WHERE p.u_id IN (SELECT value FROM json_each(?))
+            {keyset}
+            ORDER BY p.creation_time DESC, p.id DESC
+            LIMIT ?;
+            """
+        if cursor is not None:
+            params.extend(cursor)
+        params.append(-1 if limit is None else limit)
+        posts = self.connection.execute(query.format(keyset=keyset), params).fetchall()
         return posts
     
+    @memoized
+    @instrumented
     def query_post(self, post_id: str) -> sqlite3.Row | None:
         """Fetch post from the database."""
         cursor = self.connection.execute(
@@ -169,8 +880,17 @@ class SQLite3:
         post = cursor.fetchone()
         return post
     
+    @memoized
+    @instrumented
     def query_comments(self, post_id: str) -> list[sqlite3.Row] | None:
         """Fetch comments from the database."""
+        return list(self.iter_comments(post_id))
+
+    def iter_comments(self, post_id: str) -> Iterator[sqlite3.Row]:
+        """Yields the comments of a post as they are fetched from the cursor, e.g. for streamed rendering.
+
+        The rows are neither memoized nor timed, and the app context must stay active until the iterator is exhausted.
+        """
         cursor = self.connection.execute(
         """
         SELECT DISTINCT *
@@ -179,9 +899,10 @@ class SQLite3:
         ORDER BY c.creation_time DESC;
         """, (post_id,)
         )
-        comments = cursor.fetchall()
-        return comments
+        yield from cursor
 
+    @memoized
+    @instrumented
     def check_user_exists(self, username) -> bool:
         cursor = self.connection.execute(
             "SELECT id FROM Users WHERE username = ?", (username,)
@@ -191,6 +912,8 @@ class SQLite3:
             return True
         return False
     
+    @memoized
+    @instrumented
     def check_post_exists(self, post_id) -> bool:
         cursor = self.connection.execute(
             "SELECT id FROM Posts WHERE id = ?", (post_id,)
@@ -200,6 +923,8 @@ class SQLite3:
             return True
         return False
     
+    @memoized
+    @instrumented
     def check_comment_exists(self, comment_id) -> bool:
         cursor = self.connection.execute(
             "SELECT id FROM Comments WHERE id = ?", (comment_id,)
@@ -209,59 +934,138 @@ class SQLite3:
             return True
         return False
     
+    @memoized
+    @instrumented
     def check_friend_connection(self, user_id, friend_id) -> bool:
-        cursor = self.connection.execute(
-            "SELECT u_id FROM Friends WHERE u_id = ? AND f_id = ?", (user_id, friend_id)
-            )
-        friend = cursor.fetchone()
-        if friend:
-            return True
-        cursor = self.connection.execute(
-            "SELECT u_id FROM Friends WHERE u_id = ? AND f_id = ?", (friend_id, user_id)
-            )
-        friend = cursor.fetchone()
-        if friend:
-            return True
-        return False
+        """Check whether two users are friends, whichever of the two added the friendship."""
+        return self.friend_graph.is_friend(user_id, friend_id)
     
+    @invalidates
+    @instrumented
     def insert_user(self, user:dict) -> None:
         """Insert user into the database."""
-        cursor = self.connection.execute(
-            "INSERT INTO Users (username, password, first_name, last_name) VALUES (?, ?, ?, ?)",
-             (user.get('username'), user.get('password'), user.get('first_name'), user.get('last_name'))
-            )
-        self.connection.commit()
+        def write(conn: sqlite3.Connection) -> int:
+            cursor = conn.execute(
+                "INSERT INTO Users (username, password, first_name, last_name) VALUES (?, ?, ?, ?)",
+                 (user.get('username'), user.get('password'), user.get('first_name'), user.get('last_name'))
+                )
+            return cursor.lastrowid
+        user_id = self._write(write)
+        user_changed.send(self, user_id=str(user_id))
 
-    def insert_post(self, user_id, content, image ) -> None:
-        """Insert post into the database."""
-        self.connection.execute(
-            "INSERT INTO Posts (u_id, content, image, creation_time) VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
-            (user_id, content, image)
-            )
-        self.connection.commit()
+    @invalidates
+    @instrumented
+    def insert_post(self, user_id, content, image ) -> int:
+        """Insert post into the database and fan it out to the timelines of the author and their friends.
 
+        Returns the id of the new post.
+        """
+        def write(conn: sqlite3.Connection) -> int:
+            cursor = conn.execute(
+                "INSERT INTO Posts (u_id, content, image, creation_time) VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
+                (user_id, content, image)
+                )
+            if self._feed_strategy == "write":
+                conn.execute(
+                    """
+                    INSERT OR IGNORE INTO Timeline (owner_id, post_id, created_at)
+                    SELECT owners.id, p.id, p.creation_time
+                    FROM Posts AS p, (
+                        SELECT ? AS id UNION SELECT f_id FROM Friends WHERE u_id = ? UNION SELECT u_id FROM Friends WHERE f_id = ?
+                    ) AS owners
+                    WHERE p.id = ?;
+                    """, (user_id, user_id, user_id, cursor.lastrowid)
+                )
+            self._bump_streams(conn, user_id)
+            return cursor.lastrowid
+        return self._write(write)
+
+    @invalidates
+    @instrumented
+    def update_post_image(self, post_id, width: int, height: int, variants: list) -> None:
+        """Records the dimensions and the resized variants of a post's image, see app/images.py."""
+        query = "UPDATE Posts SET image_width = ?, image_height = ?, image_variants = ? WHERE id = ?;"
+        def write(conn: sqlite3.Connection) -> None:
+            conn.execute(query, (width, height, json.dumps(variants), post_id))
+            self._bump_post(conn, post_id)
+        self._write(write)
+
+    @invalidates
+    @instrumented
     def insert_friend(self, user_id, friend_id) -> None:
+        """Insert friendship into the database and backfill the recent posts of each into the other's timeline."""
+        def write(conn: sqlite3.Connection) -> None:
+            conn.execute(
+            """
+            INSERT INTO Friends (u_id, f_id)
+            VALUES (?, ?);
+            """, (user_id, friend_id)
+            )
+            if self._feed_strategy == "write":
+                for owner_id, author_id in ((user_id, friend_id), (friend_id, user_id)):
+                    conn.execute(
+                        """
+                        INSERT OR IGNORE INTO Timeline (owner_id, post_id, created_at)
+                        SELECT ?, id, creation_time FROM Posts WHERE u_id = ?
+                        ORDER BY creation_time DESC, id DESC
+                        LIMIT ?;
+                        """, (owner_id, author_id, self._timeline_backfill)
+                    )
+            self._bump(conn, f"stream:{user_id}", f"stream:{friend_id}", f"friends:{user_id}", f"friends:{friend_id}")
+        self._write(write)
+        self._friend_graph.add(user_id, friend_id)
+
+    @invalidates
+    @instrumented
+    def rebuild_timelines(self) -> int:
+        """Regenerates every timeline from Posts and Friends. Returns the number of timeline rows written."""
+        self.connection.execute("DELETE FROM Timeline;")
         cursor = self.connection.execute(
-        """
-        INSERT INTO Friends (u_id, f_id)
-        VALUES (?, ?);
-        """, (user_id, friend_id)
+            """
+            INSERT OR IGNORE INTO Timeline (owner_id, post_id, created_at)
+            SELECT u_id, id, creation_time FROM Posts
+            UNION SELECT f.f_id, p.id, p.creation_time FROM Friends AS f JOIN Posts AS p ON p.u_id = f.u_id
+            UNION SELECT f.u_id, p.id, p.creation_time FROM Friends AS f JOIN Posts AS p ON p.u_id = f.f_id;
+            """
         )
-        # Check how many rows were inserted
-        print(cursor.rowcount)
+        self._bump(self.connection, "epoch")
         self.connection.commit()
+        return cursor.rowcount
 
+    @invalidates
+    @instrumented
     def insert_comment(self, post_id, comment, user_id) -> None:
-        """Insert comment into the database."""
-        print(post_id, comment, user_id)
-        self.connection.execute(
+        """Insert comment into the database and bump the comment count of the post."""
+        def write(conn: sqlite3.Connection) -> None:
+            conn.execute(
+                """
+                INSERT INTO Comments (p_id, u_id, comment, creation_time)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP);
+                """, (post_id, user_id, comment)
+            )
+            conn.execute(
+                "UPDATE Posts SET comment_count = comment_count + 1 WHERE id = ?", (post_id,)
+            )
+            self._bump_post(conn, post_id)
+        self._write(write)
+
+    @invalidates
+    @instrumented
+    def repair_comment_counts(self) -> int:
+        """Recounts the comments of every post and fixes drifted counters. Returns the number of posts fixed."""
+        cursor = self.connection.execute(
+            """
+            UPDATE Posts
+            SET comment_count = (SELECT COUNT(*) FROM Comments WHERE p_id = Posts.id)
+            WHERE comment_count != (SELECT COUNT(*) FROM Comments WHERE p_id = Posts.id);
             """
-            INSERT INTO Comments (p_id, u_id, comment, creation_time)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP);
-            """, (post_id, user_id, comment)
         )
+        self._bump(self.connection, "epoch")
         self.connection.commit()
+        return cursor.rowcount
 
+    @invalidates
+    @instrumented
     def update_profile(self, user_id, data: dict) -> None:
         query = """
             UPDATE Users
@@ -274,7 +1078,7 @@ class SQLite3:
             birthday = COALESCE(?, birthday)
             WHERE id = ?;
         """
-        self.connection.execute(query, (
+        params = (
             data.get("education"),
             data.get("employment"),
             data.get("music"),
@@ -282,17 +1086,260 @@ class SQLite3:
             data.get("nationality"),
             data.get("birthday"),
             user_id
-        ))
+        )
+        def write(conn: sqlite3.Connection) -> None:
+            conn.execute(query, params)
+            self._bump(conn, f"profile:{user_id}")
+        self._write(write)
+        user_changed.send(self, user_id=str(user_id))
+
+    @invalidates
+    @instrumented
+    def update_password(self, user_id, password_hash) -> None:
+        """Replace the password hash of a user, e.g. when it is rehashed with a new work factor."""
+        query = "UPDATE Users SET password = ? WHERE id = ?;"
+        self._write(lambda conn: conn.execute(query, (password_hash, user_id)))
+
+    @memoized
+    @instrumented
+    def query_page_version(self, kind: str, username: str) -> tuple[int, int] | None:
+        """Fetch the epoch and the version stamp of a user's page, e.g. kind 'stream', or None if the user does not exist."""
+        cursor = self.connection.execute(
+            """
+            SELECT e.version AS epoch, COALESCE(v.version, 0) AS version
+            FROM Users AS u LEFT JOIN Versions AS v ON v.key = ? || ':' || u.id LEFT JOIN Versions AS e ON e.key = 'epoch'
+            WHERE u.username = ?;
+            """, (kind, username)
+        )
+        row = cursor.fetchone()
+        return None if row is None else (row["epoch"], row["version"])
+
+    @memoized
+    @instrumented
+    def query_version(self, key: str) -> tuple[int, int]:
+        """Fetch the epoch and the version stamp of a page, e.g. 'comments:<post id>'."""
+        cursor = self.connection.execute(
+            """
+            SELECT (SELECT version FROM Versions WHERE key = 'epoch'), COALESCE((SELECT version FROM Versions WHERE key = ?), 0);
+            """, (key,)
+        )
+        return tuple(cursor.fetchone())
+
+    @invalidates
+    @instrumented
+    def bump_epoch(self) -> None:
+        """Changes the ETags of all pages, e.g. after bulk changes that bypass the write methods."""
+        self._write(lambda conn: self._bump(conn, "epoch"))
+
+    def _bump(self, conn: sqlite3.Connection, *keys: str) -> None:
+        """Increments the version stamps of pages inside the current write."""
+        conn.executemany(
+            "INSERT INTO Versions (key, version) VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET version = version + 1;",
+            [(key,) for key in keys],
+        )
+
+    def _bump_streams(self, conn: sqlite3.Connection, user_id) -> None:
+        """Increments the stream stamps of a user and their friends, whose streams show the user's posts."""
+        conn.execute(
+            """
+            INSERT INTO Versions (key, version)
+            SELECT 'stream:' || id, 1
+            FROM (SELECT ? AS id UNION SELECT f_id FROM Friends WHERE u_id = ? UNION SELECT u_id FROM Friends WHERE f_id = ?)
+            WHERE true
+            ON CONFLICT(key) DO UPDATE SET version = version + 1;
+            """, (user_id, user_id, user_id)
+        )
+
+    def _bump_post(self, conn: sqlite3.Connection, post_id) -> None:
+        """Increments the stamps of the pages showing a post: its comments and the streams it appears in."""
+        self._bump(conn, f"comments:{post_id}")
+        author = conn.execute("SELECT u_id FROM Posts WHERE id = ?;", (post_id,)).fetchone()
+        if author is not None:
+            self._bump_streams(conn, author[0])
+
+    def _write(self, write: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Runs a write function in its own transaction, or in the next batch of the group commit writer.
+
+        Returns the result of the write function once it has been committed.
+        """
+        if self.writer is not None:
+            return self.writer.submit(write)
+        result = write(self.connection)
         self.connection.commit()
+        return result
+
+    def check_friend_graph(self) -> list[int]:
+        """Compares the friend sets in memory with the Friends table and drops those that differ.
+
+        Returns the ids of the users whose friend set differed, they are loaded again on next use.
+        """
+        mismatched = []
+        for user_id, friends in self.friend_graph.loaded().items():
+            if set(self._load_friends(user_id)) != friends:
+                self._friend_graph.invalidate(user_id)
+                mismatched.append(user_id)
+        return mismatched
+
+    def reset_friend_graph(self) -> None:
+        """Empties the friend graph, it is loaded from the Friends table again on next use."""
+        with self._friend_graph_lock:
+            self._friend_graph.clear()
+            self._friend_graph_epoch = None
+            self._friend_graph_rowid = None
+
+    def _load_friends(self, user_id: int) -> list[int]:
+        """Fetches the ids of the friends of a user for the friend graph, in both directions."""
+        start = time.perf_counter()
+        rows = self.connection.execute(
+            "SELECT f_id FROM Friends WHERE u_id = ? UNION SELECT u_id FROM Friends WHERE f_id = ?;", (user_id, user_id)
+        ).fetchall()
+        self.stats.record("friend_graph_load", time.perf_counter() - start, rows=len(rows))
+        return [row[0] for row in rows]
+
+    def _sync_friend_graph(self) -> None:
+        """Applies the friendships inserted since the last sync, e.g. by other processes, to the friend graph.
+
+        Rows of Friends are never deleted, so the rows with a larger rowid are the new ones. A changed epoch
+        means the table was rebuilt, e.g. by reset_database, and the graph starts over, as on the first sync.
+        """
+        conn = self.connection
+        with self._friend_graph_lock:
+            try:
+                epoch = conn.execute("SELECT version FROM Versions WHERE key = 'epoch';").fetchone()
+            except sqlite3.OperationalError:
+                # The migrations adding the Versions table have not been applied
+                epoch = None
+            epoch = None if epoch is None else epoch[0]
+            if self._friend_graph_rowid is None or epoch != self._friend_graph_epoch:
+                self._friend_graph.clear()
+                self._friend_graph_epoch = epoch
+                self._friend_graph_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM Friends;").fetchone()[0]
+                return
+            rows = conn.execute(
+                "SELECT rowid, u_id, f_id FROM Friends WHERE rowid > ? ORDER BY rowid;", (self._friend_graph_rowid,)
+            ).fetchall()
+            for rowid, user_id, friend_id in rows:
+                self._friend_graph.add(user_id, friend_id)
+                self._friend_graph_rowid = rowid
+
+    def check(self) -> bool:
+        """Returns whether the database can be queried and all migrations are applied, e.g. for a readiness check."""
+        try:
+            version = self.connection.execute("PRAGMA user_version;").fetchone()[0]
+        except (sqlite3.Error, PoolTimeoutError):
+            return False
+        return not self._pending_migrations(version)
+
+    @invalidates
+    def migrate(self) -> int:
+        """Applies pending migrations and returns how many were applied.
+
+        Migrations are the files named '<version>_<name>.sql' in the migrations folder.
+        The version of the last applied migration is stored in 'PRAGMA user_version',
+        so a database that is up to date costs a single pragma read.
+        """
+        migrations = self._pending_migrations(0)
+        if not migrations:
+            return 0
+        latest = migrations[-1][0]
+        if self.connection.execute("PRAGMA user_version;").fetchone()[0] >= latest:
+            return 0
+
+        conn = self.connection
+        isolation_level, conn.isolation_level = conn.isolation_level, None
+        try:
+            # Take the write lock before re-reading the version, another process may be migrating as well
+            conn.execute("BEGIN IMMEDIATE;")
+            try:
+                pending = self._pending_migrations(conn.execute("PRAGMA user_version;").fetchone()[0])
+                for version, script in pending:
+                    for statement in _split_statements(script.read_text()):
+                        conn.execute(statement)
+                    conn.execute(f"PRAGMA user_version = {version};")
+                conn.execute("COMMIT;")
+            except BaseException:
+                conn.execute("ROLLBACK;")
+                raise
+        finally:
+            conn.isolation_level = isolation_level
+        return len(pending)
+
+    @invalidates
+    def reset_database(self) -> None:
+        """Drops every table, index and trigger and re-applies all migrations. All data is lost."""
+        conn = self.connection
+        try:
+            epoch = conn.execute("SELECT version FROM Versions WHERE key = 'epoch';").fetchone()
+        except sqlite3.OperationalError:
+            epoch = None
+        objects = conn.execute(
+            "SELECT type, name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name NOT LIKE 'sqlite_%';"
+        ).fetchall()
+        for obj in objects:
+            conn.execute(f"DROP {obj['type'].upper()} IF EXISTS [{obj['name']}];")
+        conn.execute("PRAGMA user_version = 0;")
+        conn.commit()
+        self.migrate()
+        if epoch is not None:
+            # Pages of the old database must not match the ETags the browsers still hold
+            conn.execute("UPDATE Versions SET version = ? WHERE key = 'epoch';", (epoch[0] + 1,))
+            conn.commit()
+        self.reset_friend_graph()
+
+    def _pending_migrations(self, version: int) -> list[tuple[int, Path]]:
+        """Returns the migrations newer than the given version, ordered by version."""
+        if self._migrations is None:
+            return []
+        migrations = []
+        for script in self._migrations.glob("*.sql"):
+            number = script.name.split("_", 1)[0]
+            if number.isdigit() and int(number) > version:
+                migrations.append((int(number), script))
+        return sorted(migrations)
+
+    def close(self) -> None:
+        """Commits the pending writes, dumps the query statistics and closes the connections of the pool.
+
+        Is called at exit, an extension that is discarded before, e.g. in tests, should be closed explicitly.
+        """
+        atexit.unregister(self._at_exit)
+        self._at_exit()
+        self.pool.dispose()
 
-    def _init_database(self, schema: PathLike | str) -> None:
-        """Initializes the database with the supplied schema if it does not exist yet."""
-        with current_app.open_resource(str(schema), mode="r") as file:
-            self.connection.executescript(file.read())
-            self.connection.commit()
+    def _at_exit(self) -> None:
+        """Stops the group commit writer and dumps the query statistics, if they are enabled."""
+        if self.writer is not None:
+            self.writer.close()
+        if self._stats_interval is not None:
+            self.dump_stats()
+
+    def dump_stats(self) -> None:
+        """Writes the query statistics of this process to the stats folder, see 'flask db-stats'."""
+        self._stats_dumped = time.monotonic()
+        if self.stats.snapshot():
+            self.stats.dump(self.stats_folder / f"{os.getpid()}.json")
+
+    def collect_stats(self) -> dict[str, dict[str, Any]]:
+        """Returns the query statistics of the running processes that dumped them, merged with this process.
+
+        Dumps of processes that have exited are deleted.
+        """
+        snapshots = [self.stats.snapshot()]
+        for path in self.stats_folder.glob("*.json"):
+            if path.stem == str(os.getpid()):
+                continue
+            if not path.stem.isdigit() or not _process_alive(int(path.stem)):
+                # E.g. a recycled worker, its pid may be reused by an unrelated process
+                path.unlink(missing_ok=True)
+                continue
+            snapshots.append(json.loads(path.read_text()))
+        return QueryStats.summarize(QueryStats.merge(snapshots))
 
     def _close_connection(self, exception: Optional[BaseException] = None) -> None:
-        """Closes the connection to the database."""
-        conn = cast(sqlite3.Connection, getattr(g, "flask_sqlite3_connection", None))
+        """Returns the connection of the current app context to the pool."""
+        conn = cast(sqlite3.Connection, g.pop("flask_sqlite3_connection", None))
         if conn is not None:
-            conn.close()
+            self.pool.release(conn)
+        if self._stats_interval is not None and time.monotonic() - self._stats_dumped >= self._stats_interval:
+            self.dump_stats()
+
@@ -0,0 +1,151 @@
+"""Provides an in-memory index of the friendships between users.
+
+The FriendGraph keeps the set of friends of recently used users in memory, so checking a
+friendship, listing the friends of a user and counting mutual friends need no SQL once the
+users are loaded. Friendship is symmetric: a row (u_id, f_id) in Friends makes each user a
+friend of the other. A user's set is loaded from the database on first use, new friendships
+are added to the loaded sets as they are inserted, and the least recently used sets are
+evicted when the sets hold more than max_edges friends in total.
+
+The SQLite3 extension owns the graph, see SQLite3.friend_graph, and also applies the
+friendships inserted by other processes.
+
+Example:
+    graph = FriendGraph(load_friends=lambda user_id: friends_from_database(user_id))
+    graph.add(1, 2)
+    graph.is_friend(2, 1)  # True
+    graph.mutual_count(1, 3)  # 0
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import Any, Callable
+
+
+class FriendGraph:
+    """Provides a least recently used cache of the friend sets of users, bounded by the number of friends."""
+
+    def __init__(self, load_friends: Callable[[int], Iterable[int]], max_edges: int = 1_000_000) -> None:
+        """Initializes the graph.
+
+        params:
+            load_friends: Returns the ids of the friends of a user, in both directions, e.g. from the Friends table.
+            max_edges (optional): The maximum number of friends held over all loaded users.
+
+        """
+        if max_edges < 1:
+            raise ValueError("Friend graph max_edges must be at least 1")
+        self._load_friends = load_friends
+        self._max_edges = max_edges
+        self._sets: OrderedDict[int, set[int]] = OrderedDict()
+        self._edges = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        # Counts the changes, a set loaded while the graph changed may be outdated and is not kept
+        self._generation = 0
+
+    def friends(self, user_id: Any) -> frozenset[int]:
+        """Returns the ids of the friends of a user, loading them if they are not in memory.
+
+        params:
+            user_id: The id of the user, as an int or a string.
+
+        """
+        user_id = int(user_id)
+        with self._lock:
+            friends = self._sets.get(user_id)
+            if friends is not None:
+                self._sets.move_to_end(user_id)
+                self._hits += 1
+                return frozenset(friends)
+            self._misses += 1
+            generation = self._generation
+        # Load outside the lock, so other users are answered meanwhile
+        loaded = {int(friend_id) for friend_id in self._load_friends(user_id)}
+        with self._lock:
+            current = self._sets.get(user_id)
+            if current is not None:
+                # Another thread loaded the user meanwhile and may have added newer friendships
+                added = loaded - current
+                current |= added
+                self._edges += len(added)
+                self._evict()
+                return frozenset(current)
+            if generation == self._generation and len(loaded) <= self._max_edges:
+                self._sets[user_id] = loaded
+                self._edges += len(loaded)
+                self._evict()
+        return frozenset(loaded)
+
+    def is_friend(self, user_id: Any, friend_id: Any) -> bool:
+        """Returns whether two users are friends."""
+        return int(friend_id) in self.friends(user_id)
+
+    def mutual_count(self, user_id: Any, other_id: Any) -> int:
+        """Returns the number of friends two users have in common."""
+        return len(self.friends(user_id) & self.friends(other_id))
+
+    def add(self, user_id: Any, friend_id: Any) -> None:
+        """Records a new friendship in the sets of the users that are loaded.
+
+        params:
+            user_id: The id of one user.
+            friend_id: The id of the other user.
+
+        Users that are not loaded get the friendship when they are loaded from the database.
+        """
+        user_id, friend_id = int(user_id), int(friend_id)
+        with self._lock:
+            self._generation += 1
+            for owner, friend in ((user_id, friend_id), (friend_id, user_id)):
+                friends = self._sets.get(owner)
+                if friends is not None and friend not in friends:
+                    friends.add(friend)
+                    self._edges += 1
+            self._evict()
+
+    def loaded(self) -> dict[int, frozenset[int]]:
+        """Returns a copy of the friend sets in memory, e.g. to compare them with the database."""
+        with self._lock:
+            return {user_id: frozenset(friends) for user_id, friends in self._sets.items()}
+
+    def invalidate(self, user_id: Any) -> None:
+        """Removes the friend set of a user, it is loaded again on next use."""
+        with self._lock:
+            self._generation += 1
+            friends = self._sets.pop(int(user_id), None)
+            if friends is not None:
+                self._edges -= len(friends)
+
+    def clear(self) -> None:
+        """Removes all friend sets."""
+        with self._lock:
+            self._generation += 1
+            self._sets.clear()
+            self._edges = 0
+
+    def stats(self) -> dict[str, Any]:
+        """Returns a snapshot of the graph metrics, edges is the number of friends held in memory."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "users": len(self._sets),
+                "edges": self._edges,
+                "max_edges": self._max_edges,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+            }
+
+    def _evict(self) -> None:
+        """Evicts the least recently used friend sets until the edges fit. Must be called with the lock held."""
+        while self._edges > self._max_edges and self._sets:
+            _, friends = self._sets.popitem(last=False)
+            self._edges -= len(friends)
+            self._evictions += 1
@@ -0,0 +1,166 @@
+"""Provides background generation of resized variants of uploaded images.
+
+The ImageProcessor extension resizes the image of a new post to IMAGE_VARIANT_WIDTHS and
+records the variants on the post, templates offer them to browsers with image_srcset.
+
+Example:
+    from flask import Flask
+    from app.images import ImageProcessor
+
+    app = Flask(__name__)
+    image_processor = ImageProcessor(app, store=upload_store, database=sqlite)
+
+    # In a request, after the post was inserted
+    image_processor.submit(post_id, filename)
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Optional
+
+from flask import Flask, current_app, url_for
+
+from app.database import QueryStats, SQLite3
+from app.uploads import UploadStore
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+class ImageProcessor:
+    """Provides resizing of uploaded images on a pool of worker threads for Flask.
+
+    The pool is started on the first image, so forked server workers do not inherit it.
+    With IMAGE_WORKERS set to 0 images are resized on the calling thread.
+    """
+
+    def __init__(
+        self,
+        app: Optional[Flask] = None,
+        *,
+        store: Optional[UploadStore] = None,
+        database: Optional[SQLite3] = None,
+        stats: Optional[QueryStats] = None,
+    ) -> None:
+        """Initializes the extension.
+
+        params:
+            app (optional): The Flask application to initialize the extension with.
+            store (optional): The upload store holding the images, defaults to the app's upload store.
+            database (optional): The database to record the variants in, defaults to the app's SQLite3 extension.
+            stats (optional): Where to record the metrics, defaults to a QueryStats of its own.
+
+        """
+        self._store = store
+        self._database = database
+        self.stats = stats if stats is not None else QueryStats()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Initializes the extension with the Flask application.
+
+        params:
+            app: The Flask application to initialize the extension with.
+
+        """
+        self._store = self._store or app.extensions["upload_store"]
+        self._database = self._database or app.extensions["sqlite3"]
+        self.widths = sorted(app.config.setdefault("IMAGE_VARIANT_WIDTHS", (320, 640, 1280)))
+        self.format = app.config.setdefault("IMAGE_VARIANT_FORMAT", "WEBP")
+        self.quality = app.config.setdefault("IMAGE_VARIANT_QUALITY", 80)
+        self.workers = app.config.setdefault("IMAGE_WORKERS", 2)
+        self.enabled = Image is not None
+        if not self.enabled:
+            logger.warning("Pillow is not installed, uploaded images are served without resized variants")
+        app.add_template_global(self.srcset, "image_srcset")
+        app.extensions["image_processor"] = self
+
+    def submit(self, post_id: int, name: str) -> Optional[Future]:
+        """Queues the image of a post for resizing. Must be called inside an app context."""
+        if not self.enabled:
+            return None
+        app = current_app._get_current_object()
+        if self.workers == 0:
+            self.process(app, post_id, name)
+            return None
+        return self._ensure_started().submit(self.process, app, post_id, name)
+
+    def process(self, app: Flask, post_id: int, name: str) -> None:
+        """Creates the variants of an image and records them on the post."""
+        start = time.perf_counter()
+        try:
+            width, height, variants = self._resize(name)
+            with app.app_context():
+                self._database.update_post_image(post_id, width, height, variants)
+        except Exception:
+            self.stats.record("image_failed", time.perf_counter() - start)
+            logger.exception("Could not create variants of %s for post %s", name, post_id)
+            return
+        self.stats.record("image_variants", time.perf_counter() - start, rows=len(variants))
+
+    def srcset(self, post: Any) -> str:
+        """Returns the srcset attribute value for the image of a post, empty if it has no variants."""
+        variants = json.loads(post["image_variants"] or "[]")
+        if not variants:
+            return ""
+        candidates = [f"{url_for('uploads', filename=name)} {width}w" for width, name in variants]
+        candidates.append(f"{url_for('uploads', filename=post['image'])} {post['image_width']}w")
+        return ", ".join(candidates)
+
+    def close(self) -> None:
+        """Finishes the queued images and stops the worker threads."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and os.getpid() == self._pid:
+            executor.shutdown(wait=True)
+
+    def _resize(self, name: str) -> tuple[int, int, list[list]]:
+        """Writes the missing variants of an image. Returns its width, height and [width, name] per variant."""
+        path = self._store.path(name)
+        if path is None:
+            raise FileNotFoundError(name)
+        extension = f".{self.format.lower()}"
+        variants = []
+        with Image.open(path) as original:
+            image = ImageOps.exif_transpose(original)
+            width, height = image.size
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info or "A" in image.getbands() else "RGB")
+            for target in self.widths:
+                if target >= width:
+                    break
+                variant = Path(name).with_name(f"{Path(name).stem}-{target}{extension}").as_posix()
+                variant_path = self._store.root / variant
+                if not variant_path.exists():
+                    resized = image.resize((target, max(round(height * target / width), 1)), Image.LANCZOS)
+                    with tempfile.NamedTemporaryFile(dir=variant_path.parent, prefix=".variant-", delete=False) as tmp:
+                        resized.save(tmp, format=self.format, quality=self.quality)
+                    os.replace(tmp.name, variant_path)
+                variants.append([target, variant])
+        return width, height, variants
+
+    def _ensure_started(self) -> ThreadPoolExecutor:
+        """Starts the worker threads, also in a forked process whose parent had started them."""
+        with self._lock:
+            if os.getpid() != self._pid:
+                self._pid = os.getpid()
+                self._executor = None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-processor")
+            return self._executor
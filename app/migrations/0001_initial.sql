@@ -1,15 +1,13 @@
 -- ---
--- Globals
--- ---
--- SET SQL_MODE="NO_AUTO_VALUE_ON_ZERO";
--- SET FOREIGN_KEY_CHECKS=0;
+-- Migration 0001: Initial schema
+--
+-- Tables are created only if they do not exist, so databases created
+-- before migrations were introduced are adopted as they are.
 -- ---
 -- Table 'Users'
 --
 -- ---
-DROP TABLE IF EXISTS [Users];
-
-CREATE TABLE [Users] (
+CREATE TABLE IF NOT EXISTS [Users] (
   id INTEGER PRIMARY KEY,
   username VARCHAR UNIQUE,
   first_name VARCHAR,
@@ -27,9 +25,7 @@ CREATE TABLE [Users] (
 -- Table 'Posts'
 --
 -- ---
-DROP TABLE IF EXISTS [Posts];
-
-CREATE TABLE [Posts](
+CREATE TABLE IF NOT EXISTS [Posts](
   id INTEGER PRIMARY KEY,
   u_id INTEGER,
   content INTEGER,
@@ -42,9 +38,7 @@ CREATE TABLE [Posts](
 -- Table 'Friends'
 --
 -- ---
-DROP TABLE IF EXISTS [Friends];
-
-CREATE TABLE [Friends](
+CREATE TABLE IF NOT EXISTS [Friends](
   u_id INTEGER NOT NULL REFERENCES Users,
   f_id INTEGER NOT NULL REFERENCES Users,
   PRIMARY KEY(u_id, f_id),
@@ -56,9 +50,7 @@ CREATE TABLE [Friends](
 -- Table 'Comments'
 --
 -- ---
-DROP TABLE IF EXISTS [Comments];
-
-CREATE TABLE [Comments](
+CREATE TABLE IF NOT EXISTS [Comments](
   id INTEGER PRIMARY KEY,
   p_id INTEGER,
   u_id INTEGER,
@@ -66,4 +58,4 @@ CREATE TABLE [Comments](
   [creation_time] DATETIME,
   FOREIGN KEY (p_id) REFERENCES Posts(id),
   FOREIGN KEY (u_id) REFERENCES Users(id)
-);
\ No newline at end of file
+);
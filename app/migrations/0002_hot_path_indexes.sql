@@ -0,0 +1,15 @@
+-- ---
+-- Migration 0002: Indexes for the hot queries
+--
+-- Users(username) is already covered by the index backing its UNIQUE
+-- constraint, so no separate index is created for it.
+-- ---
+
+-- Stream: posts per author, newest first
+CREATE INDEX IF NOT EXISTS [Posts_u_id_creation_time] ON [Posts](u_id, creation_time);
+
+-- Comments page: comments per post, newest first
+CREATE INDEX IF NOT EXISTS [Comments_p_id_creation_time] ON [Comments](p_id, creation_time);
+
+-- Reverse friendship lookups, the primary key covers (u_id, f_id)
+CREATE INDEX IF NOT EXISTS [Friends_f_id_u_id] ON [Friends](f_id, u_id);
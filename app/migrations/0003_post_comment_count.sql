@@ -0,0 +1,8 @@
+-- ---
+-- Migration 0003: Denormalized comment counter on Posts
+--
+-- Kept up to date by SQLite3.insert_comment, see also 'flask repair-comment-counts'.
+-- ---
+ALTER TABLE [Posts] ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE [Posts] SET comment_count = (SELECT COUNT(*) FROM [Comments] WHERE p_id = [Posts].id);
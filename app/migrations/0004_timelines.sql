@@ -0,0 +1,18 @@
+-- ---
+-- Migration 0004: Materialized timelines for the stream
+--
+-- One row per post in the stream of each user who can see it, written by
+-- SQLite3.insert_post and SQLite3.insert_friend when FEED_STRATEGY is 'write'.
+-- See also 'flask rebuild-timelines'.
+-- ---
+CREATE TABLE IF NOT EXISTS [Timeline](
+  owner_id INTEGER NOT NULL REFERENCES Users,
+  post_id INTEGER NOT NULL REFERENCES Posts,
+  created_at DATETIME NOT NULL,
+  PRIMARY KEY(owner_id, created_at, post_id)
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO [Timeline] (owner_id, post_id, created_at)
+SELECT u_id, id, creation_time FROM [Posts]
+UNION SELECT f.f_id, p.id, p.creation_time FROM [Friends] AS f JOIN [Posts] AS p ON p.u_id = f.u_id
+UNION SELECT f.u_id, p.id, p.creation_time FROM [Friends] AS f JOIN [Posts] AS p ON p.u_id = f.f_id;
@@ -0,0 +1,9 @@
+-- ---
+-- Migration 0005: Image metadata on Posts
+--
+-- Filled in by the background image processor once an uploaded image has been resized.
+-- image_variants is a JSON list of [width, name] pairs of the resized copies in the uploads folder.
+-- ---
+ALTER TABLE [Posts] ADD COLUMN image_width INTEGER;
+ALTER TABLE [Posts] ADD COLUMN image_height INTEGER;
+ALTER TABLE [Posts] ADD COLUMN image_variants TEXT;
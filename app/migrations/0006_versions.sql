@@ -0,0 +1,14 @@
+-- ---
+-- Migration 0006: Version stamps of the pages
+--
+-- The write methods of SQLite3 bump the stamp of every page they change, e.g. 'stream:<user id>',
+-- 'friends:<user id>', 'profile:<user id>' and 'comments:<post id>'. The routes compute their ETags
+-- from these stamps. 'epoch' is part of every ETag and is bumped by bulk changes. reset_database
+-- carries it over, so ETags issued before the database was reset never match again.
+-- ---
+CREATE TABLE IF NOT EXISTS [Versions](
+  key TEXT PRIMARY KEY,
+  version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO [Versions] (key, version) VALUES ('epoch', 0);
@@ -0,0 +1,190 @@
+"""Provides password hashing and verification on a bounded pool of worker processes.
+
+Hashing a password with bcrypt costs tens to hundreds of milliseconds of CPU. Running it on
+the request thread lets a burst of logins starve all other requests, so the PasswordHasher
+extension runs it in a separate process pool. At most BCRYPT_WORKERS passwords are hashed at
+once and at most BCRYPT_MAX_QUEUE more wait for a worker; further calls raise HasherBusyError,
+which the app answers with 503 Service Unavailable.
+
+Example:
+    from flask import Flask
+    from app.passwords import PasswordHasher
+
+    app = Flask(__name__)
+    hasher = PasswordHasher(app)
+
+    pw_hash = hasher.hash_password("secret")
+    hasher.check_password(pw_hash, "secret")  # True
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional, Union
+
+import bcrypt
+from flask import Flask
+
+from app.database import QueryStats
+
+
+class HasherBusyError(RuntimeError):
+    """Raised when all password workers are busy and the queue is full, or a result takes too long."""
+
+
+def _hash_password(password: bytes, rounds: int) -> tuple[bytes, float, float]:
+    """Hashes a password in a worker process. Returns the hash, the start time and the seconds spent."""
+    started = time.time()
+    start = time.perf_counter()
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)), started, time.perf_counter() - start
+
+
+def _check_password(pw_hash: bytes, password: bytes) -> tuple[bool, float, float]:
+    """Checks a password in a worker process. Returns the result, the start time and the seconds spent."""
+    started = time.time()
+    start = time.perf_counter()
+    return bcrypt.checkpw(password, pw_hash), started, time.perf_counter() - start
+
+
+def _to_bytes(value: Union[str, bytes]) -> bytes:
+    return value.encode("utf-8") if isinstance(value, str) else value
+
+
+class PasswordHasher:
+    """Provides bcrypt password hashing for Flask, run on a bounded pool of worker processes.
+
+    The pool is started on the first call, so it is never inherited by forked server workers.
+    A process that finds a pool started by its parent starts its own. With BCRYPT_WORKERS set
+    to 0 passwords are hashed on the calling thread, which is convenient for tests.
+
+    Hash time, queue wait, rejected and timed out calls are recorded in the stats, see 'flask db-stats'.
+    """
+
+    def __init__(self, app: Optional[Flask] = None, *, stats: Optional[QueryStats] = None) -> None:
+        """Initializes the extension.
+
+        params:
+            app (optional): The Flask application to initialize the extension with.
+            stats (optional): Where to record the metrics, defaults to a QueryStats of its own.
+
+        """
+        self.stats = stats if stats is not None else QueryStats()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Initializes the extension with the Flask application.
+
+        params:
+            app: The Flask application to initialize the extension with.
+
+        """
+        self.rounds = app.config.setdefault("BCRYPT_LOG_ROUNDS", 12)
+        self.workers = app.config.setdefault("BCRYPT_WORKERS", 2)
+        self.max_queue = app.config.setdefault("BCRYPT_MAX_QUEUE", 32)
+        self.timeout = app.config.setdefault("BCRYPT_TIMEOUT", 10.0)
+        self._slots = threading.BoundedSemaphore(max(self.workers, 1) + self.max_queue)
+        app.extensions["password_hasher"] = self
+
+    def hash_password(self, password: str) -> bytes:
+        """Hashes a password with the configured work factor.
+
+        params:
+            password: The password to hash.
+
+        """
+        return self._run("bcrypt_hash", _hash_password, _to_bytes(password), self.rounds)
+
+    def check_password(self, pw_hash: Union[str, bytes], password: str) -> bool:
+        """Checks a password against a hash created by hash_password.
+
+        params:
+            pw_hash: The stored hash.
+            password: The password to check.
+
+        """
+        return self._run("bcrypt_check", _check_password, _to_bytes(pw_hash), _to_bytes(password))
+
+    def needs_rehash(self, pw_hash: Union[str, bytes]) -> bool:
+        """Returns whether a hash was created with a different work factor than the configured one.
+
+        params:
+            pw_hash: The stored hash, formatted as '$2b$<rounds>$<salt and hash>'.
+
+        """
+        try:
+            return int(_to_bytes(pw_hash).split(b"$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def close(self) -> None:
+        """Stops the worker processes, they are started again on the next call."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and os.getpid() == self._pid:
+            executor.shutdown(wait=True)
+
+    def _run(self, name: str, function: Callable[..., tuple[Any, float, float]], *args: Any) -> Any:
+        """Runs a hashing function on the pool and records its queue wait and duration."""
+        if self.workers == 0:
+            result, _, seconds = function(*args)
+            self.stats.record(name, seconds)
+            return result
+        executor, slots = self._ensure_started()
+        if not slots.acquire(blocking=False):
+            self.stats.record("bcrypt_rejected", 0)
+            raise HasherBusyError("All password workers are busy")
+        submitted = time.time()
+        try:
+            future = executor.submit(function, *args)
+        except BrokenProcessPool:
+            slots.release()
+            self._discard(executor)
+            raise HasherBusyError("A password worker died, the workers are restarted") from None
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            result, started, seconds = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.stats.record("bcrypt_timeout", 0)
+            raise HasherBusyError(f"No password result after {self.timeout} seconds") from None
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise HasherBusyError("A password worker died, the workers are restarted") from None
+        self.stats.record("bcrypt_queue_wait", max(started - submitted, 0.0))
+        self.stats.record(name, seconds)
+        return result
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        """Drops a pool whose worker died, e.g. killed for lack of memory, so the next call starts a new one."""
+        self.stats.record("bcrypt_broken", 0)
+        with self._lock:
+            if self._executor is not executor:
+                # Another thread has discarded it already
+                return
+            self._executor = None
+        executor.shutdown(wait=False)
+
+    def _ensure_started(self) -> tuple[ProcessPoolExecutor, threading.BoundedSemaphore]:
+        """Starts the worker processes, also in a forked process whose parent had started them.
+
+        Returns the pool and the semaphore that bounds the number of running and queued calls.
+        """
+        with self._lock:
+            if os.getpid() != self._pid:
+                self._pid = os.getpid()
+                self._executor = None
+                self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor, self._slots
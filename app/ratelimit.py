@@ -0,0 +1,186 @@
+"""Provides rate-limit counters that are shared by all worker processes on one machine.
+
+The limits package, which Flask-Limiter counts with, keeps its 'memory://' counters inside
+one process, so with N worker processes every client effectively gets N times the limit.
+SQLiteStorage keeps the counters in a small SQLite database in WAL mode instead, which all
+processes open and which needs no Redis or memcached server. Every increment is a single
+upsert statement, so concurrent increments from different processes are never lost.
+
+Counters of expired windows are swept periodically, and the number of counters is capped,
+so the database stays small. The counters are not worth an fsync, a crash at most forgets
+some of them.
+
+Importing this module registers the 'sqlite' storage scheme, e.g.
+'sqlite:///instance/ratelimit.db'. It supports the fixed window strategy, which is the
+default of Flask-Limiter. See benchmarks/bench_ratelimit.py for the cost of one check.
+
+Example:
+    from flask_limiter import Limiter
+    from app.ratelimit import SQLiteStorage
+
+    limiter = Limiter(get_remote_address, app=app, storage_uri="sqlite:////var/lib/app/ratelimit.db")
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from limits.storage import Storage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Limits(
+  key TEXT PRIMARY KEY,
+  count INTEGER NOT NULL,
+  expiry REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS Limits_expiry ON Limits (expiry);
+"""
+
+
+class SQLiteStorage(Storage):
+    """Provides fixed window rate-limit counters in an SQLite database shared between processes.
+
+    Each thread uses a connection of its own, opened on first use, so the storage can be
+    created before the server forks its workers.
+
+    Example:
+        storage = SQLiteStorage("sqlite:///ratelimit.db")
+        storage.incr("LIMITER/127.0.0.1/index", expiry=60)  # 1
+        storage.get("LIMITER/127.0.0.1/index")  # 1
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(
+        self,
+        uri: Optional[str] = None,
+        wrap_exceptions: bool = False,
+        sweep_interval: float = 60.0,
+        max_keys: int = 100_000,
+        timeout: float = 5.0,
+        **options: float | str | bool,
+    ) -> None:
+        """Initializes the storage.
+
+        params:
+            uri: The database URI, 'sqlite:///' followed by a relative or absolute path.
+            wrap_exceptions (optional): Whether to wrap sqlite3 errors in limits.errors.StorageError.
+            sweep_interval (optional): Seconds between removals of expired counters per process.
+            max_keys (optional): The maximum number of counters, those expiring soonest are removed first.
+            timeout (optional): Seconds to wait for another process holding the write lock.
+
+        """
+        path = (uri or "").partition("://")[2]
+        if not path.startswith("/") or path == "/":
+            raise ValueError(f"Expected a database path like 'sqlite:///ratelimit.db', got {uri!r}")
+        self.path = path[1:]
+        self.sweep_interval = float(sweep_interval)
+        self.max_keys = int(max_keys)
+        self.timeout = float(timeout)
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._next_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    @property
+    def base_exceptions(self) -> type[Exception]:
+        return sqlite3.Error
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        """Increments a counter, starting a new window of expiry seconds if it has expired. Returns the count."""
+        now = time.time()
+        if now >= self._next_sweep:
+            self.sweep(now)
+        row = self._connection().execute(
+            """
+            INSERT INTO Limits (key, count, expiry) VALUES (:key, :amount, :now + :expiry)
+            ON CONFLICT(key) DO UPDATE SET
+              count = CASE WHEN expiry <= :now THEN excluded.count ELSE count + excluded.count END,
+              expiry = CASE WHEN expiry <= :now THEN excluded.expiry ELSE expiry END
+            RETURNING count;
+            """,
+            {"key": key, "amount": amount, "now": now, "expiry": expiry},
+        ).fetchone()
+        return row[0]
+
+    def get(self, key: str) -> int:
+        """Returns the count of a counter, 0 if it does not exist or has expired."""
+        row = self._connection().execute(
+            "SELECT count FROM Limits WHERE key = ? AND expiry > ?;", (key, time.time())
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    def get_expiry(self, key: str) -> float:
+        """Returns the time at which the window of a counter ends, now if it does not exist."""
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT expiry FROM Limits WHERE key = ? AND expiry > ?;", (key, now)
+        ).fetchone()
+        return now if row is None else row[0]
+
+    def check(self) -> bool:
+        """Returns whether the database can be queried."""
+        try:
+            self._connection().execute("SELECT 1;").fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+    def reset(self) -> int:
+        """Removes all counters. Returns the number removed."""
+        return self._connection().execute("DELETE FROM Limits;").rowcount
+
+    def clear(self, key: str) -> None:
+        """Removes a counter."""
+        self._connection().execute("DELETE FROM Limits WHERE key = ?;", (key,))
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Removes expired counters, and the counters expiring soonest beyond max_keys. Returns the number removed.
+
+        params:
+            now (optional): The current time, defaults to time.time().
+
+        """
+        now = time.time() if now is None else now
+        if not self._sweep_lock.acquire(blocking=False):
+            # Another thread of this process is sweeping already
+            return 0
+        try:
+            self._next_sweep = now + self.sweep_interval
+            conn = self._connection()
+            removed = conn.execute("DELETE FROM Limits WHERE expiry <= ?;", (now,)).rowcount
+            removed += conn.execute(
+                """
+                DELETE FROM Limits WHERE key IN (
+                  SELECT key FROM Limits ORDER BY expiry LIMIT max((SELECT COUNT(*) FROM Limits) - ?, 0)
+                );
+                """,
+                (self.max_keys,),
+            ).rowcount
+            return removed
+        finally:
+            self._sweep_lock.release()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the connection of the current thread, opening it on first use."""
+        if os.getpid() != self._pid:
+            # Connections inherited from a parent process must not be used after a fork
+            self._pid = os.getpid()
+            self._local = threading.local()
+            self._sweep_lock = threading.Lock()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit, every statement is a transaction of its own
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL;")
+            conn.execute("PRAGMA synchronous = OFF;")
+            self._local.conn = conn
+        return conn
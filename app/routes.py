@@ -4,12 +4,17 @@ This file contains the routes for the application. It is imported by the app pac
 It also contains the SQL queries used for communicating with the database.
 """
 
-from pathlib import Path
-from flask import flash, redirect, make_response, render_template, send_from_directory, url_for, session
+import hashlib
+import time
+
+from flask import flash, get_flashed_messages, jsonify, redirect, make_response, render_template, request, stream_with_context, url_for, session
 from flask_login import login_required, logout_user, current_user
-from app import app, sqlite, bcrypt, check_username_password, allowed_file
+from flask_wtf.csrf import generate_csrf
+from app import app, sqlite, hasher, limiter, upload_store, assets, image_processor, check_username_password, allowed_file
+from app.database import decode_cursor, encode_cursor
 from app.forms import CommentsForm, FriendsForm, IndexForm, PostForm, ProfileForm
-from werkzeug.utils import secure_filename
+from app.passwords import HasherBusyError
+from app.uploads import UploadTooLargeError
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -24,8 +29,7 @@ def index():
     """
     # Check if the user is already logged in
     if current_user.is_authenticated:
-        username = sqlite.query_userid(current_user.get_id())["username"]
-        return redirect(url_for("stream", username=username))
+        return redirect(url_for("stream", username=current_user.username))
     index_form = IndexForm()
     login_form = index_form.login
     register_form = index_form.register
@@ -42,7 +46,7 @@ def index():
         # Check if user exists
         user = {
             'username': register_form.username.data,
-            'password': bcrypt.generate_password_hash(register_form.password.data),
+            'password': hasher.hash_password(register_form.password.data),
             'first_name': register_form.first_name.data,
             'last_name': register_form.last_name.data,
         }
@@ -57,6 +61,113 @@ def index():
         return make_response(render_template("index.html", title="Welcome", form=index_form), 400)
     return make_response(render_template("index.html", title="Welcome", form=index_form))
 
+@app.errorhandler(HasherBusyError)
+def hasher_busy(error):
+    """Answers with 503 (Service Unavailable) when too many passwords are being hashed at once."""
+    flash("The server is busy, please try again in a moment.", category="warning")
+    response = make_response(render_template("index.html", title="Welcome", form=IndexForm()), 503)
+    response.headers["Retry-After"] = "1"
+    return response
+
+@app.errorhandler(413)
+def request_too_large(error):
+    """Answers with 413 (Request Entity Too Large) when a request is larger than MAX_CONTENT_LENGTH."""
+    flash("The request is too large!", category="warning")
+    return make_response(render_template("index.html", title="Welcome", form=IndexForm()), 413)
+
+# Output by base.html after the navbar, where streamed pages send their first chunk
+STREAM_FLUSH = "\x00stream-flush\x00"
+
+def _buffered(events, size: int):
+    """Joins the template events into chunks of size events, and ends a chunk early at STREAM_FLUSH."""
+    buffer = []
+    for event in events:
+        if event == STREAM_FLUSH:
+            if buffer:
+                yield "".join(buffer)
+                buffer = []
+            continue
+        buffer.append(event)
+        if len(buffer) >= size:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+
+def render_streamed(template_name: str, status: int = 200, **context):
+    """Renders a template as a streamed response, sending the page in chunks while it is rendered.
+
+    The head and navbar are sent as the first chunk, before the posts or comments of the page are rendered.
+    The flashed messages are read before streaming starts, as the session cannot change once the headers are sent.
+    """
+    get_flashed_messages()
+    context["stream_flush"] = STREAM_FLUSH
+    app.update_template_context(context)
+    events = app.jinja_env.get_or_select_template(template_name).generate(context)
+    return make_response(stream_with_context(_buffered(events, app.config["TEMPLATE_STREAM_BUFFER"])), status)
+
+_templates_stamp = None
+
+def templates_stamp() -> str:
+    """Hashes the templates and the asset manifest once, so ETags change when a new version is deployed."""
+    global _templates_stamp
+    if _templates_stamp is None:
+        digest = hashlib.sha256(repr(sorted(assets.manifest.items())).encode())
+        for name in sorted(app.jinja_env.list_templates()):
+            digest.update(name.encode())
+            digest.update(app.jinja_env.loader.get_source(app.jinja_env, name)[0].encode())
+        _templates_stamp = digest.hexdigest()
+    return _templates_stamp
+
+def page_etag(version):
+    """Computes the ETag of a page from its version stamps, or None if the page must not be answered with 304.
+
+    The ETag covers the viewer, the URL and the CSRF token of the session. The token is generated first,
+    as the page would store it in the session while rendering. The CSRF token embedded in the page
+    expires, so the ETag also changes every half WTF_CSRF_TIME_LIMIT. Pages with flashed messages are
+    never cached, as the messages are shown only once.
+    """
+    if version is None or request.method != "GET" or session.get("_flashes"):
+        return None
+    generate_csrf()
+    time_limit = app.config.get("WTF_CSRF_TIME_LIMIT", 3600)
+    parts = (
+        templates_stamp(),
+        *version,
+        current_user.get_id(),
+        session.get("csrf_token"),
+        request.full_path,
+        int(time.time() // (time_limit / 2)) if time_limit else 0,
+    )
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+def not_modified(etag):
+    """Returns a 304 (Not Modified) response if the client's cached copy has the ETag, otherwise None."""
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    response = make_response("", 304)
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def with_etag(response, etag):
+    """Sets the weak ETag of a page, which the browser must revalidate before reusing its cached copy.
+
+    The ETag is weak as the page may be sent compressed, see ResponseCompression, and the 304 must send the same form.
+    """
+    if etag is not None and response.status_code == 200:
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def stream_page(user_id, cursor=None):
+    """Fetches one page of the stream and the cursor for the next page, or None on the last page."""
+    page_size = app.config["STREAM_PAGE_SIZE"]
+    posts = sqlite.query_posts(user_id, cursor=cursor, limit=page_size + 1)
+    if len(posts) > page_size:
+        return posts[:page_size], encode_cursor(posts[page_size - 1])
+    return posts, None
+
 @app.route("/stream/<string:username>", methods=["GET", "POST"])
 @login_required
 def stream(username: str):
@@ -64,31 +175,41 @@ def stream(username: str):
 
     If a form was submitted, it reads the form data and inserts a new post into the database.
 
-    Otherwise, it reads the username from the URL and displays all posts from the user and their friends.
+    Otherwise, it reads the username from the URL and displays a page of posts from the user and their friends.
+    The page is selected by the optional 'before' cursor in the query string.
     """
-    if not sqlite.check_user_exists(username):
+    # A refresh of an unchanged stream costs a single indexed lookup
+    etag = page_etag(sqlite.query_page_version("stream", username))
+    if (response := not_modified(etag)) is not None:
+        return response
+    stream_user = sqlite.resolve_user(username)
+    if stream_user is None:
         flash("User does not exist!", category="warning")
         # Redirect user to the index page
         return redirect(url_for("index"))
     post_form = PostForm()
-    stream_user_id = sqlite.query_username(username)["id"]
-    posts = sqlite.query_posts(stream_user_id)
+    stream_user_id = stream_user["id"]
+    posts, next_cursor = stream_page(stream_user_id, decode_cursor(request.args.get("before")))
     if post_form.validate_on_submit():
         filename = ""
         if post_form.image.data:
-            if allowed_file(post_form.image.data.filename):
-                filename = secure_filename(post_form.image.data.filename)
-                path = Path(app.instance_path) / app.config["UPLOADS_FOLDER_PATH"] / filename 
-                post_form.image.data.save(path)
-            else:
+            if not allowed_file(post_form.image.data.filename):
                 flash("Invalid file type!", category="warning")
-                return make_response(render_template("stream.html", title="Stream", username=username, form=post_form, posts=posts), 400)
-        sqlite.insert_post(current_user.get_id(), post_form.content.data, filename)
+                return render_streamed("stream.html", 400, title="Stream", username=username, form=post_form, posts=posts, next_cursor=next_cursor)
+            try:
+                # Stored under a name derived from its content, identical images share one file
+                filename = upload_store.save(post_form.image.data)
+            except UploadTooLargeError:
+                flash("The image is too large!", category="warning")
+                return render_streamed("stream.html", 413, title="Stream", username=username, form=post_form, posts=posts, next_cursor=next_cursor)
+        post_id = sqlite.insert_post(current_user.get_id(), post_form.content.data, filename)
+        if filename:
+            image_processor.submit(post_id, filename)
         flash("Post successfully created!", category="success")
         # Update the posts
-        posts = sqlite.query_posts(stream_user_id)
-        return make_response(render_template("stream.html", title="Stream", username=username, form=post_form, posts=posts), 201)
-    return make_response(render_template("stream.html", title="Stream", username=username, form=post_form, posts=posts))
+        posts, next_cursor = stream_page(stream_user_id)
+        return render_streamed("stream.html", 201, title="Stream", username=username, form=post_form, posts=posts, next_cursor=next_cursor)
+    return with_etag(render_streamed("stream.html", title="Stream", username=username, form=post_form, posts=posts, next_cursor=next_cursor), etag)
 
 @app.route("/comments/<string:username>/<int:post_id>", methods=["GET", "POST"])
 @login_required
@@ -97,17 +218,21 @@ def comments(username: str, post_id: int):
     If a form was submitted, it reads the form data and inserts a new comment into the database.
     Otherwise, it reads the username and post id from the URL and displays all comments for the post.
     """
-    if not sqlite.check_user_exists(username) or not sqlite.check_post_exists(post_id):
+    etag = page_etag(sqlite.query_version(f"comments:{post_id}"))
+    if (response := not_modified(etag)) is not None:
+        return response
+    post = sqlite.query_post(post_id)
+    if sqlite.resolve_user(username) is None or post is None:
         flash("User or post does not exist!", category="warning")
         return redirect(url_for("index"))
-    post = sqlite.query_post(post_id)
-    comments = sqlite.query_comments(post_id)
     comments_form = CommentsForm()
     if comments_form.validate_on_submit():
         sqlite.insert_comment(post_id, comments_form.comment.data, current_user.get_id())
-        comments = sqlite.query_comments(post_id)
-        return make_response(render_template("comments.html", title="Comments", username=username, form=comments_form, post=post, comments=comments), 201)
-    return make_response(render_template("comments.html", title="Comments", username=username, form=comments_form, post=post, comments=comments))
+        # The comments are rendered while they are fetched
+        comments = sqlite.iter_comments(post_id)
+        return render_streamed("comments.html", 201, title="Comments", username=username, form=comments_form, post=post, comments=comments)
+    comments = sqlite.iter_comments(post_id)
+    return with_etag(render_streamed("comments.html", title="Comments", username=username, form=comments_form, post=post, comments=comments), etag)
 
 @app.route("/logout")
 @login_required
@@ -124,11 +249,15 @@ def friends(username: str):
     If a form was submitted, it reads the form data and inserts a new friend into the database.
     Otherwise, it reads the username from the URL and displays all friends of the user.
     """
-    if not sqlite.check_user_exists(username):
+    etag = page_etag(sqlite.query_page_version("friends", username))
+    if (response := not_modified(etag)) is not None:
+        return response
+    friends_user = sqlite.resolve_user(username)
+    if friends_user is None:
         flash("User does not exist!", category="warning")
         return redirect(url_for("index"))
     friends_form = FriendsForm()
-    friends_user_id = str(sqlite.query_username(username)["id"])
+    friends_user_id = str(friends_user["id"])
     friends = sqlite.query_friends(friends_user_id)
     if friends_form.validate_on_submit():
         # Check if the current user is the owner of the friendslist being edited
@@ -136,28 +265,24 @@ def friends(username: str):
             flash('You can only add friends to your own friendslist.', category="warning")
             return make_response(render_template("friends.html", title="Friends", username=username, friends=friends, form=friends_form), 401)
         # Find the friend to be added in the database
-        friend = sqlite.query_username(friends_form.username.data)
+        friend = sqlite.resolve_user(friends_form.username.data)
         if friend is None:
             flash("User does not exist!", category="warning")
             return make_response(render_template("friends.html", title="Friends", username=username,friends=friends, form=friends_form), 404)
         elif str(friend["id"]) == current_user.get_id():
             flash("You cannot be friends with yourself!", category="warning")
             return make_response(render_template("friends.html", title="Friends", username=username, friends=friends, form=friends_form), 400)
-        # Fetch the friends in the friendlist
-        friends = sqlite.query_friends(friends_user_id)
-        # Check if the friend is already in the friendlist
-        for f in friends:
-            if friend["id"] == f["id"]:
-                flash("You are already friends with this user!", category="warning")
-                return make_response(render_template("friends.html", title="Friends", username=username, friends=friends, form=friends_form), 400)
+        # Check if the friend is already in the friendlist, whichever of the two added the friendship
+        if sqlite.check_friend_connection(friends_user_id, friend["id"]):
+            flash("You are already friends with this user!", category="warning")
+            return make_response(render_template("friends.html", title="Friends", username=username, friends=friends, form=friends_form), 400)
         # All checks passed, add the friend to the friendlist
         sqlite.insert_friend(current_user.get_id(), friend["id"])
         flash("Friend successfully added!", category="success") 
         # Refresh the friends list
         friends = sqlite.query_friends(friends_user_id)
         return make_response(render_template("friends.html", title="Friends", username=username, friends=friends, form=friends_form), 201)
-    return make_response(render_template("friends.html", title="Friends", username=username, friends=friends, form=friends_form)
-    )
+    return with_etag(make_response(render_template("friends.html", title="Friends", username=username, friends=friends, form=friends_form)), etag)
 
 @app.route("/profile/<string:username>", methods=["GET", "POST"])
 @login_required
@@ -166,11 +291,14 @@ def profile(username: str):
     If a form was submitted, it reads the form data and updates the user's profile in the database.
     Otherwise, it reads the username from the URL and displays the user's profile.
     """
-    if not sqlite.check_user_exists(username):
+    etag = page_etag(sqlite.query_page_version("profile", username))
+    if (response := not_modified(etag)) is not None:
+        return response
+    user = sqlite.query_userprofile(username)
+    if user is None:
         flash("User does not exist!", category="warning")
         return redirect(url_for("index"))
     profile_form = ProfileForm()
-    user = sqlite.query_userprofile(username)
     if profile_form.validate_on_submit():
         # Check if the current user is the same as the user whose profile is being updated
         if current_user.get_id() != str(user["id"]):
@@ -188,14 +316,26 @@ def profile(username: str):
         # Update the profile
         user = sqlite.query_userprofile(username)
         return make_response(render_template("profile.html", title="Profile", username=username, user=user, form=profile_form), 201)
-    return make_response(render_template("profile.html", title="Profile", username=username, user=user, form=profile_form))
+    return with_etag(make_response(render_template("profile.html", title="Profile", username=username, user=user, form=profile_form)), etag)
 
-@app.route("/uploads/<string:filename>")
+@app.route("/uploads/<path:filename>")
 @login_required
 def uploads(filename):
-    """Provides an endpoint for serving uploaded files."""
+    """Provides an endpoint for serving uploaded files, with caching headers for content-addressed files."""
     # Check if file exists
-    if not Path(app.instance_path) / app.config["UPLOADS_FOLDER_PATH"] / filename:
+    if upload_store.path(filename) is None:
         flash("File does not exist!", category="warning")
         return make_response(render_template("index.html", title="Welcome", form=IndexForm()), 404)
-    return send_from_directory(Path(app.instance_path) / app.config["UPLOADS_FOLDER_PATH"], filename)
+    return upload_store.send(filename)
+
+@app.route("/readyz")
+@limiter.exempt
+def readyz():
+    """Tells load balancers whether this worker can serve requests, answering 503 (Service Unavailable) if not."""
+    checks = {"database": "ok" if sqlite.check() else "unavailable"}
+    if limiter.enabled:
+        checks["ratelimit"] = "ok" if limiter.storage.check() else "unavailable"
+    ready = all(state == "ok" for state in checks.values())
+    response = make_response(jsonify(status="ready" if ready else "unavailable", checks=checks), 200 if ready else 503)
+    response.headers["Cache-Control"] = "no-store"
+    return response
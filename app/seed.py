@@ -0,0 +1,174 @@
+"""Provides bulk generation of synthetic users, friendships, posts and comments.
+
+The generated data is meant for performance testing. It is inserted with executemany
+in large transactions, bypassing the per-row commits of the SQLite3 extension methods.
+It is used by the 'flask seed' command.
+
+Example:
+    from app import app, sqlite
+    from app.seed import seed_database
+
+    with app.app_context():
+        seed_database(sqlite, users=1000, posts=10000, seed=42)
+"""
+
+from __future__ import annotations
+
+import bisect
+import itertools
+import random
+import time
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from app.database import SQLite3
+
+BATCH_SIZE = 50_000
+
+
+def seed_database(
+    sqlite: SQLite3,
+    *,
+    users: int,
+    friends: int = 20,
+    posts: int = 0,
+    comments: int = 0,
+    seed: int = 0,
+    password_hash: Optional[Callable[[str], Any]] = None,
+    reuse_hash: bool = True,
+    days: int = 365,
+    until: Optional[datetime] = None,
+    prefix: str = "user",
+    progress: Optional[Callable[[str, int, float], None]] = None,
+) -> dict[str, tuple[int, float]]:
+    """Generates a synthetic social graph and inserts it into the database.
+
+    params:
+        sqlite: The database extension to insert into, must be called inside an app context.
+        users: The number of users to create.
+        friends (optional): The average number of friends per user.
+        posts (optional): The number of posts to create.
+        comments (optional): The number of comments to create.
+        seed (optional): The seed of the random generator, the same seed creates the same data.
+        password_hash (optional): A function that hashes a password, defaults to storing the plain text password.
+        reuse_hash (optional): Whether to hash the password once and store the same hash for every user.
+        days (optional): The number of days before 'until' the posts are spread over.
+        until (optional): The time of the newest possible post, defaults to today at midnight.
+        prefix (optional): The prefix of the generated usernames, which are '<prefix><number>'.
+        progress (optional): Called with the table name, row count and seconds after each table is done.
+
+    Friendships follow a power law through preferential attachment: every new user befriends
+    existing users with a probability proportional to how many friends they already have.
+    Active users post more, posts are skewed towards recent times and comments towards
+    popular posts. Returns the number of rows and seconds spent per table.
+    """
+    rng = random.Random(seed)
+    until = until or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    conn = sqlite.connection
+    first_user = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM Users;").fetchone()[0] or 0) + 1
+    first_post = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM Posts;").fetchone()[0] or 0) + 1
+    user_ids = range(first_user, first_user + users)
+    results: dict[str, tuple[int, float]] = {}
+
+    def insert(table: str, statement: str, rows: Iterable[tuple]) -> None:
+        start = time.perf_counter()
+        count = 0
+        for batch in _batched(rows, BATCH_SIZE):
+            conn.executemany(statement, batch)
+            count += len(batch)
+        conn.commit()
+        results[table] = (count, time.perf_counter() - start)
+        if progress is not None:
+            progress(table, count, results[table][1])
+
+    # Users, hashing the password only once unless asked otherwise
+    def user_rows() -> Iterator[tuple]:
+        shared = password_hash("password") if password_hash and reuse_hash else None
+        for user_id in user_ids:
+            password = f"password{user_id}"
+            hashed = shared if shared is not None else (password_hash(password) if password_hash else password)
+            yield user_id, f"{prefix}{user_id}", hashed, f"First{user_id}", f"Last{user_id}"
+
+    insert(
+        "Users",
+        "INSERT INTO Users (id, username, password, first_name, last_name) VALUES (?, ?, ?, ?, ?);",
+        user_rows(),
+    )
+
+    # Friendships by preferential attachment, each edge is stored once and counts for both users
+    edges_per_user = friends // 2
+    degree_weighted: list[int] = []
+    degrees = [0] * users
+    edges: list[tuple[int, int]] = []
+    # An average below two friends gives no friendships
+    if edges_per_user:
+        for index, user_id in enumerate(user_ids):
+            targets = set()
+            while len(targets) < min(edges_per_user, index):
+                if degree_weighted and rng.random() < 0.9:
+                    targets.add(rng.choice(degree_weighted))
+                else:
+                    targets.add(user_ids[rng.randrange(index)])
+            for target in targets:
+                edges.append((user_id, target))
+                degree_weighted.extend((user_id, target))
+                degrees[index] += 1
+                degrees[target - first_user] += 1
+    del degree_weighted
+    insert("Friends", "INSERT OR IGNORE INTO Friends (u_id, f_id) VALUES (?, ?);", edges)
+    del edges
+
+    # Posts, authors weighted by their number of friends and times skewed towards the present
+    span = days * 86400
+    cumulative = list(itertools.accumulate(degree + 1 for degree in degrees))
+    post_ages: list[int] = []
+
+    def post_rows() -> Iterator[tuple]:
+        for post_id in range(first_post, first_post + posts):
+            author = user_ids[bisect.bisect_left(cumulative, rng.random() * cumulative[-1])]
+            age = int(min(rng.expovariate(3 / span), span))
+            post_ages.append(age)
+            yield post_id, author, f"Post {post_id} by {prefix}{author}", "", _timestamp(until, age)
+
+    insert(
+        "Posts",
+        "INSERT INTO Posts (id, u_id, content, image, creation_time) VALUES (?, ?, ?, ?, ?);",
+        post_rows(),
+    )
+
+    # Comments, skewed towards a small set of popular posts and written after the post
+    def comment_rows() -> Iterator[tuple]:
+        for _ in range(comments):
+            index = int(posts * rng.random() ** 3)
+            age = max(post_ages[index] - rng.randrange(1, 86400), 0)
+            commenter = user_ids[rng.randrange(users)]
+            yield first_post + index, commenter, f"Comment by {prefix}{commenter}", _timestamp(until, age)
+
+    if posts:
+        insert(
+            "Comments",
+            "INSERT INTO Comments (p_id, u_id, comment, creation_time) VALUES (?, ?, ?, ?);",
+            comment_rows(),
+        )
+
+    # Derived data: comment counters and materialized timelines, reported together as Timeline
+    start = time.perf_counter()
+    sqlite.repair_comment_counts()
+    timeline_rows = sqlite.rebuild_timelines() if sqlite.feed_strategy == "write" else 0
+    results["Timeline"] = (timeline_rows, time.perf_counter() - start)
+    if progress is not None:
+        progress("Timeline", timeline_rows, results["Timeline"][1])
+    return results
+
+
+def _timestamp(until: datetime, age: int) -> str:
+    """Formats the time age seconds before until like SQLite's CURRENT_TIMESTAMP."""
+    return (until - timedelta(seconds=age)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _batched(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    """Splits rows into lists of at most size rows."""
+    iterator = iter(rows)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
@@ -0,0 +1,112 @@
+"""Provides the production server for the Social Insecurity application.
+
+'flask serve' runs the application with gunicorn, a master process that forks SERVER_WORKERS
+worker processes with SERVER_THREADS threads each. With --asgi the workers serve app/asgi.py.
+
+Example:
+    from app import app
+    from app.server import serve
+
+    serve(app, workers=4, threads=8)
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from flask import Flask
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # pragma: no cover - gunicorn is optional
+    BaseApplication = None
+
+logger = logging.getLogger(__name__)
+
+#: Gunicorn settings and the config keys they are read from
+SETTINGS = {
+    "bind": "SERVER_BIND",
+    "workers": "SERVER_WORKERS",
+    "threads": "SERVER_THREADS",
+    "timeout": "SERVER_TIMEOUT",
+    "graceful_timeout": "SERVER_GRACEFUL_TIMEOUT",
+    "keepalive": "SERVER_KEEPALIVE",
+    "max_requests": "SERVER_MAX_REQUESTS",
+    "max_requests_jitter": "SERVER_MAX_REQUESTS_JITTER",
+    "backlog": "SERVER_BACKLOG",
+}
+
+
+def server_options(app: Flask, *, asgi: bool = False, **overrides: Any) -> dict[str, Any]:
+    """Returns the gunicorn settings from the SERVER_* config, updated with the overrides that are not None."""
+    options = {setting: app.config[key] for setting, key in SETTINGS.items() if app.config.get(key) is not None}
+    options.update({setting: value for setting, value in overrides.items() if value is not None})
+    options.update(
+        {
+            # Import the application in the master, so the workers share its memory and start instantly
+            "preload_app": True,
+            # A thread pool per worker, even with one thread, so keep-alive connections do not block a worker.
+            # ASGI workers serve the connections from an event loop and run the requests on ASGI_THREADS threads.
+            "worker_class": app.config.get("SERVER_ASGI_WORKER_CLASS", "uvicorn.workers.UvicornWorker") if asgi else "gthread",
+            "pre_fork": pre_fork,
+            "post_fork": post_fork,
+            "worker_exit": worker_exit,
+        }
+    )
+    return options
+
+
+def pre_fork(server: Any, worker: Any) -> None:
+    """Closes the database connections of the master, the workers must not share them."""
+    from app import sqlite
+
+    sqlite.pool.dispose()
+
+
+def post_fork(server: Any, worker: Any) -> None:
+    """Logs the start of a worker."""
+    logger.info("Worker %s started", worker.pid)
+
+
+def worker_exit(server: Any, worker: Any) -> None:
+    """Finishes the background work of a worker that is stopped or recycled."""
+    from app import hasher, image_processor, sqlite
+
+    image_processor.close()
+    hasher.close()
+    sqlite.close()
+
+
+if BaseApplication is not None:
+
+    class ProductionServer(BaseApplication):
+        """Provides a gunicorn application serving a WSGI or ASGI application with the given settings."""
+
+        def __init__(self, app: Any, options: dict[str, Any]) -> None:
+            self.application = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self) -> None:
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self) -> Any:
+            return self.application
+
+
+def available() -> bool:
+    """Returns whether gunicorn is installed, which the production server requires."""
+    return BaseApplication is not None
+
+
+def serve(app: Flask, *, asgi: bool = False, **overrides: Any) -> None:
+    """Runs the application with gunicorn until the master is stopped, overrides replace the SERVER_* config."""
+    if not available():
+        raise RuntimeError("The production server requires gunicorn, install it with 'pdm install -G production'")
+    application = app
+    if asgi:
+        from app.asgi import application
+    ProductionServer(application, server_options(app, asgi=asgi, **overrides)).run()
+
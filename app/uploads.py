@@ -0,0 +1,151 @@
+"""Provides content-addressed storage for uploaded images.
+
+Every upload is streamed to disk in chunks while its SHA-256 hash is computed, and then
+stored under a name derived from the hash, e.g. 'ab/cd/abcd1234...png'. The two levels
+of two-character directories keep every directory small. Uploading the same image again
+stores nothing new and returns the name of the existing file.
+
+Because a stored file never changes, it is served with its hash as a strong ETag and may be
+cached by the browser for good. Serving can be handed to a front proxy with UPLOADS_SENDFILE.
+
+Example:
+    from flask import Flask
+    from app.uploads import UploadStore
+
+    app = Flask(__name__)
+    upload_store = UploadStore(app)
+
+    # In a request
+    name = upload_store.save(request.files["image"])
+    response = upload_store.send(name)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from flask import Flask, Response, current_app, request, send_file
+from werkzeug.datastructures import FileStorage
+from werkzeug.security import safe_join
+
+# Names of files stored by UploadStore.save and their resized variants, the stem is derived from the content
+CONTENT_ADDRESSED_NAME = re.compile(r"[0-9a-f]{2}/[0-9a-f]{2}/(?P<stem>[0-9a-f]{64}(?:-\d+)?)\.\w+")
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload is larger than UPLOAD_MAX_SIZE."""
+
+
+class UploadStore:
+    """Provides content-addressed, sharded storage of uploads in the uploads folder for Flask."""
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        """Initializes the extension.
+
+        params:
+            app (optional): The Flask application to initialize the extension with.
+
+        """
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Initializes the extension with the Flask application.
+
+        params:
+            app: The Flask application to initialize the extension with.
+
+        """
+        self.root = Path(app.instance_path) / app.config.setdefault("UPLOADS_FOLDER_PATH", "uploads")
+        self.max_size = app.config.setdefault("UPLOAD_MAX_SIZE", 8 * 1024 * 1024)
+        self.chunk_size = app.config.setdefault("UPLOAD_CHUNK_SIZE", 64 * 1024)
+        self.max_age = app.config.setdefault("UPLOADS_MAX_AGE", 365 * 24 * 3600)
+        self.sendfile = app.config.setdefault("UPLOADS_SENDFILE", None)
+        if self.sendfile not in (None, "x-accel-redirect", "x-sendfile"):
+            raise ValueError(f"Unknown UPLOADS_SENDFILE {self.sendfile!r}, expected 'x-accel-redirect' or 'x-sendfile'")
+        self.accel_prefix = app.config.setdefault("UPLOADS_ACCEL_PREFIX", "/internal-uploads").rstrip("/")
+        app.extensions["upload_store"] = self
+
+    def save(self, file: FileStorage) -> str:
+        """Stores an uploaded file and returns its name relative to the uploads folder.
+
+        params:
+            file: The uploaded file, its extension is kept in lower case.
+
+        The file is copied chunk by chunk, so it is never held in memory as a whole, and
+        the copy stops with UploadTooLargeError as soon as it exceeds UPLOAD_MAX_SIZE.
+        """
+        extension = Path(file.filename or "").suffix.lower()
+        self.root.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.root, prefix=".upload-", delete=False) as tmp:
+            try:
+                while chunk := file.stream.read(self.chunk_size):
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise UploadTooLargeError(f"Uploads may be at most {self.max_size} bytes")
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            except BaseException:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+        hexdigest = digest.hexdigest()
+        name = f"{hexdigest[:2]}/{hexdigest[2:4]}/{hexdigest}{extension}"
+        path = self.root / name
+        if path.exists():
+            # The same content is stored already
+            os.unlink(tmp.name)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp.name, path)
+        return name
+
+    def path(self, name: str) -> Optional[Path]:
+        """Returns the path of a stored file, or None if the name is unsafe or the file does not exist.
+
+        params:
+            name: The name returned by save.
+
+        """
+        path = safe_join(str(self.root), name)
+        if path is None or not os.path.isfile(path):
+            return None
+        return Path(path)
+
+    def send(self, name: str) -> Response:
+        """Returns a response for a stored file, which must exist. Must be called inside a request.
+
+        params:
+            name: The name returned by save, or the name of a variant or an older upload.
+
+        Content-addressed files get their hash as a strong ETag and may be cached privately
+        for UPLOADS_MAX_AGE seconds without revalidation. Other files must be revalidated.
+        Conditional and Range requests are answered with 304 and 206. With UPLOADS_SENDFILE
+        only the headers are sent, and the front proxy transfers the file itself.
+        """
+        path = self.path(name)
+        match = CONTENT_ADDRESSED_NAME.fullmatch(name)
+        if self.sendfile is None:
+            response = send_file(path, etag=match["stem"] if match else True, conditional=True)
+        else:
+            response = current_app.response_class(mimetype=mimetypes.guess_type(name)[0] or "application/octet-stream")
+            if self.sendfile == "x-accel-redirect":
+                response.headers["X-Accel-Redirect"] = f"{self.accel_prefix}/{name}"
+            else:
+                response.headers["X-Sendfile"] = str(path.resolve())
+            if match:
+                response.set_etag(match["stem"])
+            response.make_conditional(request)
+        if match:
+            response.headers["Cache-Control"] = f"private, max-age={self.max_age}, immutable"
+        else:
+            response.headers["Cache-Control"] = "private, no-cache"
+        return response
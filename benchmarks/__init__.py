@@ -0,0 +1,5 @@
+"""Provides the performance benchmarks for the Social Insecurity application.
+
+The benchmarks are run as modules from the project root folder, e.g.
+'pdm run python -m benchmarks.bench_routes'. They are not collected by pytest.
+"""
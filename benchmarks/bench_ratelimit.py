@@ -0,0 +1,123 @@
+"""Benchmarks the cost of one rate-limit check with the shared SQLite storage and the in-process memory storage.
+
+Each check is a hit of the fixed window strategy, as Flask-Limiter performs it for every
+request. Checks are spread over --keys client addresses. The benchmark then runs the same
+checks from several processes against one key of the SQLite storage, reports the latency
+under contention and verifies that no increment was lost. Latencies are in microseconds.
+
+Example:
+    pdm run python -m benchmarks.bench_ratelimit --checks 20000 --processes 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+from app.ratelimit import SQLiteStorage  # noqa: F401 - registers the 'sqlite' storage scheme
+from benchmarks.common import save_results, summarize
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checks", type=int, default=20000, help="Measured checks per storage and process.")
+    parser.add_argument("--keys", type=int, default=1000, help="Number of distinct client keys.")
+    parser.add_argument("--processes", type=int, default=4, help="Processes checking the same key concurrently.")
+    parser.add_argument("--output", type=Path, default=None, help="Results file [default: .bench/ratelimit-<time>.json]")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    results: dict[str, Any] = {
+        "meta": {
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "checks": args.checks,
+            "keys": args.keys,
+            "processes": args.processes,
+        },
+        "cases": {},
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        uri = f"sqlite:///{Path(folder) / 'ratelimit.db'}"
+        for name, storage_uri in (("memory", "memory://"), ("sqlite", uri)):
+            results["cases"][name] = measure(storage_uri, args.checks, args.keys)
+        with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+            samples = pool.starmap(check_one_key, [(uri, args.checks)] * args.processes)
+        start, end = min(sample[0] for sample in samples), max(sample[1] for sample in samples)
+        latencies = [latency for sample in samples for latency in sample[2]]
+        count = storage_from_string(uri).get(parse("1000000000 per hour").key_for("contended", "key"))
+        results["cases"][f"sqlite {args.processes} processes one key"] = {
+            **microseconds(summarize(latencies, end - start)),
+            "expected_count": args.checks * args.processes,
+            "count": count,
+        }
+
+    print(f"{'case':<32}{'checks':>9}{'checks/s':>11}{'p50 us':>9}{'p95 us':>9}{'p99 us':>9}")
+    for name, case in results["cases"].items():
+        print(
+            f"{name:<32}{case['requests']:>9}{case['throughput_rps']:>11.0f}"
+            f"{case['p50_us']:>9.1f}{case['p95_us']:>9.1f}{case['p99_us']:>9.1f}"
+        )
+    contended = results["cases"][f"sqlite {args.processes} processes one key"]
+    output = args.output or Path(".bench") / f"ratelimit-{datetime.now():%Y%m%d-%H%M%S}.json"
+    save_results(output, results)
+    print(f"Results written to {output}")
+    if contended["count"] != contended["expected_count"]:
+        print(f"LOST INCREMENTS counted {contended['count']} of {contended['expected_count']}")
+        return 1
+    return 0
+
+
+def measure(storage_uri: str, checks: int, keys: int) -> dict[str, Any]:
+    """Hits a limit repeatedly for keys in turn and summarizes the latency of each check."""
+    limiter = FixedWindowRateLimiter(storage_from_string(storage_uri))
+    limit = parse("1000000 per hour")
+    for key in range(keys):
+        limiter.hit(limit, "warmup", str(key))
+    samples = []
+    start = time.perf_counter()
+    for check in range(checks):
+        check_start = time.perf_counter()
+        limiter.hit(limit, "client", str(check % keys))
+        samples.append(time.perf_counter() - check_start)
+    return microseconds(summarize(samples, time.perf_counter() - start))
+
+
+def check_one_key(storage_uri: str, checks: int) -> tuple[float, float, list[float]]:
+    """Hits one limit shared with the other processes. Returns the start, the end and the check latencies."""
+    limiter = FixedWindowRateLimiter(storage_from_string(storage_uri))
+    limit = parse("1000000000 per hour")
+    samples = []
+    start = time.time()
+    for _ in range(checks):
+        check_start = time.perf_counter()
+        limiter.hit(limit, "contended", "key")
+        samples.append(time.perf_counter() - check_start)
+    return start, time.time(), samples
+
+
+def microseconds(summary: dict[str, Any]) -> dict[str, Any]:
+    """Converts the millisecond latencies of a summary to microseconds."""
+    return {
+        (f"{key[:-3]}_us" if key.endswith("_ms") else key): (value * 1000 if key.endswith("_ms") else value)
+        for key, value in summary.items()
+    }
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
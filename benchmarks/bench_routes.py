@@ -0,0 +1,222 @@
+"""Benchmarks the main routes with the Flask test client over synthetic datasets of increasing size.
+
+Every dataset is generated with app.seed, cached in the work folder and reused by later runs.
+For each dataset the benchmark logs in as a user with a typical number of friends and
+requests the stream (first and second page), comments, friends and profile pages.
+It reports p50/p95/p99 latency, throughput, SQL statements and database method calls per request, and writes
+the results as JSON. With --baseline the run fails if a route got slower than the threshold.
+
+Example:
+    pdm run python -m benchmarks.bench_routes --sizes 1000,100000 --friends 10,50
+    pdm run python -m benchmarks.bench_routes --baseline bench/previous.json --threshold 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from benchmarks.common import find_regressions, save_results, summarize
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="Comma separated numbers of posts per dataset.")
+    parser.add_argument("--friends", default="10,50", help="Comma separated average numbers of friends per user.")
+    parser.add_argument("--posts-per-user", type=int, default=20, help="Posts per user, sets the number of users.")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per route and dataset.")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per route and dataset.")
+    parser.add_argument("--workdir", type=Path, default=Path(".bench"), help="Folder for the cached datasets.")
+    parser.add_argument("--output", type=Path, default=None, help="Results file [default: <workdir>/routes-<time>.json]")
+    parser.add_argument("--baseline", type=Path, default=None, help="Earlier results file to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative p95 regression.")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    args.workdir = args.workdir.resolve()
+    args.workdir.mkdir(parents=True, exist_ok=True)
+    db_path = args.workdir / "bench.db"
+    # The database path is read when the app is imported
+    os.environ["SQLITE3_DATABASE_PATH"] = str(db_path)
+    from app import app, limiter, sqlite, user_cache
+
+    app.config.update({"TESTING": True, "WTF_CSRF_ENABLED": False, "SECRET_KEY": "bench"})
+    limiter.enabled = False
+    statements = StatementCounter(sqlite.pool)
+
+    results: dict[str, Any] = {
+        "meta": {
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "feed_strategy": sqlite.feed_strategy,
+            "requests": args.requests,
+        },
+        "cases": {},
+    }
+    for posts in (int(size) for size in args.sizes.split(",")):
+        for friends in (int(count) for count in args.friends.split(",")):
+            dataset = f"posts={posts} friends={friends}"
+            print(f"# {dataset}", flush=True)
+            load_dataset(app, sqlite, args, db_path, posts=posts, friends=friends)
+            user_cache.clear()
+            with app.app_context():
+                routes = pick_routes(sqlite, friends, app.config["STREAM_PAGE_SIZE"])
+            client = app.test_client()
+            response = client.post(
+                "/",
+                data={"login-username": routes.pop("username"), "login-password": "password", "login-submit": "Sign In"},
+            )
+            assert response.status_code == 302, "Login failed"
+            for name, url in routes.items():
+                case = measure(client, sqlite, statements, url, args.warmup, args.requests)
+                results["cases"][f"{dataset} {name}"] = case
+                print(
+                    f"{name:<14}p50 {case['p50_ms']:8.2f} ms  p95 {case['p95_ms']:8.2f} ms  p99 {case['p99_ms']:8.2f} ms"
+                    f"  {case['throughput_rps']:8.1f} req/s  {case['statements_per_request']:5.1f} statements/req"
+                    f"  {case['db_calls_per_request']:5.1f} db calls/req",
+                    flush=True,
+                )
+
+    output = args.output or args.workdir / f"routes-{datetime.now():%Y%m%d-%H%M%S}.json"
+    save_results(output, results)
+    print(f"Results written to {output}")
+    if args.baseline is not None:
+        regressions = find_regressions(json.loads(args.baseline.read_text()), results, threshold=args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+def load_dataset(app, sqlite, args: argparse.Namespace, db_path: Path, *, posts: int, friends: int) -> None:
+    """Puts the dataset in place at db_path, generating and caching it the first time.
+
+    Everything cached from the previous dataset is dropped, post ids repeat across datasets.
+    """
+    from app import fragment_cache, hasher
+    from app.seed import seed_database
+
+    cached = args.workdir / f"dataset-posts{posts}-friends{friends}-ppu{args.posts_per_user}.db"
+    sqlite.pool.dispose()
+    sqlite.reset_friend_graph()
+    fragment_cache.clear()
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    if cached.exists():
+        shutil.copyfile(cached, db_path)
+        return
+    start = time.perf_counter()
+    with app.app_context():
+        sqlite.migrate()
+        seed_database(
+            sqlite,
+            users=max(posts // args.posts_per_user, 50),
+            friends=friends,
+            posts=posts,
+            comments=posts,
+            seed=0,
+            password_hash=hasher.hash_password,
+            until=datetime(2024, 1, 1),
+        )
+        sqlite.connection.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    sqlite.pool.dispose()
+    shutil.copyfile(db_path, cached)
+    print(f"Generated dataset in {time.perf_counter() - start:.1f} s", flush=True)
+
+
+def pick_routes(sqlite, friends: int, page_size: int) -> dict[str, str]:
+    """Picks a user with about the average number of friends and the URLs to benchmark for them."""
+    from app.database import encode_cursor
+
+    conn = sqlite.connection
+    user = conn.execute(
+        """
+        SELECT u.id, u.username, COUNT(*) AS degree
+        FROM (SELECT u_id AS id FROM Friends UNION ALL SELECT f_id FROM Friends) AS f JOIN Users AS u ON u.id = f.id
+        GROUP BY u.id
+        ORDER BY ABS(COUNT(*) - ?), u.id
+        LIMIT 1;
+        """,
+        (friends,),
+    ).fetchone()
+    username = user["username"]
+    post = conn.execute("SELECT id FROM Posts ORDER BY comment_count DESC, id LIMIT 1;").fetchone()
+    first_page = sqlite.query_posts(user["id"], limit=page_size)
+    routes = {
+        "username": username,
+        "stream": f"/stream/{username}",
+        "comments": f"/comments/{username}/{post['id']}",
+        "friends": f"/friends/{username}",
+        "profile": f"/profile/{username}",
+    }
+    if len(first_page) == page_size:
+        routes["stream-page-2"] = f"/stream/{username}?before={encode_cursor(first_page[-1])}"
+    return routes
+
+
+class StatementCounter:
+    """Counts the SQL statements SQLite runs on the connections the pool opens from now on.
+
+    Every statement counts, also those run by one database method or answered before in the
+    app context, and the pre-ping of a pooled connection on checkout.
+    """
+
+    def __init__(self, pool) -> None:
+        self.count = 0
+        connect = pool.connect
+
+        def traced_connect():
+            conn = connect()
+            conn.set_trace_callback(self._trace)
+            return conn
+
+        pool.dispose()
+        pool.connect = traced_connect
+
+    def _trace(self, statement: str) -> None:
+        self.count += 1
+
+
+def measure(client, sqlite, statements: StatementCounter, url: str, warmup: int, requests: int) -> dict[str, Any]:
+    """Requests a URL repeatedly and summarizes latency, throughput, SQL statements and database method calls per request.
+
+    The database method calls are the calls of the instrumented SQLite3 methods, some of which run several statements
+    and some, such as check_friend_connection, none.
+    """
+    for _ in range(warmup):
+        client.get(url)
+    calls_before = sum(method["calls"] for method in sqlite.stats.snapshot().values())
+    statements_before = statements.count
+    samples = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        request_start = time.perf_counter()
+        response = client.get(url)
+        response.get_data()
+        samples.append(time.perf_counter() - request_start)
+        assert response.status_code == 200, f"{url} returned {response.status_code}"
+    seconds = time.perf_counter() - start
+    calls = sum(method["calls"] for method in sqlite.stats.snapshot().values()) - calls_before
+    return {
+        **summarize(samples, seconds),
+        "url": url,
+        "statements_per_request": (statements.count - statements_before) / requests,
+        "db_calls_per_request": calls / requests,
+    }
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
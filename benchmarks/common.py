@@ -0,0 +1,54 @@
+"""Provides helpers shared by the benchmarks for summarizing and comparing latency samples."""
+
+from __future__ import annotations
+
+import json
+import math
+from pathlib import Path
+from typing import Any
+
+
+def percentile(samples: list[float], quantile: float) -> float:
+    """Returns the nearest-rank percentile of the samples, or 0.0 if there are none."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(quantile * len(ordered)) - 1, 0)]
+
+
+def summarize(samples: list[float], seconds: float) -> dict[str, Any]:
+    """Summarizes latency samples in seconds measured over a wall clock duration."""
+    return {
+        "requests": len(samples),
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "max_ms": max(samples, default=0.0) * 1000,
+        "mean_ms": sum(samples) / len(samples) * 1000 if samples else 0.0,
+        "throughput_rps": len(samples) / seconds if seconds else 0.0,
+    }
+
+
+def save_results(path: Path, results: dict[str, Any]) -> None:
+    """Writes benchmark results as JSON."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2, sort_keys=True))
+
+
+def find_regressions(
+    baseline: dict[str, Any], current: dict[str, Any], *, metric: str = "p95_ms", threshold: float = 0.2
+) -> list[str]:
+    """Compares two result files and describes every case whose metric got worse by more than threshold.
+
+    Both files map case names to summaries under the 'cases' key. Cases that exist in only
+    one of them are ignored.
+    """
+    regressions = []
+    for name, case in current["cases"].items():
+        before = baseline.get("cases", {}).get(name)
+        if before is None or not before.get(metric):
+            continue
+        change = case[metric] / before[metric] - 1
+        if change > threshold:
+            regressions.append(f"{name}: {metric} {before[metric]:.2f} -> {case[metric]:.2f} (+{change:.0%})")
+    return regressions
@@ -0,0 +1,381 @@
+"""Generates load against a running Social Insecurity server with scripted user journeys.
+
+Every virtual user is a thread with its own cookie jar. It registers and logs in through
+the index page and then repeatedly picks a journey: browsing the stream, posting with an
+image, commenting on a post, adding a friend or updating the profile. Forms are submitted
+like a browser would, including the CSRF token from the rendered page. Virtual users are
+started evenly over the ramp-up period. The report lists per-endpoint latency percentiles,
+error rates and requests per second.
+
+Only the standard library is used, no external services are needed. Note that the server's
+rate limits apply to the load generator as well, responses with status 429 are reported as
+rate limited. Start the server with RATELIMIT_ENABLED=0 to measure raw throughput.
+
+With --serve the load generator starts the development server itself, with rate limiting
+disabled and a temporary instance folder, so the users, posts and uploads it creates do not
+end up in the instance folder of the repository.
+
+Example:
+    pdm run python -m benchmarks.loadgen --url http://127.0.0.1:5000 --users 50 --ramp-up 10 --duration 60
+    pdm run python -m benchmarks.loadgen --serve --users 20 --duration 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import contextlib
+import http.cookiejar
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from benchmarks.common import save_results, summarize
+
+# A 1x1 transparent PNG, used when no image is given
+DEFAULT_IMAGE = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+JOURNEYS = {"browse": 5, "post": 2, "comment": 2, "friend": 1, "profile": 1}
+
+CSRF_PATTERN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+OLDER_PATTERN = re.compile(r'href="(/stream/[^"?]+\?before=[^"]+)"')
+COMMENTS_PATTERN = re.compile(r'href="(/comments/[^"/]+/\d+)"')
+ENDPOINTS = [
+    (re.compile(r"^/stream/[^/?]+\?before="), "/stream/<username>?before"),
+    (re.compile(r"^/stream/[^/?]+$"), "/stream/<username>"),
+    (re.compile(r"^/comments/[^/]+/\d+$"), "/comments/<username>/<post_id>"),
+    (re.compile(r"^/friends/[^/]+$"), "/friends/<username>"),
+    (re.compile(r"^/profile/[^/]+$"), "/profile/<username>"),
+    (re.compile(r"^/uploads/"), "/uploads/<filename>"),
+]
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="Base URL of the running server.")
+    parser.add_argument("--serve", action="store_true", help="Start a server with a temporary instance folder instead.")
+    parser.add_argument("--users", type=int, default=20, help="Number of concurrent virtual users.")
+    parser.add_argument("--ramp-up", type=float, default=10.0, help="Seconds over which the virtual users start.")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to generate load, including ramp-up.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds a virtual user pauses between journeys.")
+    parser.add_argument("--image", type=Path, default=None, help="Image to upload with posts [default: a 1x1 PNG]")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds before a request is counted as failed.")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for the journey choices.")
+    parser.add_argument("--output", type=Path, default=None, help="Write the report as JSON to this file.")
+    return parser.parse_args(argv)
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Returns redirects as responses, so every request is measured on its own."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Recorder:
+    """Collects latency samples and status codes per endpoint from all virtual users."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.samples: dict[str, list[float]] = {}
+        self.statuses: dict[str, Counter] = {}
+        self.errors: dict[str, int] = {}
+
+    def record(self, endpoint: str, seconds: float, status: int, error: bool) -> None:
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            self.statuses.setdefault(endpoint, Counter())[status] += 1
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + int(error)
+
+    def report(self, seconds: float) -> dict[str, Any]:
+        with self._lock:
+            endpoints = {}
+            for endpoint, samples in sorted(self.samples.items()):
+                statuses = self.statuses[endpoint]
+                endpoints[endpoint] = {
+                    **summarize(samples, seconds),
+                    "errors": self.errors[endpoint],
+                    "error_rate": self.errors[endpoint] / len(samples),
+                    "rate_limited": statuses.get(429, 0),
+                    "statuses": {str(status): count for status, count in sorted(statuses.items())},
+                }
+            total = sum(len(samples) for samples in self.samples.values())
+            errors = sum(self.errors.values())
+        return {
+            "requests": total,
+            "errors": errors,
+            "error_rate": errors / total if total else 0.0,
+            "throughput_rps": total / seconds if seconds else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+class VirtualUser(threading.Thread):
+    """Runs user journeys against the server until the stop event is set."""
+
+    def __init__(self, number: int, args: argparse.Namespace, run_id: str, recorder: Recorder, stop: threading.Event, image: bytes) -> None:
+        super().__init__(name=f"virtual-user-{number}", daemon=True)
+        self.username = f"load{run_id}{number}"
+        self.password = f"password-{run_id}"
+        self.args = args
+        self.run_id = run_id
+        self.recorder = recorder
+        self.stop = stop
+        self.image = image
+        self.rng = random.Random(None if args.seed is None else args.seed + number)
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect()
+        )
+
+    def run(self) -> None:
+        try:
+            if not self.sign_up():
+                return
+            journeys, weights = zip(*JOURNEYS.items())
+            while not self.stop.is_set():
+                getattr(self, f"journey_{self.rng.choices(journeys, weights)[0]}")()
+                if self.args.think_time:
+                    self.stop.wait(self.args.think_time)
+        except Exception as error:  # A broken virtual user must not stop the run
+            print(f"{self.name} stopped: {error!r}", file=sys.stderr)
+
+    # Journeys
+
+    def sign_up(self) -> bool:
+        page = self.request("GET", "/")
+        self.request("POST", "/", {
+            "csrf_token": self.csrf(page),
+            "register-first_name": "Load",
+            "register-last_name": "Test",
+            "register-username": self.username,
+            "register-password": self.password,
+            "register-confirm_password": self.password,
+            "register-submit": "Sign Up",
+        }, expected=(201,))
+        status, _ = self.request("POST", "/", {
+            "csrf_token": self.csrf(page),
+            "login-username": self.username,
+            "login-password": self.password,
+            "login-submit": "Sign In",
+        }, expected=(302,), with_status=True)
+        return status == 302
+
+    def journey_browse(self) -> None:
+        page = self.request("GET", f"/stream/{self.username}")
+        for _ in range(2):
+            older = OLDER_PATTERN.search(page)
+            if older is None:
+                break
+            page = self.request("GET", older.group(1).replace("&amp;", "&"))
+
+    def journey_post(self) -> None:
+        page = self.request("GET", f"/stream/{self.username}")
+        self.request("POST", f"/stream/{self.username}", {
+            "csrf_token": self.csrf(page),
+            "content": f"Load test post {uuid.uuid4().hex[:8]}",
+            "submit": "Post",
+        }, files={"image": ("load.png", self.image, "image/png")}, expected=(201,))
+
+    def journey_comment(self) -> None:
+        stream = self.request("GET", f"/stream/{self.username}")
+        links = COMMENTS_PATTERN.findall(stream)
+        if not links:
+            return self.journey_post()
+        link = self.rng.choice(links)
+        page = self.request("GET", link)
+        self.request("POST", link, {
+            "csrf_token": self.csrf(page),
+            "comment": f"Load test comment {uuid.uuid4().hex[:8]}",
+            "submit": "Comment",
+        }, expected=(201,))
+
+    def journey_friend(self) -> None:
+        page = self.request("GET", f"/friends/{self.username}")
+        friend = f"load{self.run_id}{self.rng.randrange(self.args.users)}"
+        if friend == self.username:
+            return
+        # Adding an existing friend again or a user that has not signed up yet is an expected outcome
+        self.request("POST", f"/friends/{self.username}", {
+            "csrf_token": self.csrf(page),
+            "username": friend,
+            "submit": "Add Friend",
+        }, expected=(201, 400, 404))
+
+    def journey_profile(self) -> None:
+        page = self.request("GET", f"/profile/{self.username}")
+        self.request("POST", f"/profile/{self.username}", {
+            "csrf_token": self.csrf(page),
+            "education": self.rng.choice(["School", "College", "University"]),
+            "submit": "Update Profile",
+        }, expected=(201,))
+
+    # HTTP helpers
+
+    def csrf(self, page: str) -> str:
+        match = CSRF_PATTERN.search(page)
+        return match.group(1) if match else ""
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        fields: Optional[dict[str, str]] = None,
+        *,
+        files: Optional[dict[str, tuple[str, bytes, str]]] = None,
+        expected: tuple[int, ...] = (200,),
+        with_status: bool = False,
+    ):
+        """Sends a request, records it and returns the body (and the status if asked)."""
+        headers = {}
+        data = None
+        if files:
+            data, content_type = encode_multipart(fields or {}, files)
+            headers["Content-Type"] = content_type
+        elif fields is not None:
+            data = urllib.parse.urlencode(fields).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        request = urllib.request.Request(self.args.url + path, data=data, headers=headers, method=method)
+        start = time.perf_counter()
+        body = b""
+        try:
+            with self.opener.open(request, timeout=self.args.timeout) as response:
+                status = response.status
+                body = response.read()
+        except urllib.error.HTTPError as error:
+            status = error.code
+            body = error.read()
+        except OSError:
+            status = 0
+        elapsed = time.perf_counter() - start
+        self.recorder.record(f"{method} {endpoint_name(path)}", elapsed, status, status not in expected and status != 429)
+        text = body.decode(errors="replace")
+        return (status, text) if with_status else text
+
+
+def endpoint_name(path: str) -> str:
+    """Maps a request path to its route, so requests for different users are reported together."""
+    for pattern, name in ENDPOINTS:
+        if pattern.search(path):
+            return name
+    return path
+
+
+def encode_multipart(fields: dict[str, str], files: dict[str, tuple[str, bytes, str]]) -> tuple[bytes, str]:
+    """Encodes form fields and files as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content, content_type) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n".encode() + content + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print(f"\n{'endpoint':<44}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'429':>6}")
+    for endpoint, stats in report["endpoints"].items():
+        print(
+            f"{endpoint:<44}{stats['requests']:>9}{stats['throughput_rps']:>9.1f}{stats['p50_ms']:>9.1f}"
+            f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['error_rate']:>7.1%}{stats['rate_limited']:>6}"
+        )
+    print(
+        f"\nTotal {report['requests']} requests, {report['throughput_rps']:.1f} req/s, "
+        f"{report['error_rate']:.2%} errors"
+    )
+
+
+@contextlib.contextmanager
+def temporary_server(timeout: float = 30.0) -> Iterator[str]:
+    """Runs the development server on a free port with a temporary instance folder. Yields its base URL."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    with tempfile.TemporaryDirectory(prefix="loadgen-instance-") as instance:
+        env = {**os.environ, "INSTANCE_PATH": instance, "RATELIMIT_ENABLED": "0"}
+        env.setdefault("SECRET_KEY", "loadgen")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "flask", "--app", "socialinsecurity", "run", "--port", str(port)],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        url = f"http://127.0.0.1:{port}"
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    with urllib.request.urlopen(f"{url}/readyz", timeout=1.0):
+                        break
+                except (urllib.error.URLError, OSError):
+                    if server.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError(f"The server did not start within {timeout:.0f} seconds") from None
+                    time.sleep(0.2)
+            yield url
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    if args.serve:
+        with temporary_server() as url:
+            args.url = url
+            return run(args)
+    return run(args)
+
+
+def run(args: argparse.Namespace) -> int:
+    """Generates load against the server at args.url and prints the report."""
+    args.url = args.url.rstrip("/")
+    image = args.image.read_bytes() if args.image else DEFAULT_IMAGE
+    run_id = uuid.uuid4().hex[:6]
+    recorder = Recorder()
+    stop = threading.Event()
+    users = []
+    start = time.perf_counter()
+    delay = args.ramp_up / args.users if args.users else 0.0
+    for number in range(args.users):
+        user = VirtualUser(number, args, run_id, recorder, stop, image)
+        user.start()
+        users.append(user)
+        if stop.wait(delay):
+            break
+    while not stop.wait(min(5.0, max(args.duration - (time.perf_counter() - start), 0.0))):
+        elapsed = time.perf_counter() - start
+        report = recorder.report(elapsed)
+        print(f"{elapsed:6.0f} s  {report['requests']:>8} requests  {report['throughput_rps']:8.1f} req/s  {report['error_rate']:.2%} errors", flush=True)
+        if elapsed >= args.duration:
+            stop.set()
+    for user in users:
+        user.join(timeout=args.timeout)
+    report = recorder.report(time.perf_counter() - start)
+    print_report(report)
+    if args.output is not None:
+        meta = {name: str(value) if isinstance(value, Path) else value for name, value in vars(args).items()}
+        save_results(args.output, {"meta": {**meta, "started": datetime.now().isoformat(timespec="seconds")}, **report})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -2,12 +2,18 @@
 
 """Configured as entry point for the Social Insecurity application.
 
-To start the application enter 'pdm run flask --debug run' in a terminal.
+To start the development server enter 'pdm run flask --debug run' in a terminal.
 
-As an alternative, this file can also be run directly with 'pdm run python socialinsecurity.py'.
+To start the production server with several worker processes enter 'pdm run flask serve',
+or run this file directly with 'pdm run python socialinsecurity.py'. See app/server.py.
+Without gunicorn, which is optional, running this file starts the development server.
 """
 
 from app import app
+from app.server import available, serve
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    if available():
+        serve(app)
+    else:
+        app.run()
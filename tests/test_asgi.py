@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from flask import Flask, Response
+
+from app.asgi import ASGIAdapter
+
+
+def call(application: ASGIAdapter, method: str, path: str, body: bytes = b"", chunks: int = 1) -> list[dict]:
+    """Sends one request through the adapter and returns the messages it sent."""
+    size = len(body) // chunks or len(body)
+    requests = [
+        {"type": "http.request", "body": body[i:i + size], "more_body": i + size < len(body)}
+        for i in range(0, max(len(body), 1), max(size, 1))
+    ]
+    sent = []
+
+    async def receive():
+        return requests.pop(0) if requests else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"a=1",
+        "headers": [(b"content-type", b"text/plain"), (b"x-test", b"yes")],
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 50000),
+    }
+    asyncio.run(application(scope, receive, send))
+    return sent
+
+
+def echo_app() -> Flask:
+    echo = Flask(__name__)
+
+    @echo.route("/echo", methods=["POST"])
+    def echo_view():
+        from flask import request
+
+        return {"body": request.get_data(as_text=True), "args": request.args, "header": request.headers["X-Test"]}
+
+    @echo.route("/stream")
+    def stream_view():
+        return Response(iter([b"one", b"two"]))
+
+    return echo
+
+
+def test_adapter_passes_request_and_response():
+    sent = call(ASGIAdapter(echo_app(), threads=2), "POST", "/echo", b"hello world", chunks=3)
+    assert sent[0]["type"] == "http.response.start"
+    assert sent[0]["status"] == 200
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    assert json.loads(body) == {"body": "hello world", "args": {"a": "1"}, "header": "yes"}
+    assert sent[-1]["more_body"] is False
+
+
+def test_adapter_sends_streamed_chunks_separately():
+    sent = call(ASGIAdapter(echo_app(), threads=2), "GET", "/stream")
+    assert [message["body"] for message in sent[1:] if message["body"]] == [b"one", b"two"]
+
+
+def test_adapter_rejects_large_bodies_before_taking_a_thread():
+    sent = call(ASGIAdapter(echo_app(), threads=2, max_body=4), "POST", "/echo", b"too large")
+    assert sent[0]["status"] == 413
+
+
+def test_adapter_serves_the_application():
+    from app.asgi import application
+
+    sent = call(application, "GET", "/readyz")
+    assert sent[0]["status"] == 200
+
+
+def test_adapter_threads_are_capped_at_the_connection_pool_size():
+    flask_app = Flask("app")
+    flask_app.config.update({"SQLITE3_POOL_SIZE": 4, "ASGI_THREADS": 32})
+    assert ASGIAdapter(flask_app).threads == 4
+    flask_app.config["ASGI_THREADS"] = None
+    assert ASGIAdapter(flask_app).threads == 4
+
+
+def test_environ_joins_repeated_headers():
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"cookie", b"a=1"), (b"cookie", b"b=2"), (b"accept", b"text/html"), (b"accept", b"*/*")],
+    }
+    environ = ASGIAdapter(Flask("app")).environ(scope, None)
+    assert environ["HTTP_COOKIE"] == "a=1; b=2"
+    assert environ["HTTP_ACCEPT"] == "text/html,*/*"
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import gzip
+
+import pytest
+from flask import Flask
+
+from app.assets import StaticAssets
+
+
+@pytest.fixture()
+def assets_app(tmp_path) -> Flask:
+    static = tmp_path / "static"
+    (static / "css").mkdir(parents=True)
+    (static / "css" / "site.css").write_text("body { color: red; }\n" * 100)
+    (static / "logo.png").write_bytes(b"\x89PNG")
+    assets_app = Flask("app", static_folder=str(static))
+    StaticAssets(assets_app).build()
+    return assets_app
+
+
+def test_build_fingerprints_and_precompresses(assets_app: Flask):
+    assets = assets_app.extensions["static_assets"]
+    fingerprinted = assets.manifest["css/site.css"]
+    assert fingerprinted.startswith("css/site.") and fingerprinted.endswith(".css")
+    gz = assets.dist_folder / f"{fingerprinted}.gz"
+    assert gzip.decompress(gz.read_bytes()) == (assets.static_folder / "css" / "site.css").read_bytes()
+    assert not (assets.dist_folder / f"{assets.manifest['logo.png']}.gz").exists()
+
+
+def test_asset_url_resolves_fingerprinted_name(assets_app: Flask):
+    assets = assets_app.extensions["static_assets"]
+    with assets_app.test_request_context():
+        assert assets.url("css/site.css") == f"/static/dist/{assets.manifest['css/site.css']}"
+        assert assets.url("missing.css") == "/static/missing.css"
+
+
+def test_static_serves_precompressed_immutable_files(assets_app: Flask):
+    url = f"/static/dist/{assets_app.extensions['static_assets'].manifest['css/site.css']}"
+    client = assets_app.test_client()
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.mimetype == "text/css"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data).startswith(b"body")
+    response = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.data.startswith(b"body")
+    assert "immutable" not in client.get("/static/css/site.css").headers.get("Cache-Control", "")
+
+
+def test_static_prefers_brotli(assets_app: Flask):
+    brotli = pytest.importorskip("brotli")
+    url = f"/static/dist/{assets_app.extensions['static_assets'].manifest['css/site.css']}"
+    response = assets_app.test_client().get(url, headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(response.data).startswith(b"body")
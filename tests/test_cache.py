@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import time
+
+from app.cache import FragmentCache, TTLCache
+
+
+def test_ttl_cache_hits_and_misses():
+    cache = TTLCache(maxsize=2, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=2, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_ttl_cache_invalidate():
+    cache = TTLCache()
+    cache.set("a", 1)
+    cache.invalidate("a")
+    assert cache.get("a") is None
+
+
+def test_fragment_cache_renders_once():
+    cache = FragmentCache(max_bytes=10_000)
+    renders = []
+    for _ in range(3):
+        assert cache.fetch(("post", 1, 0), lambda: renders.append(1) or "<p>Post</p>") == "<p>Post</p>"
+    assert len(renders) == 1
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["bytes"] > 0
+
+
+def test_fragment_cache_evicts_to_stay_within_memory():
+    fragment = "x" * 1000
+    cache = FragmentCache(max_bytes=3000)
+    for post_id in range(5):
+        cache.fetch(("post", post_id), lambda: fragment)
+    stats = cache.stats()
+    assert stats["bytes"] <= 3000
+    assert stats["evictions"] == 5 - stats["size"]
+    # Fragments larger than the whole cache are rendered but not stored
+    cache.fetch("large", lambda: "x" * 4000)
+    assert cache.stats()["size"] == stats["size"]
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import gzip
+
+import pytest
+from flask import Flask, Response, send_file, stream_with_context
+
+from app.compression import ResponseCompression
+
+PAGE = "<p>Hello</p>" * 200
+
+
+@pytest.fixture()
+def compression_app(tmp_path) -> Flask:
+    compression_app = Flask("app")
+    compression_app.config["COMPRESS_ALGORITHMS"] = ("gzip",)
+    ResponseCompression(compression_app)
+    image = tmp_path / "image.png"
+    image.write_bytes(b"\x89PNG" * 1000)
+
+    @compression_app.route("/page")
+    def page():
+        response = Response(PAGE, mimetype="text/html")
+        response.set_etag("v1")
+        return response
+
+    @compression_app.route("/small")
+    def small():
+        return "<p>Hi</p>"
+
+    @compression_app.route("/streamed")
+    def streamed():
+        return Response(stream_with_context(iter(["<p>Hello</p>"] * 200)), mimetype="text/html")
+
+    @compression_app.route("/image")
+    def image_file():
+        return send_file(image)
+
+    return compression_app
+
+
+def test_compresses_html_with_gzip(compression_app: Flask):
+    response = compression_app.test_client().get("/page", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data).decode() == PAGE
+    assert response.get_etag() == ("v1", True)
+
+
+def test_skips_unaccepted_small_and_binary_responses(compression_app: Flask):
+    client = compression_app.test_client()
+    assert "Content-Encoding" not in client.get("/page").headers
+    assert "Content-Encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "Content-Encoding" not in client.get("/image", headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_compresses_streamed_responses(compression_app: Flask):
+    response = compression_app.test_client().get("/streamed", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert gzip.decompress(response.data).decode() == PAGE
+
+
+def test_prefers_brotli(compression_app: Flask):
+    brotli = pytest.importorskip("brotli")
+    brotli_app = Flask("app")
+    ResponseCompression(brotli_app)
+    brotli_app.add_url_rule("/page", "page", lambda: PAGE)
+    response = brotli_app.test_client().get("/page", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(response.data).decode() == PAGE
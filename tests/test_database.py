@@ -0,0 +1,393 @@
+from __future__ import annotations
+
+import atexit
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+from collections.abc import Iterator
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+from app.database import ConnectionPool, PoolTimeoutError, QueryStats, SQLite3, decode_cursor, encode_cursor
+from app.seed import seed_database
+
+
+@pytest.fixture()
+def db_app(tmp_path) -> Iterator[Flask]:
+    db_app = Flask("app", instance_path=str(tmp_path))
+    db_app.extensions["db"] = SQLite3(db_app, migrations="migrations")
+    with db_app.app_context():
+        yield db_app
+    db_app.extensions["db"].close()
+
+
+@pytest.fixture()
+def db(db_app: Flask) -> SQLite3:
+    return db_app.extensions["db"]
+
+
+@pytest.fixture()
+def pool(tmp_path) -> ConnectionPool:
+    pool = ConnectionPool(tmp_path / "pool.db", size=2, timeout=0.05)
+    yield pool
+    pool.dispose()
+
+
+def test_pool_reuses_connections(pool: ConnectionPool):
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    stats = pool.stats()
+    assert stats["open"] == 1
+    assert stats["in_use"] == 1
+    assert stats["checkouts"] == 2
+
+
+def test_pool_applies_pragmas(pool: ConnectionPool):
+    conn = pool.acquire()
+    assert conn.execute("PRAGMA journal_mode;").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA busy_timeout;").fetchone()[0] == 5000
+    pool.release(conn)
+
+
+def test_pool_times_out_when_exhausted(pool: ConnectionPool):
+    conns = [pool.acquire(), pool.acquire()]
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+    for conn in conns:
+        pool.release(conn)
+
+
+def test_pool_hands_released_connection_to_waiter(pool: ConnectionPool):
+    pool._timeout = 2.0
+    conns = [pool.acquire(), pool.acquire()]
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+    pool.release(conns[0])
+    waiter.join()
+    assert acquired == [conns[0]]
+
+
+def test_pool_rolls_back_open_transaction_on_release(pool: ConnectionPool):
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE T (id INTEGER PRIMARY KEY);")
+    conn.execute("INSERT INTO T (id) VALUES (1);")
+    assert conn.in_transaction
+    pool.release(conn)
+    conn = pool.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM T;").fetchone()[0] == 0
+    pool.release(conn)
+
+
+def test_pool_replaces_broken_connection(pool: ConnectionPool):
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.close()
+    replacement = pool.acquire()
+    assert replacement is not conn
+    assert pool.stats()["discarded"] == 1
+    pool.release(replacement)
+
+
+def test_query_posts_keyset_pagination(db: SQLite3):
+    db.insert_user({"username": "alice", "password": "x", "first_name": "a", "last_name": "a"})
+    db.insert_user({"username": "bob", "password": "x", "first_name": "b", "last_name": "b"})
+    db.insert_friend(1, 2)
+    for i in range(5):
+        db.insert_post(1 + i % 2, f"post {i}", "")
+    seen = []
+    cursor = None
+    while True:
+        page = db.query_posts(1, cursor=cursor, limit=2)
+        seen.extend(post["content"] for post in page)
+        if len(page) < 2:
+            break
+        cursor = decode_cursor(encode_cursor(page[-1]))
+    # Posts created within the same second are ordered by id
+    assert seen == [f"post {i}" for i in reversed(range(5))]
+
+
+def test_decode_cursor_rejects_malformed_values():
+    assert decode_cursor(None) is None
+    assert decode_cursor("garbage") is None
+    assert decode_cursor("2024-01-01 10:00:00_x") is None
+    assert decode_cursor("2024-01-01 10:00:00_7") == ("2024-01-01 10:00:00", 7)
+
+
+def test_migrate_applies_pending_migrations_once(db: SQLite3):
+    latest = db._pending_migrations(0)[-1][0]
+    assert db.connection.execute("PRAGMA user_version;").fetchone()[0] == latest
+    indexes = {row["name"] for row in db.connection.execute("SELECT name FROM sqlite_master WHERE type = 'index';")}
+    assert {"Posts_u_id_creation_time", "Comments_p_id_creation_time", "Friends_f_id_u_id"} <= indexes
+    db.insert_user({"username": "alice", "password": "x", "first_name": "a", "last_name": "a"})
+    assert db.migrate() == 0
+    assert db.check_user_exists("alice") is True
+
+
+def test_reset_database_drops_data(db: SQLite3):
+    db.insert_user({"username": "alice", "password": "x", "first_name": "a", "last_name": "a"})
+    db.reset_database()
+    assert db.check_user_exists("alice") is False
+
+
+def test_insert_comment_updates_comment_count(db: SQLite3):
+    db.insert_user({"username": "alice", "password": "x", "first_name": "a", "last_name": "a"})
+    db.insert_post(1, "post", "")
+    db.insert_comment(1, "first", 1)
+    db.insert_comment(1, "second", 1)
+    assert db.query_posts(1)[0]["comment_count"] == 2
+    # Simulate a drifted counter and repair it
+    db.connection.execute("UPDATE Posts SET comment_count = 0;")
+    assert db.repair_comment_counts() == 1
+    assert db.query_posts(1)[0]["comment_count"] == 2
+
+
+@pytest.mark.parametrize("strategy", ["read", "write"])
+def test_query_posts_feed_strategies_agree(db: SQLite3, strategy: str):
+    db._feed_strategy = strategy
+    for name in ("alice", "bob", "carol"):
+        db.insert_user({"username": name, "password": "x", "first_name": name, "last_name": name})
+    db.insert_post(2, "bob before friendship", "")
+    db.insert_post(3, "carol is not a friend", "")
+    db.insert_friend(2, 1)
+    db.insert_post(1, "alice", "")
+    db.insert_post(2, "bob after friendship", "")
+    expected = ["bob after friendship", "alice", "bob before friendship"]
+    assert [post["content"] for post in db.query_posts(1)] == expected
+    if strategy == "write":
+        db.rebuild_timelines()
+        assert [post["content"] for post in db.query_posts(1)] == expected
+
+
+def test_query_posts_timeline_is_a_range_scan(db: SQLite3):
+    plan = " ".join(
+        row["detail"]
+        for row in db.connection.execute(
+            "EXPLAIN QUERY PLAN SELECT post_id FROM Timeline WHERE owner_id = ? ORDER BY created_at DESC, post_id DESC LIMIT 20;",
+            (1,),
+        )
+    )
+    assert "TEMP B-TREE" not in plan
+
+
+def test_identity_map_answers_repeated_reads(db: SQLite3):
+    db.insert_user({"username": "alice", "password": "x", "first_name": "a", "last_name": "a"})
+    statements = []
+    db.connection.set_trace_callback(statements.append)
+    user = db.resolve_user("alice")
+    assert db.resolve_user("alice") is user
+    assert len(statements) == 1
+    db.connection.set_trace_callback(None)
+
+
+def test_identity_map_is_cleared_by_writes(db: SQLite3):
+    assert db.resolve_user("alice") is None
+    db.insert_user({"username": "alice", "password": "x", "first_name": "a", "last_name": "a"})
+    assert db.resolve_user("alice")["username"] == "alice"
+
+
+def test_query_stats_records_calls_and_rows(db: SQLite3):
+    db.insert_user({"username": "alice", "password": "x", "first_name": "a", "last_name": "a"})
+    db.resolve_user("alice")
+    db.resolve_user("alice")  # Answered by the identity map, not recorded
+    summary = db.stats.summary()
+    assert summary["resolve_user"]["calls"] == 1
+    assert summary["resolve_user"]["rows"] == 1
+    assert summary["insert_user"]["calls"] == 1
+
+
+def test_query_stats_merge_and_percentiles():
+    first, second = QueryStats(), QueryStats()
+    for _ in range(98):
+        first.record("query_posts", 0.0004, rows=20)
+    second.record("query_posts", 0.02, rows=20)
+    second.record("query_posts", 0.3, rows=20)
+    summary = QueryStats.summarize(QueryStats.merge([first.snapshot(), second.snapshot()]))["query_posts"]
+    assert summary["calls"] == 100
+    assert summary["rows"] == 2000
+    assert summary["p50_ms"] == 0.5
+    assert summary["p99_ms"] == 25
+    assert summary["max_ms"] == pytest.approx(300)
+
+
+def test_slow_queries_are_logged_with_redacted_parameters(db: SQLite3, caplog):
+    db._slow_query_ms = 0
+    with caplog.at_level("WARNING", logger="app.database.slow_queries"):
+        db.resolve_user("alice-secret")
+    assert "resolve_user" in caplog.text
+    assert "(<str>)" in caplog.text
+    assert "alice-secret" not in caplog.text
+
+
+def test_slow_queries_are_written_to_the_log_of_their_own_database(tmp_path):
+    apps = []
+    for name in ("one", "two"):
+        app = Flask("app", instance_path=str(tmp_path / name))
+        app.config.update({"SQLITE3_SLOW_QUERY_LOG": "slow_queries.log", "SQLITE3_SLOW_QUERY_MS": 0})
+        app.extensions["db"] = SQLite3(app, migrations="migrations")
+        apps.append(app)
+    with apps[0].app_context():
+        apps[0].extensions["db"].resolve_user("alice")
+    for handler in apps[0].extensions["db"].slow_query_logger.handlers:
+        handler.flush()
+    assert "resolve_user" in (tmp_path / "one" / "slow_queries.log").read_text()
+    assert not (tmp_path / "two" / "slow_queries.log").exists()
+    # A second instance on the same database shares the handler instead of adding one
+    again = Flask("app", instance_path=str(tmp_path / "one"))
+    again.config.update({"SQLITE3_SLOW_QUERY_LOG": "slow_queries.log"})
+    db = SQLite3(again)
+    assert len(db.slow_query_logger.handlers) == 1
+    db.close()
+    for app in apps:
+        app.extensions["db"].close()
+
+
+def test_collect_stats_deletes_dumps_of_exited_processes(db: SQLite3):
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    db.stats.record("resolve_user", 0.001)
+    db.stats.dump(db.stats_folder / f"{process.pid}.json")
+    db.stats.dump(db.stats_folder / f"{os.getppid()}.json")
+    assert db.collect_stats()["resolve_user"]["calls"] == 2
+    assert [path.name for path in db.stats_folder.iterdir()] == [f"{os.getppid()}.json"]
+
+
+def test_group_commit_writer_batches_concurrent_writes(tmp_path):
+    db_app = Flask("app", instance_path=str(tmp_path))
+    db_app.config.update({"SQLITE3_GROUP_COMMIT": True, "SQLITE3_GROUP_COMMIT_DELAY": 0.05})
+    db = SQLite3(db_app, migrations="migrations")
+
+    def register(name: str):
+        with db_app.app_context():
+            db.insert_user({"username": name, "password": "x", "first_name": name, "last_name": name})
+            # Read your own write right after the batch commits
+            assert db.resolve_user(name) is not None
+
+    threads = [threading.Thread(target=register, args=(f"user{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = db.writer.summary()
+    assert summary["writes"] == 8
+    assert summary["batches"] < 8
+    db.close()
+
+
+def test_group_commit_writer_isolates_failing_writes(tmp_path):
+    db_app = Flask("app", instance_path=str(tmp_path))
+    db_app.config.update({"SQLITE3_GROUP_COMMIT": True})
+    db = SQLite3(db_app, migrations="migrations")
+    with db_app.app_context():
+        db.insert_user({"username": "alice", "password": "x", "first_name": "a", "last_name": "a"})
+        with pytest.raises(sqlite3.IntegrityError):
+            db.insert_user({"username": "alice", "password": "x", "first_name": "a", "last_name": "a"})
+        db.insert_user({"username": "bob", "password": "x", "first_name": "b", "last_name": "b"})
+        assert db.resolve_user("bob")["id"] == 2
+    db.close()
+
+
+def test_close_removes_the_exit_hook(tmp_path, monkeypatch):
+    hooks = []
+    monkeypatch.setattr(atexit, "register", hooks.append)
+    monkeypatch.setattr(atexit, "unregister", hooks.remove)
+    db_app = Flask("app", instance_path=str(tmp_path))
+    db_app.config.update({"SQLITE3_GROUP_COMMIT": True, "SQLITE3_STATS_DUMP_INTERVAL": 60})
+    db = SQLite3(db_app, migrations="migrations")
+    assert hooks == [db._at_exit]
+    with db_app.app_context():
+        db.insert_user({"username": "alice", "password": "x", "first_name": "a", "last_name": "a"})
+    db.close()
+    assert hooks == []
+    assert db.pool.stats()["open"] == 0
+    assert [path.name for path in db.stats_folder.iterdir()] == [f"{os.getpid()}.json"]
+
+
+def test_seed_database_is_deterministic(tmp_path):
+    dumps = []
+    for run in range(2):
+        seed_app = Flask("app", instance_path=str(tmp_path / str(run)))
+        db = SQLite3(seed_app, migrations="migrations")
+        with seed_app.app_context():
+            results = seed_database(
+                db, users=50, friends=6, posts=200, comments=300, seed=7, until=datetime(2024, 1, 1)
+            )
+            assert results["Users"][0] == 50
+            assert results["Posts"][0] == 200
+            assert results["Comments"][0] == 300
+            assert db.repair_comment_counts() == 0
+            dumps.append(list(db.connection.iterdump()))
+        db.close()
+    assert dumps[0] == dumps[1]
+
+
+def test_seed_database_without_friends(db: SQLite3):
+    results = seed_database(db, users=20, friends=0, posts=10, comments=10, seed=7)
+    assert results["Users"][0] == 20
+    assert db.connection.execute("SELECT COUNT(*) FROM Friends;").fetchone()[0] == 0
+
+
+def test_writes_bump_page_versions(db: SQLite3):
+    for name in ("alice", "bob"):
+        db.insert_user({"username": name, "password": "x", "first_name": name, "last_name": name})
+    alice, bob = db.resolve_user("alice")["id"], db.resolve_user("bob")["id"]
+    epoch, stream = db.query_page_version("stream", "bob")
+    db.insert_friend(alice, bob)
+    assert db.query_page_version("friends", "bob")[1] == 1
+    post_id = db.insert_post(alice, "hello", "")
+    # The post appears on the stream of alice's friend bob
+    assert db.query_page_version("stream", "bob") == (epoch, stream + 2)
+    db.insert_comment(post_id, "hi", bob)
+    assert db.query_version(f"comments:{post_id}") == (epoch, 1)
+    db.update_profile(bob, {"education": "school"})
+    assert db.query_page_version("profile", "bob") == (epoch, 1)
+    assert db.query_page_version("stream", "carol") is None
+    db.bump_epoch()
+    assert db.query_page_version("stream", "bob")[0] == epoch + 1
+
+
+def test_friend_graph_answers_friendships_in_both_directions(db: SQLite3):
+    for name in ("alice", "bob", "carol"):
+        db.insert_user({"username": name, "password": "x", "first_name": name, "last_name": name})
+    db.insert_friend(1, 2)
+    db.insert_friend(3, 1)
+    db.insert_friend(2, 3)
+    assert db.check_friend_connection(2, 1) is True
+    assert [friend["username"] for friend in db.query_friends("1")] == ["bob", "carol"]
+    assert db.count_mutual_friends(1, 2) == 1
+    assert db.stats.snapshot()["friend_graph_load"]["calls"] == 2
+    assert db.check_friend_graph() == []
+
+
+def test_friend_graph_applies_friendships_of_other_processes(db_app: Flask, db: SQLite3):
+    for name in ("alice", "bob", "carol"):
+        db.insert_user({"username": name, "password": "x", "first_name": name, "last_name": name})
+    assert db.friend_graph.friends(1) == set()
+    # Written behind the back of this process, as another worker would
+    db.connection.execute("INSERT INTO Friends (u_id, f_id) VALUES (3, 1);")
+    db.connection.commit()
+    assert db.check_friend_graph() == [1]
+    db.friend_graph.friends(1)
+    db.connection.execute("INSERT INTO Friends (u_id, f_id) VALUES (1, 2);")
+    db.connection.commit()
+    with db_app.app_context():
+        assert db.check_friend_connection(1, 2) is True
+        assert db.friend_graph.friends(1) == {2, 3}
+
+
+def test_friend_graph_is_reset_when_the_pool_is_disposed(db_app: Flask, db: SQLite3):
+    for name in ("alice", "bob"):
+        db.insert_user({"username": name, "password": "x", "first_name": name, "last_name": name})
+    db.insert_friend(1, 2)
+    assert db.friend_graph.friends(1) == {2}
+    # E.g. before the database file is replaced by another one with the same epoch
+    db._close_connection()
+    db.pool.dispose()
+    assert db.friend_graph.loaded() == {}
+    assert db._friend_graph_rowid is None
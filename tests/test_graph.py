@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import pytest
+
+from app.graph import FriendGraph
+
+
+@pytest.fixture()
+def edges() -> set[tuple[int, int]]:
+    return {(1, 2), (3, 1), (2, 3), (4, 2)}
+
+
+def loader(edges: set[tuple[int, int]], calls: list[int]):
+    def load_friends(user_id: int) -> list[int]:
+        calls.append(user_id)
+        return [b for a, b in edges if a == user_id] + [a for a, b in edges if b == user_id]
+
+    return load_friends
+
+
+def test_friends_are_loaded_once_in_both_directions(edges):
+    calls: list[int] = []
+    graph = FriendGraph(loader(edges, calls))
+    assert graph.friends(1) == {2, 3}
+    assert graph.friends("1") == {2, 3}
+    assert graph.is_friend(1, 3) and graph.is_friend(3, "1")
+    assert not graph.is_friend(1, 4)
+    assert graph.mutual_count(1, 4) == 1
+    assert calls == [1, 3, 4]
+    assert graph.stats()["hits"] == 4
+
+
+def test_add_updates_loaded_users_only(edges):
+    calls: list[int] = []
+    graph = FriendGraph(loader(edges, calls))
+    graph.friends(1)
+    edges.add((1, 4))
+    graph.add(1, 4)
+    assert graph.loaded() == {1: {2, 3, 4}}
+    assert graph.stats()["edges"] == 3
+    # The other user gets the friendship when it is loaded
+    assert graph.friends(4) == {1, 2}
+    graph.add(4, 1)
+    assert graph.stats()["edges"] == 5
+
+
+def test_least_recently_used_users_are_evicted_beyond_max_edges(edges):
+    calls: list[int] = []
+    graph = FriendGraph(loader(edges, calls), max_edges=5)
+    graph.friends(1)
+    graph.friends(2)
+    graph.friends(1)
+    # Loading user 3 exceeds five edges, user 2 was used least recently
+    graph.friends(3)
+    assert set(graph.loaded()) == {1, 3}
+    assert graph.stats()["evictions"] == 1
+    # A user with more friends than fit is answered but not kept
+    small = FriendGraph(loader(edges, calls), max_edges=2)
+    assert small.friends(2) == {1, 3, 4}
+    assert small.loaded() == {}
+
+
+def test_set_loaded_while_a_friendship_was_added_is_not_kept(edges):
+    graph: FriendGraph
+
+    def load_friends(user_id: int) -> list[int]:
+        # Another thread adds a friendship while the stale set is read
+        graph.add(user_id, 9)
+        return [2]
+
+    graph = FriendGraph(load_friends)
+    assert graph.friends(1) == {2}
+    assert graph.loaded() == {}
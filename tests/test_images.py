@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import json
+from collections.abc import Iterator
+from io import BytesIO
+
+import pytest
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+from app.database import SQLite3
+from app.images import ImageProcessor
+from app.uploads import UploadStore
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture()
+def image_app(tmp_path) -> Iterator[Flask]:
+    image_app = Flask("app", instance_path=str(tmp_path))
+    image_app.config.update({"IMAGE_VARIANT_WIDTHS": (100, 200, 1000), "IMAGE_WORKERS": 0})
+    image_app.add_url_rule("/uploads/<path:filename>", "uploads", lambda filename: filename)
+    db = SQLite3(image_app, migrations="migrations")
+    UploadStore(image_app)
+    ImageProcessor(image_app)
+    with image_app.test_request_context():
+        yield image_app
+    db.close()
+
+
+def upload_image(image_app: Flask, size=(400, 300)) -> tuple[int, str]:
+    buffer = BytesIO()
+    Image.new("RGB", size, "red").save(buffer, format="PNG")
+    buffer.seek(0)
+    name = image_app.extensions["upload_store"].save(FileStorage(buffer, filename="photo.png"))
+    db = image_app.extensions["sqlite3"]
+    db.insert_user({"username": "alice", "password": "", "first_name": "A", "last_name": "B"})
+    post_id = db.insert_post(db.query_username("alice")["id"], "photo", name)
+    return post_id, name
+
+
+def test_processor_records_smaller_variants(image_app: Flask):
+    post_id, name = upload_image(image_app)
+    image_app.extensions["image_processor"].submit(post_id, name)
+    post = image_app.extensions["sqlite3"].query_post(post_id)
+    assert (post["image_width"], post["image_height"]) == (400, 300)
+    variants = json.loads(post["image_variants"])
+    assert [width for width, _ in variants] == [100, 200]
+    for width, variant in variants:
+        with Image.open(image_app.extensions["upload_store"].path(variant)) as image:
+            assert image.format == "WEBP"
+            assert image.size == (width, width * 3 // 4)
+
+
+def test_processor_builds_srcset(image_app: Flask):
+    post_id, name = upload_image(image_app)
+    processor = image_app.extensions["image_processor"]
+    db = image_app.extensions["sqlite3"]
+    assert processor.srcset({"image": name, "image_width": None, "image_variants": None}) == ""
+    processor.submit(post_id, name)
+    srcset = processor.srcset(db.query_post(post_id))
+    assert srcset.endswith(f"/uploads/{name} 400w")
+    assert "-100.webp 100w" in srcset
+
+
+def test_processor_records_failures(image_app: Flask):
+    processor = image_app.extensions["image_processor"]
+    processor.submit(1, "ab/cd/missing.png")
+    assert processor.stats.summary()["image_failed"]["calls"] == 1
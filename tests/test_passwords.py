@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import os
+import signal
+import time
+from collections.abc import Iterator
+
+import pytest
+from flask import Flask
+
+from app.passwords import HasherBusyError, PasswordHasher
+
+
+def make_hasher(**config) -> PasswordHasher:
+    hasher_app = Flask("app")
+    hasher_app.config.update({"BCRYPT_LOG_ROUNDS": 4, **config})
+    return PasswordHasher(hasher_app)
+
+
+@pytest.fixture()
+def hasher() -> Iterator[PasswordHasher]:
+    hasher = make_hasher(BCRYPT_WORKERS=1, BCRYPT_MAX_QUEUE=0)
+    yield hasher
+    hasher.close()
+
+
+def test_hasher_hashes_and_checks_on_workers(hasher: PasswordHasher):
+    pw_hash = hasher.hash_password("secret")
+    assert pw_hash.startswith(b"$2b$04$")
+    assert hasher.check_password(pw_hash, "secret") is True
+    assert hasher.check_password(pw_hash.decode(), "wrong") is False
+    summary = hasher.stats.summary()
+    assert summary["bcrypt_hash"]["calls"] == 1
+    assert summary["bcrypt_check"]["calls"] == 2
+    assert summary["bcrypt_queue_wait"]["calls"] == 3
+
+
+def test_hasher_rejects_calls_when_saturated(hasher: PasswordHasher):
+    _, slots = hasher._ensure_started()
+    slots.acquire()
+    with pytest.raises(HasherBusyError):
+        hasher.hash_password("secret")
+    slots.release()
+    assert hasher.stats.summary()["bcrypt_rejected"]["calls"] == 1
+    assert hasher.check_password(hasher.hash_password("secret"), "secret")
+
+
+def test_hasher_restarts_workers_after_one_died(hasher: PasswordHasher):
+    hasher.hash_password("secret")
+    executor, _ = hasher._ensure_started()
+    for process in executor._processes.values():
+        os.kill(process.pid, signal.SIGKILL)
+    with pytest.raises(HasherBusyError):
+        for _ in range(3):
+            # The pool notices the dead worker shortly after it was killed
+            hasher.hash_password("secret")
+            time.sleep(0.5)
+    assert hasher.stats.summary()["bcrypt_broken"]["calls"] == 1
+    assert hasher.check_password(hasher.hash_password("secret"), "secret")
+
+
+def test_hasher_runs_inline_without_workers():
+    hasher = make_hasher(BCRYPT_WORKERS=0)
+    assert hasher.check_password(hasher.hash_password("secret"), "secret")
+    assert hasher._executor is None
+    assert "bcrypt_queue_wait" not in hasher.stats.summary()
+
+
+def test_hasher_detects_changed_work_factor():
+    hasher = make_hasher(BCRYPT_WORKERS=0)
+    assert hasher.needs_rehash(hasher.hash_password("secret")) is False
+    assert make_hasher(BCRYPT_WORKERS=0, BCRYPT_LOG_ROUNDS=5).needs_rehash(hasher.hash_password("secret")) is True
+    assert hasher.needs_rehash("not a hash") is True
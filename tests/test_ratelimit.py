@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import multiprocessing
+import threading
+from pathlib import Path
+
+import pytest
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+from app.ratelimit import SQLiteStorage
+
+
+@pytest.fixture()
+def storage(tmp_path: Path) -> SQLiteStorage:
+    return SQLiteStorage(f"sqlite:///{tmp_path / 'ratelimit.db'}")
+
+
+def test_storage_is_registered_under_the_sqlite_scheme(tmp_path: Path):
+    assert isinstance(storage_from_string(f"sqlite:///{tmp_path / 'ratelimit.db'}"), SQLiteStorage)
+
+
+def test_storage_rejects_uri_without_path():
+    with pytest.raises(ValueError):
+        SQLiteStorage("sqlite://")
+
+
+def test_incr_counts_within_the_window(storage: SQLiteStorage, monkeypatch):
+    monkeypatch.setattr("app.ratelimit.time.time", lambda: 1000.0)
+    assert storage.incr("key", expiry=60) == 1
+    assert storage.incr("key", expiry=60, amount=2) == 3
+    assert storage.get("key") == 3
+    assert storage.get_expiry("key") == 1060.0
+    # A new window starts once the old one has expired
+    monkeypatch.setattr("app.ratelimit.time.time", lambda: 1060.0)
+    assert storage.get("key") == 0
+    assert storage.incr("key", expiry=60) == 1
+    assert storage.get_expiry("key") == 1120.0
+
+
+def test_clear_and_reset(storage: SQLiteStorage):
+    storage.incr("a", expiry=60)
+    storage.incr("b", expiry=60)
+    storage.clear("a")
+    assert storage.get("a") == 0
+    assert storage.reset() == 1
+    assert storage.get("b") == 0
+    assert storage.check() is True
+
+
+def test_sweep_removes_expired_and_excess_counters(tmp_path: Path, monkeypatch):
+    storage = SQLiteStorage(f"sqlite:///{tmp_path / 'ratelimit.db'}", max_keys=2, sweep_interval=3600)
+    monkeypatch.setattr("app.ratelimit.time.time", lambda: 1000.0)
+    storage.incr("expired", expiry=10)
+    storage.incr("soonest", expiry=20)
+    storage.incr("later", expiry=30)
+    storage.incr("latest", expiry=40)
+    assert storage.sweep(now=1015.0) == 2
+    assert storage.get("later") == 1 and storage.get("latest") == 1
+    assert storage.get("soonest") == 0
+
+
+def test_incr_is_atomic_across_threads(storage: SQLiteStorage):
+    def hit():
+        for _ in range(200):
+            storage.incr("key", expiry=60)
+
+    threads = [threading.Thread(target=hit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert storage.get("key") == 800
+
+
+def _hit(uri: str) -> None:
+    limiter = FixedWindowRateLimiter(storage_from_string(uri))
+    for _ in range(100):
+        limiter.hit(parse("10000 per hour"), "client")
+
+
+def test_limits_are_shared_across_processes(tmp_path: Path):
+    uri = f"sqlite:///{tmp_path / 'ratelimit.db'}"
+    processes = [multiprocessing.get_context("spawn").Process(target=_hit, args=(uri,)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert storage_from_string(uri).get(parse("10000 per hour").key_for("client")) == 300
@@ -6,14 +6,15 @@ from flask_login import current_user
 import pytest
 from io import BytesIO
 
-from app import app, sqlite
+from app import app, fragment_cache, hasher, limiter, sqlite, user_cache
+from app.passwords import HasherBusyError
 
 if TYPE_CHECKING:
     from flask import Flask
     from flask.testing import FlaskClient
 
 @pytest.fixture(scope="session")
-def test_app() -> Iterator[Flask]:
+def test_app(tmp_path_factory) -> Iterator[Flask]:
     app.config.update(
         {
             "SQLITE3_DATABASE": "file::memory:?cache=shared",
@@ -22,6 +23,14 @@ def test_app() -> Iterator[Flask]:
             "SECRET_KEY": "test",
         }
     )
+    # The database is no longer recreated on import, start every session from a clean slate
+    with app.app_context():
+        sqlite.reset_database()
+    # Count the rate limits of the session in a fresh database outside the instance folder
+    app.config["RATELIMIT_STORAGE_URI"] = f"sqlite:///{tmp_path_factory.mktemp('ratelimit') / 'ratelimit.db'}"
+    limiter.init_app(app)
+    # Keep the statistics dumps of test runs out of the instance folder
+    sqlite.stats_folder = tmp_path_factory.mktemp("db-stats")
     yield app
 
 
@@ -212,6 +221,23 @@ def test_login(client: FlaskClient, user: dict):
         else:
             assert not current_user.is_authenticated, f"Login test failed for user: {user['description']}."
 
+def test_login_rehashes_changed_work_factor(client: FlaskClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(hasher, "rounds", 5)
+    data = {"login-username": users[0]["username"], "login-password": users[0]["password"], "login-submit": "Sign In"}
+    response = client.post("/", data=data)
+    assert response.status_code == 302
+    with app.app_context():
+        assert sqlite.query_username(users[0]["username"])["password"].startswith(b"$2b$05$")
+
+def test_login_busy_hasher(client: FlaskClient, monkeypatch: pytest.MonkeyPatch):
+    def busy(*args):
+        raise HasherBusyError("All password workers are busy")
+    monkeypatch.setattr(hasher, "check_password", busy)
+    data = {"login-username": users[0]["username"], "login-password": users[0]["password"], "login-submit": "Sign In"}
+    response = client.post("/", data=data)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
 ######################## TEST ROUTES GET REQUEST WHILE LOGGED IN ########################
 def test_get_index_logged_in(logged_in_client: FlaskClient):
     with logged_in_client:
@@ -231,11 +257,33 @@ def test_get_stream_logged_in(logged_in_client: FlaskClient):
         response = logged_in_client.get("/stream/test")
         assert response.status_code == 200
 
+def test_get_stream_older_page_logged_in(logged_in_client: FlaskClient):
+    with logged_in_client:
+        response = logged_in_client.get("/stream/test?before=2000-01-01 00:00:00_1")
+        assert response.status_code == 200
+        # Finish the streamed page before the next request in the same client context
+        response.close()
+        # A malformed cursor falls back to the first page
+        response = logged_in_client.get("/stream/test?before=garbage")
+        assert response.status_code == 200
+
+def test_user_loader_is_cached(logged_in_client: FlaskClient):
+    with logged_in_client:
+        logged_in_client.get("/stream/test")
+        hits = user_cache.stats()["hits"]
+        logged_in_client.get("/stream/test")
+        assert user_cache.stats()["hits"] == hits + 1
+
 def test_get_friends_logged_in(logged_in_client: FlaskClient):
     with logged_in_client:
         response = logged_in_client.get("/friends/test")
         assert response.status_code == 200
 
+def test_get_upload_missing_logged_in(logged_in_client: FlaskClient):
+    with logged_in_client:
+        response = logged_in_client.get("/uploads/ab/cd/missing.png")
+        assert response.status_code == 404
+
 def test_get_profile_logged_in(logged_in_client: FlaskClient):
     with logged_in_client:
         response = logged_in_client.get("/profile/test")
@@ -260,11 +308,13 @@ def test_post_stream_valid(logged_in_client: FlaskClient):
         }
         response = logged_in_client.post("/stream/test", data=data, content_type='multipart/form-data')
         assert response.status_code == 201
-        # Assert that the image was uploaded 
-        response = logged_in_client.get(f"/uploads/{data['image'][1]}")
-        assert response.status_code == 200
         # Assert that the post is in the database
         assert sqlite.check_post_exists(1) is True
+        # Assert that the image was uploaded under a name derived from its content
+        image = sqlite.query_post(1)["image"]
+        assert image.endswith(".png") and image != data['image'][1]
+        response = logged_in_client.get(f"/uploads/{image}")
+        assert response.status_code == 200
 
 def test_post_stream_invalid_filename(logged_in_client: FlaskClient):
     with app.app_context():
@@ -507,4 +557,105 @@ def test_get_logout(client: FlaskClient):
     response = client.get("/logout")
     assert response.status_code == 302
     # Assert that the user is redirected to the login page
-    assert response.location == "/" or response.location == "/index"
\ No newline at end of file
+    assert response.location == "/" or response.location == "/index"
+###################### STREAMED PAGES ######################
+def test_stream_is_streamed_with_flashes(logged_in_client: FlaskClient):
+    response = logged_in_client.post("/stream/test", data={"content": "Streamed", "submit": "Post"})
+    assert response.status_code == 201
+    assert response.is_streamed
+    assert b"Post successfully created!" in response.data
+    assert b"Streamed" in response.data
+    # The flashed message is shown once
+    response = logged_in_client.get("/stream/test")
+    assert b"Post successfully created!" not in response.data
+
+def test_comments_are_streamed(logged_in_client: FlaskClient):
+    response = logged_in_client.post("/comments/test/1", data={"comment": "Streamed comment", "submit": "Comment"})
+    assert response.status_code == 201
+    assert response.is_streamed
+    assert b"Streamed comment" in response.data
+
+def test_post_cards_are_cached(logged_in_client: FlaskClient):
+    assert b"Comments (" in logged_in_client.get("/stream/test").data
+    hits = fragment_cache.stats()["hits"]
+    assert b"Comments (" in logged_in_client.get("/stream/test").data
+    assert fragment_cache.stats()["hits"] > hits
+
+def test_unchanged_pages_are_not_modified(logged_in_client: FlaskClient):
+    # Pages showing flashed messages get no ETag
+    response = logged_in_client.get("/stream/test")
+    assert "ETag" not in response.headers
+    response.close()
+    for url in ("/stream/test", "/comments/test/1", "/friends/test", "/profile/test"):
+        response = logged_in_client.get(url)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        response.close()
+        response = logged_in_client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.data == b""
+
+def test_first_visit_is_revalidated_with_a_weak_etag(logged_in_client: FlaskClient):
+    logged_in_client.get("/stream/test").close()
+    with logged_in_client.session_transaction() as session:
+        session.pop("csrf_token", None)
+    response = logged_in_client.get("/profile/test")
+    etag = response.headers["ETag"]
+    assert etag.startswith("W/")
+    response = logged_in_client.get("/profile/test", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+def test_writes_change_the_etags(logged_in_client: FlaskClient):
+    logged_in_client.get("/stream/test").close()
+    stream_etag = logged_in_client.get("/stream/test").headers["ETag"]
+    comments_etag = logged_in_client.get("/comments/test/1").headers["ETag"]
+    logged_in_client.post("/comments/test/1", data={"comment": "Changes the ETags", "submit": "Comment"}).close()
+    response = logged_in_client.get("/comments/test/1", headers={"If-None-Match": comments_etag})
+    assert response.status_code == 200
+    assert b"Changes the ETags" in response.data
+    response.close()
+    logged_in_client.post("/stream/test", data={"content": "Changes the stream", "submit": "Post"}).close()
+    response = logged_in_client.get("/stream/test", headers={"If-None-Match": stream_etag})
+    assert response.status_code == 200
+    assert b"Changes the stream" in response.data
+
+def test_etag_depends_on_the_viewer(logged_in_client: FlaskClient):
+    logged_in_client.get("/stream/test").close()
+    etag = logged_in_client.get("/profile/test").headers["ETag"]
+    logged_in_client.get("/logout")
+    with logged_in_client:
+        logged_in_client.post(
+            "/",
+            data={
+                "login-username": users[1]["username"],
+                "login-password": users[1]["password"],
+                "login-submit": "Sign In",
+            },
+        )
+    logged_in_client.get("/stream/test2").close()
+    assert logged_in_client.get("/profile/test", headers={"If-None-Match": etag}).status_code == 200
+
+def test_readiness(client: FlaskClient):
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json["status"] == "ready"
+    assert response.json["checks"]["database"] == "ok"
+    assert response.headers["Cache-Control"] == "no-store"
+
+def test_readiness_fails_with_pending_migrations(client: FlaskClient, monkeypatch):
+    monkeypatch.setattr(sqlite, "_pending_migrations", lambda version: [(version + 1, None)])
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json["checks"]["database"] == "unavailable"
+
+def test_streamed_page_sends_the_navbar_first(logged_in_client: FlaskClient):
+    response = logged_in_client.get("/stream/test")
+    chunks = iter(response.response)
+    first = next(chunks)
+    first = first.encode() if isinstance(first, str) else first
+    assert b"navbar" in first
+    assert b"<main>" not in first
+    assert b"\x00" not in first
+    assert b"<main>" in b"".join(chunk.encode() if isinstance(chunk, str) else chunk for chunk in chunks)
+    response.close()
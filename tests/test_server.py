@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from flask import Flask
+
+from app.server import server_options
+
+
+def test_server_options_read_the_config_and_overrides():
+    app = Flask(__name__)
+    app.config.update({"SERVER_BIND": "0.0.0.0:9000", "SERVER_WORKERS": 3, "SERVER_THREADS": 2, "SERVER_MAX_REQUESTS": 0})
+    options = server_options(app, workers=5, threads=None)
+    assert options["bind"] == "0.0.0.0:9000"
+    assert options["workers"] == 5
+    assert options["threads"] == 2
+    assert options["max_requests"] == 0
+    assert "timeout" not in options
+    assert options["preload_app"] is True
+    assert options["worker_class"] == "gthread"
+    assert callable(options["pre_fork"])
+
+
+def test_entry_point_falls_back_to_the_development_server_without_gunicorn(monkeypatch):
+    import runpy
+
+    import app.server
+    from app import app as flask_app
+
+    started = []
+    monkeypatch.setattr(app.server, "BaseApplication", None)
+    monkeypatch.setattr(type(flask_app), "run", lambda self, *args, **kwargs: started.append(self))
+    runpy.run_path(str(Path(__file__).parents[1] / "socialinsecurity.py"), run_name="__main__")
+    assert started == [flask_app]
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import hashlib
+from io import BytesIO
+
+import pytest
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+from app.uploads import UploadStore, UploadTooLargeError
+
+
+@pytest.fixture()
+def store(tmp_path) -> UploadStore:
+    store_app = Flask("app", instance_path=str(tmp_path))
+    store_app.config.update({"UPLOAD_MAX_SIZE": 1000, "UPLOAD_CHUNK_SIZE": 100})
+    return UploadStore(store_app)
+
+
+def upload(content: bytes, filename: str = "image.PNG") -> FileStorage:
+    return FileStorage(BytesIO(content), filename=filename)
+
+
+def test_store_uses_sharded_content_hash_names(store: UploadStore):
+    digest = hashlib.sha256(b"image").hexdigest()
+    name = store.save(upload(b"image"))
+    assert name == f"{digest[:2]}/{digest[2:4]}/{digest}.png"
+    assert store.path(name).read_bytes() == b"image"
+
+
+def test_store_deduplicates_identical_uploads(store: UploadStore):
+    first = store.save(upload(b"image", "first.png"))
+    second = store.save(upload(b"image", "second.png"))
+    assert first == second
+    assert store.save(upload(b"other image")) != first
+    assert len([path for path in store.root.rglob("*") if path.is_file()]) == 2
+
+
+def test_store_rejects_too_large_uploads(store: UploadStore):
+    with pytest.raises(UploadTooLargeError):
+        store.save(upload(b"x" * 1001))
+    assert [path for path in store.root.rglob("*") if path.is_file()] == []
+
+
+def test_store_path_rejects_unknown_and_unsafe_names(store: UploadStore):
+    assert store.path("ab/cd/missing.png") is None
+    assert store.path("../secret.txt") is None
+
+
+def test_store_sends_content_addressed_files_as_immutable(store: UploadStore):
+    name = store.save(upload(b"0123456789"))
+    etag = name.split("/")[-1].split(".")[0]
+    with Flask("app").test_request_context():
+        response = store.send(name)
+        assert response.get_etag() == (etag, False)
+        assert response.headers["Cache-Control"] == f"private, max-age={store.max_age}, immutable"
+    with Flask("app").test_request_context(headers={"If-None-Match": f'"{etag}"'}):
+        assert store.send(name).status_code == 304
+    with Flask("app").test_request_context(headers={"Range": "bytes=2-4"}):
+        response = store.send(name)
+        response.direct_passthrough = False
+        assert response.status_code == 206
+        assert response.get_data() == b"234"
+
+
+def test_store_requires_revalidation_of_other_files(store: UploadStore):
+    store.root.mkdir(parents=True)
+    (store.root / "old.png").write_bytes(b"image")
+    with Flask("app").test_request_context():
+        assert store.send("old.png").headers["Cache-Control"] == "private, no-cache"
+
+
+def test_store_hands_files_to_the_front_proxy(tmp_path):
+    store_app = Flask("app", instance_path=str(tmp_path))
+    store_app.config["UPLOADS_SENDFILE"] = "x-accel-redirect"
+    store = UploadStore(store_app)
+    name = store.save(upload(b"image"))
+    with store_app.test_request_context():
+        response = store.send(name)
+        assert response.headers["X-Accel-Redirect"] == f"/internal-uploads/{name}"
+        assert response.mimetype == "image/png"
+        assert response.get_data() == b""